@@ -1,4 +1,4 @@
-from agent.main import main
+from agent.cli import main
 
 if __name__ == "__main__":
     main()
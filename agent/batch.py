@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from agent.config import AgentConfig
+from agent.context.retrieval import ChunkIndex, open_chunk_index
+from agent.knowledge_artifact import load_knowledge
+from agent.knowledge_base import KnowledgeBase
+from agent.metrics import MetricsLog, open_metrics_log
+from agent.main import StreamingFileWriter, prepare_migration, run_agent_cached, write_outputs
+from agent.related_files import FileClassCache
+from agent.response_cache import ResponseCache, open_response_cache
+from agent.transport import TRANSPORT_MODES, open_transport
+
+
+@dataclass
+class BatchTarget:
+    target: Path
+    task: str
+    mode: str = "propose"
+    base: Optional[str] = None
+    reference_groups: List[str] = field(default_factory=list)
+
+
+@dataclass
+class BatchResult:
+    target: str
+    status: str
+    error: Optional[str] = None
+    base: Optional[str] = None
+    references: List[str] = field(default_factory=list)
+    written: List[str] = field(default_factory=list)
+    prepare_s: float = 0.0
+    agent_s: float = 0.0
+    total_s: float = 0.0
+
+
+def load_manifest(path: Path, default_task: Optional[str], default_mode: str) -> List[BatchTarget]:
+    """Read a JSON manifest of targets.
+
+    The manifest is either a list or ``{"targets": [...]}``. Each entry is a
+    Dockerfile path or an object with ``target`` and optional ``task``,
+    ``mode``, ``base`` and ``reference_groups``. Relative paths resolve
+    against the manifest directory.
+    """
+    data = json.loads(path.read_text(encoding="utf-8"))
+    entries = (data.get("targets") or []) if isinstance(data, dict) else data
+    targets: List[BatchTarget] = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"target": entry}
+        target = Path(str(entry["target"])).expanduser()
+        if not target.is_absolute():
+            target = path.parent / target
+        task = entry.get("task") or default_task
+        if not task:
+            raise SystemExit(f"Manifest entry {target} has no task and --task was not given.")
+        targets.append(
+            BatchTarget(
+                target=target,
+                task=str(task),
+                mode=str(entry.get("mode") or default_mode),
+                base=entry.get("base"),
+                reference_groups=[str(item) for item in entry.get("reference_groups") or []],
+            )
+        )
+    return targets
+
+
+def expand_globs(patterns: List[str], task: str, mode: str, base: Optional[str]) -> List[BatchTarget]:
+    targets: List[BatchTarget] = []
+    seen: set[Path] = set()
+    for pattern in patterns:
+        for match in sorted(glob.glob(os.path.expanduser(pattern), recursive=True)):
+            path = Path(match)
+            resolved = path.resolve()
+            if not path.is_file() or resolved in seen:
+                continue
+            seen.add(resolved)
+            targets.append(BatchTarget(target=path, task=task, mode=mode, base=base))
+    return targets
+
+
+def dedupe_targets(targets: List[BatchTarget]) -> List[BatchTarget]:
+    """Drop targets resolving to a Dockerfile already listed; the first entry wins."""
+    unique: List[BatchTarget] = []
+    seen: set[Path] = set()
+    for item in targets:
+        resolved = item.target.resolve()
+        if resolved in seen:
+            print(f"[batch] skipping duplicate target {item.target.as_posix()}")
+            continue
+        seen.add(resolved)
+        unique.append(item)
+    return unique
+
+
+def write_summary(path: Path, started_at: str, results: List[BatchResult], wall_s: float) -> None:
+    ok = sum(1 for item in results if item.status == "ok")
+    payload = {
+        "started_at": started_at,
+        "wall_s": round(wall_s, 3),
+        "total": len(results),
+        "ok": ok,
+        "failed": len(results) - ok,
+        "results": [asdict(item) for item in results],
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+
+
+async def _run_target(
+    item: BatchTarget,
+    config: AgentConfig,
+    knowledge_base: KnowledgeBase,
+    args: argparse.Namespace,
+    semaphore: asyncio.Semaphore,
+    prepare_lock: asyncio.Lock,
+    cache: Optional[ResponseCache],
+    class_cache: FileClassCache,
+    chunk_index: Optional[ChunkIndex],
+    transport=None,
+    metrics_log: Optional[MetricsLog] = None,
+) -> BatchResult:
+    label = item.target.as_posix()
+
+    def log(line: str) -> None:
+        text = line.strip()
+        if text:
+            print(f"[{label}] {text}", flush=True)
+
+    result = BatchResult(target=label, status="failed")
+    async with semaphore:
+        started = time.monotonic()
+        try:
+            # Off the event loop, so other targets keep streaming; one at a time, since
+            # the file-class cache and chunk index are shared by every target.
+            async with prepare_lock:
+                plan = await asyncio.to_thread(
+                    prepare_migration,
+                    config=config,
+                    knowledge_base=knowledge_base,
+                    target_path=item.target,
+                    task=item.task,
+                    mode=item.mode,
+                    base=item.base,
+                    reference_groups=item.reference_groups + args.reference_group,
+                    include_related=not args.no_related,
+                    log=log,
+                    class_cache=class_cache,
+                    chunk_index=chunk_index,
+                )
+            result.base = plan.base
+            result.references = [bundle.id for bundle in plan.selection.selected]
+            result.prepare_s = time.monotonic() - started
+
+            streamer = StreamingFileWriter(plan.target_path, backup=args.backup, log=log) if args.write else None
+            agent_started = time.monotonic()
+            response = await run_agent_cached(
+                plan.user_prompt,
+                plan,
+                cache if item.mode == "propose" else None,
+                args.refresh,
+                debug=False,
+                ui_enabled=True,
+                spinner_enabled=False,
+                log=log,
+                on_text=streamer.feed if streamer else None,
+                transport=transport,
+                metrics_log=metrics_log,
+            )
+            result.agent_s = time.monotonic() - agent_started
+
+            written = write_outputs(
+                response,
+                plan.target_path,
+                write=args.write,
+                backup=args.backup,
+                log=log,
+                streamed=streamer.finish() if streamer else None,
+            )
+            result.written = [path.as_posix() for path in written]
+            result.status = "ok"
+        except SystemExit as exc:
+            result.error = str(exc)
+        except Exception as exc:
+            result.error = f"{exc.__class__.__name__}: {exc}"
+        result.total_s = time.monotonic() - started
+
+    if result.status == "ok":
+        log(f"[done] ok in {result.total_s:.1f}s")
+    else:
+        log(f"[done] failed: {result.error}")
+    return result
+
+
+async def run_batch(
+    targets: List[BatchTarget],
+    config: AgentConfig,
+    knowledge_base: KnowledgeBase,
+    args: argparse.Namespace,
+    transport=None,
+) -> List[BatchResult]:
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+    prepare_lock = asyncio.Lock()
+    started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    started = time.monotonic()
+    results: List[BatchResult] = []
+    live = transport is None or transport.name == "live"
+    cache = None if args.no_cache or not live else open_response_cache(config)
+    class_cache = FileClassCache(config.resolve(config.file_class_cache_path))
+    chunk_index = open_chunk_index(config) if config.reference_retrieval == "bm25" else None
+    metrics_log = open_metrics_log(config)
+
+    tasks = [
+        asyncio.create_task(
+            _run_target(
+                item,
+                config,
+                knowledge_base,
+                args,
+                semaphore,
+                prepare_lock,
+                cache,
+                class_cache,
+                chunk_index,
+                transport,
+                metrics_log,
+            )
+        )
+        for item in targets
+    ]
+    for finished in asyncio.as_completed(tasks):
+        results.append(await finished)
+        # Rewrite after every target so an interrupted run keeps partial results.
+        write_summary(Path(args.summary), started_at, results, time.monotonic() - started)
+
+    order = {item.target.as_posix(): index for index, item in enumerate(targets)}
+    results.sort(key=lambda item: order.get(item.target, 0))
+    write_summary(Path(args.summary), started_at, results, time.monotonic() - started)
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Migrate many Dockerfiles concurrently")
+    parser.add_argument(
+        "--manifest",
+        help="JSON manifest listing targets (paths or {target, task, mode, base, reference_groups})",
+    )
+    parser.add_argument(
+        "--glob",
+        action="append",
+        default=[],
+        help="Glob of target Dockerfiles (repeatable, ** supported)",
+    )
+    parser.add_argument("--task", help="Default migration task for every target")
+    parser.add_argument(
+        "--mode",
+        choices=["propose", "apply"],
+        default="propose",
+        help="Default mode for every target",
+    )
+    parser.add_argument(
+        "--base",
+        choices=["alpine", "debian"],
+        help="Override base selection for --glob targets",
+    )
+    parser.add_argument(
+        "--reference-group",
+        action="append",
+        default=[],
+        help="Force-include a knowledge bundle ID for every target",
+    )
+    parser.add_argument(
+        "--knowledge-index",
+        help="Override knowledge index path (default: KNOWLEDGE_INDEX_PATH or knowledge/index.json)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.getenv("BATCH_CONCURRENCY", "4")),
+        help="Maximum number of targets migrated at once",
+    )
+    parser.add_argument(
+        "--summary",
+        default="batch-summary.json",
+        help="Path of the JSON summary with per-target results and timings",
+    )
+    parser.add_argument("--write", action="store_true", help="Write extracted files to .migrated paths")
+    parser.add_argument("--backup", action="store_true", help="Create .backup files before writing")
+    parser.add_argument("--no-related", action="store_true", help="Disable related file discovery")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the on-disk response cache")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached responses but store fresh ones")
+    parser.add_argument(
+        "--transport",
+        choices=TRANSPORT_MODES,
+        help="live, record (save each message stream) or replay (offline; default: AGENT_TRANSPORT or live)",
+    )
+    parser.add_argument(
+        "--recordings",
+        help="Recordings directory, or one .jsonl recording replayed for every target",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        help="Replay pacing multiplier; 0 emits messages without delay (default: REPLAY_SPEED or 1.0)",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    load_dotenv()
+    args = parse_args()
+
+    if not args.manifest and not args.glob:
+        raise SystemExit("Pass --manifest and/or --glob.")
+
+    targets: List[BatchTarget] = []
+    if args.manifest:
+        targets.extend(load_manifest(Path(args.manifest), args.task, args.mode))
+    if args.glob:
+        if not args.task:
+            raise SystemExit("--glob requires --task.")
+        targets.extend(expand_globs(args.glob, args.task, args.mode, args.base))
+    targets = dedupe_targets(targets)
+    if not targets:
+        raise SystemExit("No target Dockerfiles matched.")
+
+    config = AgentConfig()
+    transport = open_transport(
+        config,
+        args.transport,
+        Path(args.recordings) if args.recordings else None,
+        args.replay_speed,
+    )
+    if transport.name != "replay" and not os.getenv("ANTHROPIC_API_KEY"):
+        raise SystemExit("ANTHROPIC_API_KEY is not set. Add it to .env or your shell environment.")
+
+    knowledge_index_path = Path(args.knowledge_index) if args.knowledge_index else config.knowledge_index_path
+    knowledge_base = load_knowledge(config, knowledge_index_path)
+
+    print(f"[batch] {len(targets)} target(s), concurrency {max(1, args.concurrency)}, transport {transport.name}")
+    results = asyncio.run(run_batch(targets, config, knowledge_base, args, transport))
+    failed = [item for item in results if item.status != "ok"]
+    print(f"[batch] ok={len(results) - len(failed)} failed={len(failed)} summary={args.summary}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
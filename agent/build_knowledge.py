@@ -0,0 +1,59 @@
+import argparse
+import time
+from pathlib import Path
+
+from agent.config import AgentConfig
+from agent.knowledge_artifact import artifact_stale_reason, compile_knowledge, read_artifact, write_artifact
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compile the knowledge base into a single artifact")
+    parser.add_argument(
+        "--knowledge-index",
+        help="Override knowledge index path (default: KNOWLEDGE_INDEX_PATH or knowledge/index.json)",
+    )
+    parser.add_argument(
+        "--output",
+        help="Artifact path (default: KNOWLEDGE_ARTIFACT_PATH or .cache/knowledge.json)",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Only report whether the existing artifact is fresh; exit 1 if it is stale",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    config = AgentConfig()
+    output = Path(args.output) if args.output else config.resolve(config.knowledge_artifact_path)
+    index_path = config.resolve(Path(args.knowledge_index)) if args.knowledge_index else config.knowledge_index_path
+
+    if args.check:
+        # The same check load_knowledge uses before trusting the artifact.
+        reason = artifact_stale_reason(config, read_artifact(output, config.repo_root), index_path)
+        if reason:
+            print(f"Knowledge artifact is stale: {reason}")
+            return 1
+        print(f"Knowledge artifact is fresh: {output}")
+        return 0
+
+    started = time.monotonic()
+    compiled = compile_knowledge(config, index_path)
+    write_artifact(compiled, output)
+    elapsed = time.monotonic() - started
+
+    texts = [entry for entry in compiled.files.values() if entry.content is not None]
+    original = sum(entry.original_chars for entry in texts)
+    compacted = sum(len(entry.content or "") for entry in texts)
+    print(f"Knowledge artifact: {output}")
+    print(f"Bundles: {len(compiled.bundles)}")
+    print(f"Patterns: {len(compiled.globs)}  files: {len(compiled.files)}  directories: {len(compiled.directories)}")
+    print(f"Reference text: {original} -> {compacted} chars (~{compiled.total_tokens} tokens)")
+    print(f"Built in {elapsed * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
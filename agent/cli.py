@@ -0,0 +1,184 @@
+"""Command-line entry point for ``python -m agent`` / ``bin/agent``.
+
+Kept free of heavy imports: argument parsing and metadata commands such as
+``--list-reference-groups`` answer without loading the migration pipeline,
+the Agent SDK or asyncio. Everything else is handed to ``agent.main``.
+"""
+import argparse
+from typing import List, Optional
+
+from agent.transport import TRANSPORT_MODES
+
+
+def parse_args(argv: Optional[List[str]] = None, prog: Optional[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog=prog, description="Dockerfile migration agent")
+    parser.add_argument("--target", help="Path to Dockerfile to migrate")
+    parser.add_argument("--task", help="Migration task description")
+    parser.add_argument(
+        "--mode",
+        choices=["propose", "apply"],
+        default="propose",
+        help="propose: read-only; apply: allow edits",
+    )
+    parser.add_argument(
+        "--output",
+        help="Write extracted Dockerfile to this path",
+    )
+    parser.add_argument(
+        "--write",
+        action="store_true",
+        help="Write extracted files to default .migrated paths",
+    )
+    parser.add_argument(
+        "--backup",
+        action="store_true",
+        help="Create a .backup file next to the target before writing output",
+    )
+    parser.add_argument(
+        "--reference-glob",
+        action="append",
+        default=[],
+        help="Additional glob(s) to include in reference bundle",
+    )
+    parser.add_argument(
+        "--reference-group",
+        action="append",
+        default=[],
+        help="Force-include a knowledge bundle ID (use --list-reference-groups to see options)",
+    )
+    parser.add_argument(
+        "--knowledge-index",
+        help="Override knowledge index path (default: KNOWLEDGE_INDEX_PATH or knowledge/index.json)",
+    )
+    parser.add_argument(
+        "--list-reference-groups",
+        action="store_true",
+        help="List available reference group names and exit",
+    )
+    parser.add_argument(
+        "--base",
+        choices=["alpine", "debian"],
+        help="Override base selection when it cannot be inferred",
+    )
+    parser.add_argument(
+        "--no-related",
+        action="store_true",
+        help="Disable related file discovery",
+    )
+    parser.add_argument(
+        "--sync-newrelic",
+        action="store_true",
+        help="Copy latest New Relic tarball from references into the target repo when detected",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the on-disk response cache (no lookup, no store)",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore cached responses but store the fresh one",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=TRANSPORT_MODES,
+        help="live: call the API; record: call it and save the message stream; "
+        "replay: play a saved stream back offline (default: AGENT_TRANSPORT or live)",
+    )
+    parser.add_argument(
+        "--recordings",
+        help="Recordings directory, or one .jsonl recording to replay for every prompt "
+        "(default: RECORDINGS_PATH or .cache/recordings)",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        help="Replay pacing multiplier; 0 emits messages without delay (default: REPLAY_SPEED or 1.0)",
+    )
+    parser.add_argument(
+        "--print-system-prompt",
+        action="store_true",
+        help="Print system prompt and exit (debug)",
+    )
+    parser.add_argument(
+        "--prompt-segments",
+        action="store_true",
+        help="Print each system prompt segment's hash, size and cache breakpoint to stderr",
+    )
+    parser.add_argument(
+        "--debug",
+        action="store_true",
+        help="Print tool-call timing and event info to stderr",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="-",
+        metavar="PATH",
+        help="Write a per-stage timing tree as JSON to PATH (stderr when no path is given)",
+    )
+    parser.add_argument(
+        "--profile-cprofile",
+        metavar="PATH",
+        help="Also write cProfile stats for the local stages (knowledge, prepare, write) to PATH",
+    )
+    parser.add_argument(
+        "--interactive",
+        action="store_true",
+        help="Prompt for follow-up requests after the first response",
+    )
+    parser.add_argument(
+        "--followup-context-chars",
+        type=int,
+        default=6000,
+        help="How many chars of the last response to include in follow-ups",
+    )
+    parser.add_argument(
+        "--ui",
+        dest="ui",
+        action="store_true",
+        help="Enable styled output and spinner",
+    )
+    parser.add_argument(
+        "--no-ui",
+        dest="ui",
+        action="store_false",
+        help="Disable styled output and spinner",
+    )
+    parser.set_defaults(ui=None)
+    parser.add_argument(
+        "--no-spinner",
+        action="store_true",
+        help="Disable loading spinner",
+    )
+    parser.add_argument(
+        "--wizard",
+        action="store_true",
+        help="Interactive prompts for target/task/options",
+    )
+    return parser.parse_args(argv)
+
+
+def list_reference_groups(knowledge_index: Optional[str] = None) -> None:
+    """Print bundle IDs straight from the knowledge index and its manifests."""
+    from pathlib import Path
+
+    from agent.config import AgentConfig
+    from agent.knowledge_base import load_knowledge_base
+
+    config = AgentConfig()
+    index_path = Path(knowledge_index) if knowledge_index else config.knowledge_index_path
+    for bundle_id in load_knowledge_base(config.repo_root, index_path).bundle_ids:
+        print(bundle_id)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    if args.list_reference_groups and not args.wizard:
+        list_reference_groups(args.knowledge_index)
+        return
+
+    from agent.main import main as run_main
+
+    run_main(args)
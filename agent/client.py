@@ -0,0 +1,174 @@
+"""Thin client for a running ``python -m agent.serve`` daemon.
+
+``bin/agent`` execs this module when the daemon's socket exists. It imports
+only the standard library, forwards the command line over the Unix socket
+and streams the job's events back, so a CI hook pays one bare interpreter
+start and a socket round trip instead of loading the pipeline. Flags the
+daemon does not serve (help, wizard, debug, profiling, prompt inspection),
+an unreachable daemon, and a daemon whose configuration environment
+differs from the caller's fall back to the normal local run.
+"""
+import hashlib
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+PROTOCOL_VERSION = 2
+DEFAULT_SOCKET = ".cache/agent.sock"
+LOCAL_ONLY_FLAGS = (
+    "-h",
+    "--help",
+    "--wizard",
+    "--debug",
+    "--profile",
+    "--profile-cprofile",
+    "--print-system-prompt",
+    "--prompt-segments",
+    "--list-reference-groups",
+)
+# Variables that change what a job does: everything agent/config.py reads, plus
+# the API key and SDK/model settings.
+CONFIG_ENV = (
+    "KNOWLEDGE_INDEX_PATH",
+    "MAX_REFERENCE_CHARS_TOTAL",
+    "MAX_REFERENCE_CHARS_PER_FILE",
+    "REFERENCE_PACKING",
+    "REFERENCE_DEDUPE",
+    "REFERENCE_COMPACTION",
+    "REFERENCE_RETRIEVAL",
+    "KNOWLEDGE_ARTIFACT_PATH",
+    "KNOWLEDGE_SOURCES_DIR",
+    "RETRIEVAL_INDEX_PATH",
+    "RESPONSE_CACHE_DIR",
+    "RESPONSE_CACHE_MAX_BYTES",
+    "RESPONSE_CACHE_MAX_AGE_DAYS",
+    "FILE_CLASS_CACHE_PATH",
+    "AGENT_TRANSPORT",
+    "RECORDINGS_PATH",
+    "REPLAY_SPEED",
+    "METRICS_PATH",
+)
+CONFIG_ENV_PREFIXES = ("ANTHROPIC_", "CLAUDE_")
+
+
+def socket_path() -> Optional[Path]:
+    """``AGENT_SOCKET`` (relative to the repo root), or ``None`` when it is ``off``."""
+    value = os.getenv("AGENT_SOCKET", DEFAULT_SOCKET)
+    if value.strip().lower() in ("", "off"):
+        return None
+    path = Path(value).expanduser()
+    return path if path.is_absolute() else Path(__file__).resolve().parents[1] / path
+
+
+def env_digest(environ: Dict[str, Optional[str]]) -> Dict[str, str]:
+    """Hashes of the ``CONFIG_ENV`` values set in ``environ``; secrets never cross the socket."""
+    return {
+        key: hashlib.sha256(value.encode("utf-8")).hexdigest()[:16]
+        for key, value in environ.items()
+        if value is not None and (key in CONFIG_ENV or key.startswith(CONFIG_ENV_PREFIXES))
+    }
+
+
+def needs_local(argv: List[str]) -> bool:
+    return any(arg == flag or arg.startswith(flag + "=") for arg in argv for flag in LOCAL_ONLY_FLAGS)
+
+
+def connect(path: Path, timeout: Optional[float] = None) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(str(path))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def send(sock: socket.socket, message: Dict[str, Any]) -> None:
+    sock.sendall((json.dumps({"version": PROTOCOL_VERSION, **message}) + "\n").encode("utf-8"))
+
+
+def events(sock: socket.socket) -> Iterator[Dict[str, Any]]:
+    with sock.makefile("r", encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+
+def request(path: Path, op: str, timeout: float = 5.0) -> Dict[str, Any]:
+    """One-shot endpoint call (``health``, ``status``, ``stop``); returns the daemon's reply."""
+    sock = connect(path, timeout)
+    with sock:
+        send(sock, {"op": op})
+        for event in events(sock):
+            return event
+    raise OSError("daemon closed the connection without replying")
+
+
+def run_local(argv: List[str]) -> int:
+    from agent.cli import main as cli_main
+
+    cli_main(argv)
+    return 0
+
+
+def _ui_enabled(argv: List[str]) -> bool:
+    if "--no-ui" in argv:
+        return False
+    return "--ui" in argv or sys.stdout.isatty()
+
+
+def run_remote(sock: socket.socket, argv: List[str]) -> Optional[int]:
+    """Forward one run; ``None`` when the daemon asks for a local run instead."""
+    ui_enabled = _ui_enabled(argv)
+    send(sock, {"op": "run", "argv": argv, "cwd": os.getcwd(), "env": env_digest(dict(os.environ))})
+    for event in events(sock):
+        kind = event.get("event")
+        text = event.get("text", "")
+        if kind == "log":
+            print(text, flush=True)
+        elif kind == "text":
+            if not ui_enabled:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+        elif kind == "response":
+            if ui_enabled:
+                from agent.ui import render_response, supports_color
+
+                print(render_response(text, supports_color(sys.stdout)))
+        elif kind == "prompt":
+            try:
+                reply = input("> ")
+            except EOFError:
+                reply = ""
+            send(sock, {"op": "reply", "text": reply})
+        elif kind == "error":
+            print(text, file=sys.stderr)
+        elif kind == "local":
+            print(text, file=sys.stderr)
+            return None
+        elif kind == "exit":
+            return int(event.get("code", 1))
+    print("[client] daemon closed the connection before the job finished", file=sys.stderr)
+    return 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    path = socket_path()
+    if path is None or needs_local(argv):
+        return run_local(argv)
+    try:
+        sock = connect(path)
+    except OSError:
+        return run_local(argv)
+    with sock:
+        code = run_remote(sock, argv)
+    return run_local(argv) if code is None else code
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
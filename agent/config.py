@@ -15,7 +15,41 @@ class AgentConfig:
     max_reference_chars_per_file: int = int(
         os.getenv("MAX_REFERENCE_CHARS_PER_FILE", "12000")
     )
+    reference_packing: str = os.getenv("REFERENCE_PACKING", "priority")
+    reference_dedupe: str = os.getenv("REFERENCE_DEDUPE", "exact")
+    reference_compaction: str = os.getenv("REFERENCE_COMPACTION", "strip")
+    reference_retrieval: str = os.getenv("REFERENCE_RETRIEVAL", "bm25")
+    knowledge_artifact_path: Path = Path(
+        os.getenv("KNOWLEDGE_ARTIFACT_PATH", ".cache/knowledge.json")
+    )
+    knowledge_sources_dir: Path = Path(
+        os.getenv("KNOWLEDGE_SOURCES_DIR", "knowledge/sources")
+    )
+    retrieval_index_path: Path = Path(
+        os.getenv("RETRIEVAL_INDEX_PATH", ".cache/knowledge-chunks.json")
+    )
+    response_cache_dir: Path = Path(
+        os.getenv("RESPONSE_CACHE_DIR", ".cache/responses")
+    )
+    response_cache_max_bytes: int = int(
+        os.getenv("RESPONSE_CACHE_MAX_BYTES", str(50 * 1024 * 1024))
+    )
+    response_cache_max_age_days: float = float(
+        os.getenv("RESPONSE_CACHE_MAX_AGE_DAYS", "14")
+    )
+    file_class_cache_path: Path = Path(
+        os.getenv("FILE_CLASS_CACHE_PATH", ".cache/file-classes.json")
+    )
+    agent_transport: str = os.getenv("AGENT_TRANSPORT", "live")
+    recordings_path: Path = Path(
+        os.getenv("RECORDINGS_PATH", ".cache/recordings")
+    )
+    replay_speed: float = float(os.getenv("REPLAY_SPEED", "1.0"))
+    metrics_path: str = os.getenv("METRICS_PATH", ".cache/llm-metrics.jsonl")
 
     @property
     def repo_name(self) -> str:
         return self.repo_root.name
+
+    def resolve(self, path: Path) -> Path:
+        return path if path.is_absolute() else self.repo_root / path
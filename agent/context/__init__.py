@@ -1,3 +1,3 @@
-from agent.context.reference_loader import ReferenceBundle, ReferenceEntry, ReferenceLoader
+from agent.context.reference_loader import DroppedReference, ReferenceBundle, ReferenceEntry, ReferenceLoader
 
-__all__ = ["ReferenceBundle", "ReferenceEntry", "ReferenceLoader"]
+__all__ = ["DroppedReference", "ReferenceBundle", "ReferenceEntry", "ReferenceLoader"]
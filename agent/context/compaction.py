@@ -0,0 +1,120 @@
+import re
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+_HEREDOC = re.compile(r"<<-?\s*[\"']?([A-Za-z_][A-Za-z0-9_]*)[\"']?")
+_DOCKER_DIRECTIVE = re.compile(r"^#\s*[a-zA-Z]+\s*=")
+_YAML_BLOCK_SCALAR = re.compile(r"[|>][0-9+-]*\s*(?:#.*)?$")
+
+
+def code_fence_lang(path: Path) -> str:
+    name = path.name
+    suffix = path.suffix.lower()
+
+    if name == "Dockerfile" or suffix == ".dockerfile":
+        return "dockerfile"
+    if suffix in {".sh"}:
+        return "bash"
+    if suffix in {".yml", ".yaml"}:
+        return "yaml"
+    if suffix in {".md"}:
+        return "markdown"
+    if suffix in {".ini", ".conf", ".cf", ".template"}:
+        return "ini"
+    return "text"
+
+
+def _collapse_blank_runs(lines: List[str]) -> str:
+    out: List[str] = []
+    for line in lines:
+        if not line and (not out or not out[-1]):
+            continue
+        out.append(line)
+    while out and not out[-1]:
+        out.pop()
+    return "\n".join(out) + "\n" if out else ""
+
+
+def _compact_ini(text: str) -> str:
+    lines: List[str] = []
+    for raw in text.splitlines():
+        line = raw.rstrip()
+        stripped = line.lstrip()
+        if stripped.startswith((";", "#")):
+            continue
+        lines.append(line)
+    return _collapse_blank_runs(lines)
+
+
+def _compact_shell(text: str, directives: bool = False) -> str:
+    """Shared by shell scripts and Dockerfiles: heredoc bodies are copied verbatim."""
+    lines: List[str] = []
+    terminators: List[str] = []
+    continued = False
+    leading = True
+    for raw in text.splitlines():
+        if terminators:
+            lines.append(raw)
+            if raw.lstrip("\t") == terminators[0]:
+                terminators.pop(0)
+            continue
+        line = raw.rstrip()
+        stripped = line.lstrip()
+        if stripped.startswith("#"):
+            keep = (leading and (stripped.startswith("#!") or (directives and _DOCKER_DIRECTIVE.match(stripped))))
+            # In a shell script a comment after a continuation still ends the command.
+            if keep or (continued and not directives):
+                lines.append(line)
+            continue
+        leading = leading and not stripped
+        lines.append(line)
+        continued = line.endswith("\\")
+        terminators.extend(_HEREDOC.findall(stripped))
+    return _collapse_blank_runs(lines)
+
+
+def _compact_dockerfile(text: str) -> str:
+    return _compact_shell(text, directives=True)
+
+
+def _compact_yaml(text: str) -> str:
+    lines: List[str] = []
+    block_indent: Optional[int] = None
+    for raw in text.splitlines():
+        line = raw.rstrip()
+        stripped = line.lstrip()
+        indent = len(line) - len(stripped)
+        if block_indent is not None:
+            if not stripped or indent > block_indent:
+                lines.append(line)
+                continue
+            block_indent = None
+        if stripped.startswith("#"):
+            continue
+        lines.append(line)
+        if _YAML_BLOCK_SCALAR.search(stripped):
+            block_indent = indent
+    return _collapse_blank_runs(lines)
+
+
+def _compact_text(text: str) -> str:
+    return _collapse_blank_runs([line.rstrip() for line in text.splitlines()])
+
+
+COMPACTORS: Dict[str, Callable[[str], str]] = {
+    "dockerfile": _compact_dockerfile,
+    "bash": _compact_shell,
+    "yaml": _compact_yaml,
+    "ini": _compact_ini,
+    "markdown": _compact_text,
+    "text": _compact_text,
+}
+
+
+def compact(path: Path, text: str) -> str:
+    """Drop comment-only lines, collapse blank runs and trailing whitespace.
+
+    Dispatches on ``code_fence_lang``. Directives, heredoc bodies, YAML block
+    scalars, shebangs and Dockerfile parser directives are kept as written.
+    """
+    return COMPACTORS[code_fence_lang(path)](text)
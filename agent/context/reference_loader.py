@@ -1,6 +1,41 @@
-from dataclasses import dataclass
+import difflib
+import hashlib
+import math
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable, List
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from agent.context.compaction import compact
+from agent.context.retrieval import ChunkIndex, tokenize
+from agent.globbing import expand_patterns
+
+if TYPE_CHECKING:
+    from agent.config import AgentConfig
+    from agent.knowledge_artifact import CompiledKnowledge
+    from agent.knowledge_base import KnowledgeBase, KnowledgeBundle
+
+PACKING_MODES = ("priority", "sorted")
+DEDUPE_MODES = ("off", "exact", "diff")
+
+# Relative usefulness of a reference by what the file is.
+ROLE_WEIGHTS = {
+    "dockerfile": 10.0,
+    "entrypoint": 6.0,
+    "supervisor": 6.0,
+    "script": 4.0,
+    "config": 3.0,
+    "document": 3.0,
+    "ini": 2.0,
+}
+PACKING_UNIT_CHARS = 100
+MIN_PARTIAL_CHARS = 1_000
+PARTIAL_ROLES = {"ini", "config", "document"}
+# Roles of which each bundle's best file is loaded before the knapsack runs.
+PINNED_ROLES = ("dockerfile", "entrypoint")
+# A near-duplicate is rendered as a diff only when the diff is at most this fraction of the file.
+MAX_DIFF_RATIO = 0.5
+# Share of the total budget kept for target-specific additions in the run segment.
+RUN_BUDGET_SHARE = 0.2
 
 
 @dataclass
@@ -8,6 +43,22 @@ class ReferenceEntry:
     path: Path
     content: str
     truncated: bool = False
+    group: Optional[str] = None
+    aliases: List[Path] = field(default_factory=list)
+    diff_base: Optional[Path] = None
+    original_chars: int = 0
+    # Chosen for this target; rendered in the run segment, after the shared prefix.
+    per_run: bool = False
+    note: Optional[str] = None
+
+
+@dataclass
+class DroppedReference:
+    path: Path
+    chars: int
+    reason: str
+    # What ``reason`` describes, for callers: unreadable, diff_base, partial or over_budget.
+    kind: str = "over_budget"
 
 
 @dataclass
@@ -15,53 +66,543 @@ class ReferenceBundle:
     entries: List[ReferenceEntry]
     total_chars: int
     skipped_files: int
+    dropped: List[DroppedReference] = field(default_factory=list)
+    deduped_chars: int = 0
+
+    def compaction_report(self) -> List[str]:
+        """One line per loaded file whose compaction saved anything."""
+        lines: List[str] = []
+        for entry in self.entries:
+            if entry.diff_base or not entry.original_chars or entry.original_chars <= len(entry.content):
+                continue
+            ratio = entry.original_chars / max(len(entry.content), 1)
+            lines.append(f"{entry.path.as_posix()}: {entry.original_chars} -> {len(entry.content)} chars ({ratio:.1f}x)")
+        return lines
+
+    @property
+    def original_chars(self) -> int:
+        return sum(entry.original_chars or len(entry.content) for entry in self.entries)
+
+
+@dataclass
+class _Candidate:
+    path: Path
+    rel_path: Path
+    content: str
+    truncated: bool
+    group: Optional[str]
+    role: str
+    score: float
+    raw: str = ""
+    original_chars: int = 0
+    aliases: List[Path] = field(default_factory=list)
+    diff_base: Optional[Path] = None
+
+
+def reference_role(path: Path) -> str:
+    name = path.name.lower()
+    suffix = path.suffix.lower()
+    if name == "dockerfile" or name.startswith("dockerfile.") or suffix == ".dockerfile":
+        return "dockerfile"
+    if "entrypoint" in name:
+        return "entrypoint"
+    if "supervisor" in name:
+        return "supervisor"
+    if suffix in {".sh", ".bash"}:
+        return "script"
+    if suffix == ".ini" or name.endswith(".ini.template"):
+        return "ini"
+    if suffix in {".md", ".txt", ".yml", ".yaml"}:
+        return "document"
+    return "config"
 
 
 class ReferenceLoader:
+    """Load reference files into the system prompt within a character budget.
+
+    In ``priority`` packing every candidate is scored by its group priority,
+    its role (Dockerfile > entrypoint/supervisor > scripts > configs > ini
+    templates), and the subset with the highest total score that fits the
+    budget is chosen (0/1 knapsack over 100-char units). Files in the
+    ``global`` group are always loaded first, then each bundle's best
+    Dockerfile and entrypoint, so a stack's main files never lose to many
+    small ones. Leftover budget is filled with the head of the best dropped
+    low-ranked file. ``sorted`` packing keeps the historical alphabetical,
+    first-fit behaviour.
+
+    Files with identical content are loaded once, listing the other paths as
+    aliases. With ``dedupe="diff"``, a file sharing its name with an earlier
+    reference is rendered as a unified diff against it when that is at most
+    half its size.
+
+    Files longer than ``max_chars_per_file`` are cut to their head unless a
+    ``retriever`` is given, in which case the sections that best match
+    ``bundle_query`` are kept instead. With ``compaction`` every file first
+    loses comment-only lines and blank runs (see ``agent.context.compaction``),
+    and all budgets apply to the compacted text.
+
+    Entries packed into the bundle segments depend only on the bundles and
+    settings, so runs sharing a bundle combination share the prompt prefix.
+    Target-driven additions are ``per_run`` entries: first the dropped files
+    sharing a name with a target file (``counterparts``), then sections
+    matching the target's ``query`` that the bundle excerpt left out. They
+    are packed into the ``RUN_BUDGET_SHARE`` of the budget held back for
+    them plus whatever the bundle entries left unused.
+    """
+
     def __init__(
         self,
         repo_root: Path,
         globs: Iterable[str],
         max_total_chars: int,
         max_chars_per_file: int,
+        groups: Optional[Sequence[Tuple[str, Sequence[str]]]] = None,
+        priorities: Optional[Dict[str, int]] = None,
+        counterparts: Iterable[str] = (),
+        packing: str = "priority",
+        dedupe: str = "exact",
+        retriever: Optional[ChunkIndex] = None,
+        query: Iterable[str] = (),
+        compaction: bool = True,
+        knowledge: Optional["CompiledKnowledge"] = None,
+        bundle_query: Iterable[str] = (),
     ) -> None:
+        if packing not in PACKING_MODES:
+            raise ValueError(f"Unknown reference packing mode: {packing}")
+        if dedupe not in DEDUPE_MODES:
+            raise ValueError(f"Unknown reference dedupe mode: {dedupe}")
         self.repo_root = repo_root
         self.globs = list(globs)
         self.max_total_chars = max_total_chars
         self.max_chars_per_file = max_chars_per_file
+        # Ordered (name, globs) pairs; a file belongs to the first group matching it.
+        self.groups = [(name, list(patterns)) for name, patterns in groups or []]
+        self.priorities = dict(priorities or {})
+        self.counterparts = {name.lower() for name in counterparts}
+        self.packing = packing
+        self.dedupe = dedupe
+        self.retriever = retriever
+        self.compaction = compaction
+        # Globs and compacted contents from the compiled artifact, when it matches our settings.
+        self.knowledge = knowledge if knowledge is not None and knowledge.compaction == compaction else None
+        self.query = sorted(query)
+        self.bundle_query = sorted(bundle_query)
+        self._group_by_path: Dict[Path, str] = {}
+        # Chunks of each retrieval-trimmed file already in its bundle excerpt.
+        self._bundle_chunks: Dict[Path, List[int]] = {}
+
+    def _expand(self) -> Dict[str, List[Path]]:
+        """Matches of every glob: from the compiled artifact, else one shared walk."""
+        patterns = list(self.globs) + [pattern for _, group_patterns in self.groups for pattern in group_patterns]
+        matches: Dict[str, List[Path]] = {}
+        missing: List[str] = []
+        for pattern in patterns:
+            compiled = self.knowledge.glob(pattern) if self.knowledge else None
+            if compiled is None:
+                missing.append(pattern)
+            else:
+                matches[pattern] = compiled
+        if missing:
+            matches.update(expand_patterns(self.repo_root, missing))
+        return matches
 
     def _collect_paths(self) -> List[Path]:
+        matches = self._expand()
         paths = set()
         for pattern in self.globs:
-            for path in self.repo_root.glob(pattern):
-                if path.is_file():
-                    paths.add(path.resolve())
+            paths.update(matches[pattern])
+        for name, patterns in self.groups:
+            for pattern in patterns:
+                for path in matches[pattern]:
+                    paths.add(path)
+                    self._group_by_path.setdefault(path, name)
         return sorted(paths)
 
-    def load(self) -> ReferenceBundle:
-        entries: List[ReferenceEntry] = []
-        total_chars = 0
-        skipped_files = 0
+    def _read(self, path: Path) -> Tuple[str, int]:
+        """Text to budget (compacted when enabled) and the original length."""
+        compiled = self.knowledge.content(path) if self.knowledge else None
+        if compiled is not None:
+            return compiled
+        original = path.read_text(encoding="utf-8")
+        return (compact(path, original) if self.compaction else original), len(original)
+
+    def _truncate(self, content: str, limit: int) -> Tuple[str, bool]:
+        if len(content) <= limit:
+            return content, False
+        return content[:limit] + "\n# ... truncated ...\n", True
+
+    def _fit(self, rel_path: Path, raw: str) -> Tuple[str, bool]:
+        if len(raw) <= self.max_chars_per_file:
+            return raw, False
+        if self.retriever is not None:
+            indices = self.retriever.rank(rel_path.as_posix(), raw, self.bundle_query, self.max_chars_per_file)
+            if indices is not None:
+                self._bundle_chunks[rel_path] = indices
+                return self.retriever.render(rel_path.as_posix(), raw, indices), True
+        return self._truncate(raw, self.max_chars_per_file)
 
+    def _score(self, group: Optional[str], role: str) -> float:
+        priority = self.priorities.get(group or "", 50)
+        return ROLE_WEIGHTS[role] * max(priority, 1) / 100
+
+    def _candidates(self, dropped: List[DroppedReference]) -> List[_Candidate]:
+        candidates: List[_Candidate] = []
         for path in self._collect_paths():
             rel_path = path.relative_to(self.repo_root)
             try:
-                content = path.read_text(encoding="utf-8")
+                raw, original_chars = self._read(path)
             except Exception:
-                skipped_files += 1
+                dropped.append(DroppedReference(path=rel_path, chars=0, reason="unreadable", kind="unreadable"))
+                continue
+            content, truncated = self._fit(rel_path, raw)
+            group = self._group_by_path.get(path)
+            role = reference_role(path)
+            candidates.append(
+                _Candidate(
+                    path=path,
+                    rel_path=rel_path,
+                    content=content,
+                    truncated=truncated,
+                    group=group,
+                    role=role,
+                    score=self._score(group, role),
+                    raw=raw,
+                    original_chars=original_chars,
+                )
+            )
+        return candidates
+
+    def _dedupe(self, candidates: List[_Candidate]) -> Tuple[List[_Candidate], int]:
+        """Fold identical files into their first copy and diff near-duplicates.
+
+        Returns the remaining candidates and the number of characters saved.
+        """
+        unique: List[_Candidate] = []
+        by_hash: Dict[str, _Candidate] = {}
+        by_name: Dict[str, _Candidate] = {}
+        saved = 0
+        for item in candidates:
+            digest = hashlib.sha256(item.raw.encode("utf-8")).hexdigest()
+            first = by_hash.get(digest)
+            if first is not None:
+                first.aliases.append(item.rel_path)
+                first.score = max(first.score, item.score)
+                saved += len(item.content)
                 continue
+            by_hash[digest] = item
+
+            name = item.path.name.lower()
+            base = by_name.get(name)
+            if self.dedupe == "diff" and base is not None:
+                diff = "\n".join(
+                    difflib.unified_diff(
+                        base.raw.splitlines(),
+                        item.raw.splitlines(),
+                        fromfile=base.rel_path.as_posix(),
+                        tofile=item.rel_path.as_posix(),
+                        n=1,
+                        lineterm="",
+                    )
+                )
+                if not diff:
+                    # Only line endings differ.
+                    base.aliases.append(item.rel_path)
+                    base.score = max(base.score, item.score)
+                    saved += len(item.content)
+                    continue
+                if len(diff) <= len(item.content) * MAX_DIFF_RATIO:
+                    content, truncated = self._truncate(diff, self.max_chars_per_file)
+                    saved += len(item.content) - len(content)
+                    item.content = content
+                    item.truncated = truncated
+                    item.diff_base = base.rel_path
+            by_name.setdefault(name, item)
+            unique.append(item)
+        return unique, saved
+
+    def load(self) -> ReferenceBundle:
+        dropped: List[DroppedReference] = []
+        candidates = self._candidates(dropped)
+        deduped_chars = 0
+        if self.dedupe != "off":
+            candidates, deduped_chars = self._dedupe(candidates)
+        budget = self.max_total_chars - int(self.max_total_chars * RUN_BUDGET_SHARE)
+        if self.packing == "sorted":
+            chosen, partial = self._pack_sorted(candidates, dropped, budget), None
+        else:
+            chosen, partial = self._pack_priority(candidates, dropped, budget)
 
-            truncated = False
-            if len(content) > self.max_chars_per_file:
-                content = content[: self.max_chars_per_file]
-                content += "\n# ... truncated ...\n"
-                truncated = True
+        # A diff is useless without its base, so drop diffs whose base did not fit.
+        kept = {item.rel_path for item in chosen} | ({partial.path} if partial else set())
+        for item in [item for item in chosen if item.diff_base and item.diff_base not in kept]:
+            chosen.remove(item)
+            dropped.append(
+                DroppedReference(
+                    path=item.rel_path,
+                    chars=len(item.content),
+                    reason=f"diff base {item.diff_base} not loaded",
+                    kind="diff_base",
+                )
+            )
 
-            if total_chars + len(content) > self.max_total_chars:
-                skipped_files += 1
+        entries = [
+            ReferenceEntry(
+                path=item.rel_path,
+                content=item.content,
+                truncated=item.truncated,
+                group=item.group,
+                aliases=item.aliases,
+                diff_base=item.diff_base,
+                original_chars=item.original_chars,
+            )
+            for item in sorted(chosen, key=lambda item: item.path)
+        ]
+        if partial is not None:
+            entries.append(partial)
+            entries.sort(key=lambda item: item.path)
+        budget = self.max_total_chars - sum(len(item.content) for item in entries)
+        counterparts = self._counterpart_extras(candidates, kept, dropped, budget)
+        entries.extend(counterparts)
+        budget -= sum(len(item.content) for item in counterparts)
+        entries.extend(self._run_extras(chosen, budget))
+        total_chars = sum(len(item.content) for item in entries)
+        skipped_files = sum(1 for item in dropped if item.kind != "partial")
+        return ReferenceBundle(
+            entries=entries,
+            total_chars=total_chars,
+            skipped_files=skipped_files,
+            dropped=dropped,
+            deduped_chars=deduped_chars,
+        )
+
+    def _counterpart_extras(
+        self,
+        candidates: List[_Candidate],
+        kept: Set[Path],
+        dropped: List[DroppedReference],
+        budget: int,
+    ) -> List[ReferenceEntry]:
+        """Dropped files named like a target file, best first, as far as ``budget`` allows."""
+        extras: List[ReferenceEntry] = []
+        leftovers = [
+            item
+            for item in candidates
+            if item.rel_path not in kept and item.diff_base is None and item.path.name.lower() in self.counterparts
+        ]
+        for item in sorted(leftovers, key=lambda item: (-item.score, item.path)):
+            if len(item.content) > budget:
+                continue
+            extras.append(
+                ReferenceEntry(
+                    path=item.rel_path,
+                    content=item.content,
+                    truncated=item.truncated,
+                    group=item.group,
+                    aliases=item.aliases,
+                    original_chars=item.original_chars,
+                    per_run=True,
+                    note="matches a target file",
+                )
+            )
+            budget -= len(item.content)
+        loaded = {item.path for item in extras}
+        dropped[:] = [item for item in dropped if item.path not in loaded or item.kind != "over_budget"]
+        return extras
+
+    def _run_extras(self, chosen: List[_Candidate], budget: int) -> List[ReferenceEntry]:
+        """Sections of retrieval-trimmed bundle files that match this target but missed the bundle excerpt."""
+        extras: List[ReferenceEntry] = []
+        if self.retriever is None or not self.query:
+            return extras
+        for item in sorted(chosen, key=lambda item: (-item.score, item.path)):
+            bundle_chunks = self._bundle_chunks.get(item.rel_path)
+            room = min(self.max_chars_per_file, budget)
+            if bundle_chunks is None or item.diff_base is not None or room < MIN_PARTIAL_CHARS:
                 continue
+            rel = item.rel_path.as_posix()
+            indices = self.retriever.rank(rel, item.raw, self.query, room, exclude=bundle_chunks, matching_only=True)
+            if not indices:
+                continue
+            content = self.retriever.render(rel, item.raw, indices)
+            if len(content) > budget:
+                continue
+            extras.append(
+                ReferenceEntry(
+                    path=item.rel_path,
+                    content=content,
+                    truncated=True,
+                    group=item.group,
+                    original_chars=item.original_chars,
+                    per_run=True,
+                    note="more sections matching this target",
+                )
+            )
+            budget -= len(content)
+        return extras
+
+    def _pack_sorted(
+        self,
+        candidates: List[_Candidate],
+        dropped: List[DroppedReference],
+        budget: int,
+    ) -> List[_Candidate]:
+        chosen: List[_Candidate] = []
+        total_chars = 0
+        for item in candidates:
+            if total_chars + len(item.content) > budget:
+                dropped.append(DroppedReference(path=item.rel_path, chars=len(item.content), reason="over budget"))
+                continue
+            chosen.append(item)
+            total_chars += len(item.content)
+        return chosen
+
+    def _pack_priority(
+        self,
+        candidates: List[_Candidate],
+        dropped: List[DroppedReference],
+        budget: int,
+    ) -> Tuple[List[_Candidate], Optional[ReferenceEntry]]:
+        chosen: List[_Candidate] = []
+        optional: List[_Candidate] = []
+        for item in candidates:
+            if item.group == "global" and len(item.content) <= budget:
+                chosen.append(item)
+                budget -= len(item.content)
+            else:
+                optional.append(item)
+
+        # Scores add up in the knapsack, so many small files could outweigh a stack's
+        # Dockerfile; each bundle's best Dockerfile, then entrypoint, is pinned like globals.
+        for role in PINNED_ROLES:
+            best_by_group: Dict[str, _Candidate] = {}
+            for item in optional:
+                if item.role != role or item.group is None or item.diff_base is not None:
+                    continue
+                current = best_by_group.get(item.group)
+                if current is None or (-item.score, len(item.rel_path.parts), item.path) < (
+                    -current.score,
+                    len(current.rel_path.parts),
+                    current.path,
+                ):
+                    best_by_group[item.group] = item
+            for item in sorted(best_by_group.values(), key=lambda item: (-item.score, item.path)):
+                if len(item.content) <= budget:
+                    optional.remove(item)
+                    chosen.append(item)
+                    budget -= len(item.content)
+
+        # Each knapsack choice is a set of options of which at most one is taken:
+        # a near-duplicate diff is only worth loading together with its base.
+        pinned = {item.rel_path for item in chosen}
+        diffs_by_base: Dict[Path, List[_Candidate]] = {}
+        for item in optional:
+            if item.diff_base is not None and item.diff_base not in pinned:
+                diffs_by_base.setdefault(item.diff_base, []).append(item)
+        choices: List[List[List[_Candidate]]] = []
+        for item in optional:
+            if item.diff_base is not None and item.diff_base not in pinned:
+                continue
+            family = diffs_by_base.get(item.rel_path)
+            choices.append([[item], [item, *family]] if family else [[item]])
+
+        capacity = budget // PACKING_UNIT_CHARS
+        best = [0.0] * (capacity + 1)
+        taken: List[List[int]] = []
+        for options in choices:
+            costs = [sum(math.ceil(len(item.content) / PACKING_UNIT_CHARS) for item in option) for option in options]
+            values = [sum(item.score for item in option) for option in options]
+            row = [-1] * (capacity + 1)
+            for size in range(capacity, -1, -1):
+                for index, cost in enumerate(costs):
+                    if cost <= size and best[size - cost] + values[index] > best[size]:
+                        best[size] = best[size - cost] + values[index]
+                        row[size] = index
+            taken.append(row)
+
+        size = capacity
+        picked = set()
+        for options, row in zip(reversed(choices), reversed(taken)):
+            index = row[size]
+            if index >= 0:
+                for item in options[index]:
+                    picked.add(item.rel_path)
+                    size -= math.ceil(len(item.content) / PACKING_UNIT_CHARS)
+
+        leftovers: List[_Candidate] = []
+        for item in optional:
+            if item.rel_path in picked:
+                chosen.append(item)
+                budget -= len(item.content)
+            else:
+                leftovers.append(item)
+
+        partial: Optional[ReferenceEntry] = None
+        partial_room = budget - len("\n# ... truncated ...\n")
+        if partial_room >= MIN_PARTIAL_CHARS:
+            fillers = [item for item in leftovers if item.role in PARTIAL_ROLES and item.diff_base is None]
+            if fillers:
+                filler = max(fillers, key=lambda item: (item.score, -len(item.content)))
+                content, _ = self._truncate(filler.content, partial_room)
+                partial = ReferenceEntry(
+                    path=filler.rel_path,
+                    content=content,
+                    truncated=True,
+                    group=filler.group,
+                    aliases=filler.aliases,
+                    original_chars=filler.original_chars,
+                )
+                dropped.append(
+                    DroppedReference(
+                        path=filler.rel_path,
+                        chars=len(filler.content) - partial_room,
+                        reason="partially included",
+                        kind="partial",
+                    )
+                )
+                leftovers.remove(filler)
+
+        for item in leftovers:
+            dropped.append(
+                DroppedReference(
+                    path=item.rel_path,
+                    chars=len(item.content),
+                    reason=f"over budget (score {item.score:.2f}, {item.role})",
+                )
+            )
+        return chosen, partial
 
-            entries.append(ReferenceEntry(path=rel_path, content=content, truncated=truncated))
-            total_chars += len(content)
 
-        return ReferenceBundle(entries=entries, total_chars=total_chars, skipped_files=skipped_files)
+def loader_for(
+    config: "AgentConfig",
+    knowledge_base: "KnowledgeBase",
+    bundles: Sequence["KnowledgeBundle"],
+    globs: Iterable[str] = (),
+    counterparts: Iterable[str] = (),
+    retriever: Optional[ChunkIndex] = None,
+    query: Iterable[str] = (),
+) -> ReferenceLoader:
+    """The loader a migration run uses for ``bundles``, configured from ``config``."""
+    groups = [("global", knowledge_base.global_reference_globs)]
+    groups.extend((item.id, item.reference_globs) for item in bundles)
+    # Bundle excerpts are chosen by what the bundles are about, never by the target.
+    bundle_query = {
+        term
+        for item in bundles
+        for term in tokenize(" ".join([item.id, item.stack or "", item.base_os or "", item.php_tag or "", *item.tags]))
+    }
+    return ReferenceLoader(
+        repo_root=config.repo_root,
+        globs=globs,
+        max_total_chars=config.max_reference_chars_total,
+        max_chars_per_file=config.max_reference_chars_per_file,
+        groups=groups,
+        priorities={"global": 100, **{item.id: item.priority for item in bundles}},
+        counterparts=counterparts,
+        packing=config.reference_packing,
+        dedupe=config.reference_dedupe,
+        retriever=retriever,
+        query=query,
+        compaction=config.reference_compaction != "off",
+        knowledge=knowledge_base.compiled,
+        bundle_query=bundle_query,
+    )
@@ -0,0 +1,302 @@
+import hashlib
+import json
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Collection, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from agent.config import AgentConfig
+from agent.context.compaction import compact
+from agent.dockerfile import parse_dockerfile
+
+CHUNK_TARGET_CHARS = 1_500
+MIN_CHUNK_CHARS = 200
+MAX_INDEX_BYTES = 1_000_000
+BM25_K1 = 1.2
+BM25_B = 0.75
+INDEX_VERSION = 2
+SKIPPED_SUFFIXES = {".gz", ".phar", ".tar", ".tgz", ".zip"}
+
+_TOKEN = re.compile(r"[a-z0-9_]{2,}")
+_SECTION = re.compile(r"^\s*(?:\[[^\]]+\]\s*$|#{1,6}\s+\S|[A-Za-z][\w.-]*:\s*$)")
+_OMITTED = "\n# ... {count} section(s) omitted ...\n"
+
+# Shell and Dockerfile words that say nothing about which config section matters.
+_QUERY_STOPWORDS = {
+    "add", "and", "apk", "apt", "arg", "bin", "cache", "copy", "dev", "echo", "env", "etc", "false",
+    "from", "get", "install", "local", "mkdir", "no", "null", "opt", "rf", "rm", "run", "share",
+    "the", "tmp", "true", "update", "usr", "var", "yes",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+@dataclass
+class Chunk:
+    start: int
+    end: int
+    heading: str
+    length: int
+    terms: Dict[str, int]
+
+
+def chunk_text(text: str, target_chars: int = CHUNK_TARGET_CHARS) -> List[Chunk]:
+    """Split ``text`` into chunks that start at section headers.
+
+    ``[section]`` (ini), markdown headings and ``key:`` lines (YAML) open a
+    new chunk once the current one holds ``MIN_CHUNK_CHARS``; long sections
+    are split at blank lines past ``target_chars`` and at any line past
+    twice that.
+    """
+    chunks: List[Chunk] = []
+    start = 0
+    heading = ""
+    chunk_heading = ""
+    position = 0
+
+    def close(end: int) -> None:
+        if end > start and text[start:end].strip():
+            terms = Counter(tokenize(text[start:end]))
+            chunks.append(
+                Chunk(start=start, end=end, heading=chunk_heading, length=sum(terms.values()), terms=dict(terms))
+            )
+
+    for line in text.splitlines(keepends=True):
+        size = position - start
+        is_section = bool(_SECTION.match(line))
+        if is_section and size < MIN_CHUNK_CHARS:
+            heading = line.strip()
+            if not text[start:position].strip():
+                chunk_heading = heading
+        elif is_section or (size >= target_chars and not line.strip()) or size >= 2 * target_chars:
+            close(position)
+            start = position
+            if is_section:
+                heading = line.strip()
+            chunk_heading = heading
+        position += len(line)
+    close(position)
+    return chunks
+
+
+def query_terms(task: str, target_text: str) -> Set[str]:
+    """Terms describing a migration: the task plus the target's instructions, packages and ENV keys."""
+    words = tokenize(task)
+    for item in parse_dockerfile(target_text).instructions:
+        words.extend(tokenize(" ".join(item.arguments)))
+        words.extend(tokenize(" ".join(item.flags.values())))
+    return {word for word in words if word not in _QUERY_STOPWORDS and not word.isdigit()}
+
+
+class ChunkIndex:
+    """Incremental BM25 index over section-aware chunks of knowledge sources.
+
+    Stored as one JSON file. ``refresh`` re-chunks only files whose size or
+    mtime changed and whose content hash differs, and forgets removed files;
+    document frequencies are derived from the stored chunks on load.
+    """
+
+    def __init__(self, path: Optional[Path], root: Path, repo_root: Path, compaction: bool = True) -> None:
+        self.path = path
+        self.root = root
+        self.repo_root = repo_root
+        self.compaction = compaction
+        self._files: Dict[str, Dict] = {}
+        self._dirty = False
+        self._stats: Optional[Tuple[Dict[str, int], int, float]] = None
+        if path is not None:
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                if (
+                    isinstance(data, dict)
+                    and data.get("version") == INDEX_VERSION
+                    and data.get("compaction") == compaction
+                ):
+                    self._files = data.get("files") or {}
+            except (OSError, ValueError):
+                self._files = {}
+
+    def refresh(self) -> int:
+        """Bring the index in line with the tree under ``root``. Returns the number of files re-chunked."""
+        changed = 0
+        present: Set[str] = set()
+        for directory, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [name for name in dirnames if not name.startswith(".git")]
+            for name in filenames:
+                path = Path(directory, name)
+                if path.suffix.lower() in SKIPPED_SUFFIXES:
+                    continue
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                if stat.st_size > MAX_INDEX_BYTES:
+                    continue
+                rel = path.relative_to(self.repo_root).as_posix()
+                present.add(rel)
+                entry = self._files.get(rel)
+                if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                    continue
+                if self._index_file(rel, path, stat, entry):
+                    changed += 1
+        for rel in set(self._files) - present:
+            del self._files[rel]
+            self._dirty = True
+            changed += 1
+        if changed:
+            self._stats = None
+        return changed
+
+    def _index_file(self, rel: str, path: Path, stat: os.stat_result, entry: Optional[Dict]) -> bool:
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return False
+        digest = hashlib.sha256(data).hexdigest()
+        self._dirty = True
+        if entry and entry["sha"] == digest:
+            entry["size"], entry["mtime_ns"] = stat.st_size, stat.st_mtime_ns
+            return False
+        try:
+            text = data.decode("utf-8")
+        except UnicodeDecodeError:
+            text = ""
+        if "\x00" in text:
+            text = ""
+        elif self.compaction:
+            # Chunk what the loader will see, so offsets line up with its text.
+            text = compact(path, text)
+        chunks = chunk_text(text)
+        self._files[rel] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha": digest,
+            "chars": len(text),
+            "chunks": [[item.start, item.end, item.heading, item.length, item.terms] for item in chunks],
+        }
+        return True
+
+    def save(self) -> None:
+        if self.path is None or not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps({"version": INDEX_VERSION, "compaction": self.compaction, "files": self._files}), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def _corpus_stats(self) -> Tuple[Dict[str, int], int, float]:
+        if self._stats is None:
+            df: Counter = Counter()
+            count = 0
+            total_length = 0
+            for entry in self._files.values():
+                for _, _, _, length, terms in entry["chunks"]:
+                    df.update(terms.keys())
+                    count += 1
+                    total_length += length
+            self._stats = (dict(df), count, total_length / count if count else 0.0)
+        return self._stats
+
+    def _score(self, length: int, terms: Dict[str, int], query: Iterable[str]) -> float:
+        df, count, average = self._corpus_stats()
+        score = 0.0
+        for term in query:
+            frequency = terms.get(term)
+            if not frequency:
+                continue
+            idf = math.log(1 + (count - df[term] + 0.5) / (df[term] + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (average or 1))
+            score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return score
+
+    def search(self, query: Iterable[str], limit: int = 10) -> List[Tuple[float, str, str]]:
+        """Best chunks across all files as ``(score, path, heading)``."""
+        terms = list(query)
+        hits: List[Tuple[float, str, str]] = []
+        for rel, entry in self._files.items():
+            for _, _, heading, length, chunk_terms in entry["chunks"]:
+                score = self._score(length, chunk_terms, terms)
+                if score > 0:
+                    hits.append((score, rel, heading))
+        hits.sort(key=lambda item: (-item[0], item[1]))
+        return hits[:limit]
+
+    def select(self, rel_path: str, text: str, query: Sequence[str], max_chars: int) -> Optional[str]:
+        """The most relevant chunks of one file within ``max_chars``, in file order.
+
+        Chunks are taken by descending BM25 score, then by position, so a
+        file with no matching chunk degrades to its head. Returns ``None``
+        when the file is not indexed in its current form.
+        """
+        indices = self.rank(rel_path, text, query, max_chars)
+        return None if indices is None else self.render(rel_path, text, indices)
+
+    def rank(
+        self,
+        rel_path: str,
+        text: str,
+        query: Sequence[str],
+        max_chars: int,
+        exclude: Collection[int] = (),
+        matching_only: bool = False,
+    ) -> Optional[List[int]]:
+        """Indices of the chunks ``select`` keeps, in file order, skipping ``exclude``.
+
+        With ``matching_only`` chunks that share no term with ``query`` are
+        never taken. Returns ``None`` when the file is not indexed in its
+        current form.
+        """
+        entry = self._files.get(rel_path)
+        if not entry or entry["chars"] != len(text) or not entry["chunks"]:
+            return None
+        chunks = entry["chunks"]
+        scores = {
+            index: self._score(chunks[index][3], chunks[index][4], query)
+            for index in range(len(chunks))
+            if index not in exclude
+        }
+        picked: List[int] = []
+        used = 0
+        for index in sorted(scores, key=lambda index: (-scores[index], index)):
+            if matching_only and scores[index] <= 0:
+                break
+            size = chunks[index][1] - chunks[index][0] + len(_OMITTED) + 4
+            if used + size > max_chars:
+                continue
+            picked.append(index)
+            used += size
+        return sorted(picked)
+
+    def render(self, rel_path: str, text: str, indices: Sequence[int]) -> str:
+        """The given chunks of an indexed file, with a marker for each run of omitted ones."""
+        chunks = self._files[rel_path]["chunks"]
+        parts: List[str] = []
+        previous = -1
+        for index in indices:
+            if index != previous + 1:
+                parts.append(_OMITTED.format(count=index - previous - 1))
+            start, end = chunks[index][0], chunks[index][1]
+            parts.append(text[start:end])
+            previous = index
+        if previous != len(chunks) - 1:
+            parts.append(_OMITTED.format(count=len(chunks) - 1 - previous))
+        return "".join(parts)
+
+
+def open_chunk_index(config: AgentConfig) -> ChunkIndex:
+    """Load the on-disk index and bring it up to date with the knowledge sources."""
+    index = ChunkIndex(
+        path=config.resolve(config.retrieval_index_path),
+        root=config.resolve(config.knowledge_sources_dir),
+        repo_root=config.repo_root,
+        compaction=config.reference_compaction != "off",
+    )
+    index.refresh()
+    index.save()
+    return index
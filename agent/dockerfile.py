@@ -0,0 +1,302 @@
+import json
+import re
+import shlex
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+_DIRECTIVE = re.compile(r"^#\s*([a-zA-Z]+)\s*=\s*(.*?)\s*$")
+# ``<<<word`` is a shell here-string, not a heredoc.
+_HEREDOC = re.compile(r"(?<!<)<<(?!<)(-?)\s*([\"']?)([A-Za-z_][A-Za-z0-9_]*)\2")
+_VARIABLE = re.compile(r"\$(?:\{([A-Za-z_][A-Za-z0-9_]*)(?:(:[-+])([^}]*))?\}|([A-Za-z_][A-Za-z0-9_]*))")
+
+
+@dataclass
+class Heredoc:
+    name: str
+    body: str
+    strip_tabs: bool = False
+
+
+@dataclass
+class Instruction:
+    keyword: str
+    raw: str
+    line: int
+    stage: int
+    flags: Dict[str, str] = field(default_factory=dict)
+    arguments: List[str] = field(default_factory=list)
+    json_form: bool = False
+    heredocs: List[Heredoc] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return f"{self.keyword} {self.raw}".strip()
+
+
+@dataclass
+class Stage:
+    index: int
+    image: str
+    name: Optional[str]
+    # ARG and ENV values in scope; ``env`` holds the ENV ones, which child stages inherit.
+    variables: Dict[str, str] = field(default_factory=dict)
+    env: Dict[str, str] = field(default_factory=dict)
+    instructions: List[Instruction] = field(default_factory=list)
+
+    @property
+    def repository(self) -> str:
+        image = self.image.split("@", 1)[0]
+        slash = image.rfind("/")
+        colon = image.rfind(":")
+        return image[:colon] if colon > slash else image
+
+    @property
+    def tag(self) -> Optional[str]:
+        image = self.image.split("@", 1)[0]
+        slash = image.rfind("/")
+        colon = image.rfind(":")
+        return image[colon + 1 :] if colon > slash else None
+
+
+@dataclass
+class DockerfileAST:
+    """Instructions and stages of a Dockerfile, parsed in one pass.
+
+    ``FROM`` images and every instruction's arguments have ``ARG``/``ENV``
+    references substituted with the values in scope at that point.
+    References to unknown variables are left verbatim.
+    """
+
+    text: str
+    escape: str
+    directives: Dict[str, str]
+    global_args: Dict[str, str]
+    instructions: List[Instruction]
+    stages: List[Stage]
+    _lower: Optional[str] = field(default=None, repr=False)
+
+    @property
+    def lower_text(self) -> str:
+        if self._lower is None:
+            self._lower = self.text.lower()
+        return self._lower
+
+    def by_keyword(self, *keywords: str) -> List[Instruction]:
+        wanted = {keyword.upper() for keyword in keywords}
+        return [item for item in self.instructions if item.keyword in wanted]
+
+    def copy_sources(self) -> List[Tuple[Instruction, List[str]]]:
+        """Local build-context sources of every COPY/ADD (``--from`` and heredocs excluded)."""
+        result: List[Tuple[Instruction, List[str]]] = []
+        for item in self.by_keyword("COPY", "ADD"):
+            if "from" in item.flags or len(item.arguments) < 2:
+                continue
+            heredoc_names = {f"<<{doc.name}" for doc in item.heredocs} | {f"<<-{doc.name}" for doc in item.heredocs}
+            sources = [source for source in item.arguments[:-1] if source not in heredoc_names]
+            if sources:
+                result.append((item, sources))
+        return result
+
+
+def substitute(value: str, variables: Dict[str, str]) -> str:
+    def replace(match: re.Match) -> str:
+        name = match.group(1) or match.group(4)
+        modifier = match.group(2)
+        known = name in variables
+        current = variables.get(name, "")
+        if modifier == ":-":
+            return current if current else match.group(3)
+        if modifier == ":+":
+            return match.group(3) if current else ""
+        return current if known else match.group(0)
+
+    if "$" not in value:
+        return value
+    return _VARIABLE.sub(replace, value)
+
+
+def _split_words(payload: str) -> List[str]:
+    try:
+        return shlex.split(payload, comments=False, posix=True)
+    except ValueError:
+        return payload.split()
+
+
+def _parse_assignments(payload: str, legacy: bool = False) -> List[Tuple[str, Optional[str]]]:
+    words = _split_words(payload)
+    if legacy and len(words) >= 2 and "=" not in words[0]:
+        # Legacy ``ENV KEY value with spaces`` form.
+        return [(words[0], payload.split(None, 1)[1].strip())]
+    pairs: List[Tuple[str, Optional[str]]] = []
+    for word in words:
+        if "=" in word:
+            key, value = word.split("=", 1)
+            pairs.append((key, value))
+        else:
+            pairs.append((word, None))
+    return pairs
+
+
+def _build_instruction(
+    keyword: str,
+    raw: str,
+    line: int,
+    stage_index: int,
+    heredocs: List[Heredoc],
+    variables: Dict[str, str],
+) -> Instruction:
+    item = Instruction(keyword=keyword, raw=raw, line=line, stage=stage_index, heredocs=heredocs)
+    payload = raw.strip()
+
+    while payload.startswith("--"):
+        flag, _, rest = payload.partition(" ")
+        name, _, value = flag[2:].partition("=")
+        item.flags[name] = substitute(value, variables)
+        payload = rest.lstrip()
+
+    if keyword in {"ARG", "ENV", "LABEL"}:
+        item.arguments = [payload] if payload else []
+        return item
+
+    if payload.startswith("["):
+        try:
+            parsed = json.loads(payload)
+        except json.JSONDecodeError:
+            parsed = None
+        if isinstance(parsed, list) and all(isinstance(word, str) for word in parsed):
+            item.json_form = True
+            item.arguments = [substitute(word, variables) for word in parsed]
+            return item
+
+    if keyword in {"RUN", "CMD", "ENTRYPOINT", "SHELL", "HEALTHCHECK"}:
+        item.arguments = [payload]
+        return item
+
+    item.arguments = [substitute(word, variables) for word in _split_words(payload)]
+    return item
+
+
+def _parse(text: str) -> DockerfileAST:
+    lines = text.splitlines()
+    directives: Dict[str, str] = {}
+    index = 0
+
+    # Parser directives are only honoured before the first comment, blank line or instruction.
+    while index < len(lines):
+        match = _DIRECTIVE.match(lines[index].strip())
+        if not match or match.group(1).lower() in directives:
+            break
+        directives[match.group(1).lower()] = match.group(2)
+        index += 1
+    escape = directives.get("escape", "\\")
+    if escape not in {"\\", "`"}:
+        escape = "\\"
+
+    global_args: Dict[str, str] = {}
+    instructions: List[Instruction] = []
+    stages: List[Stage] = []
+    variables: Dict[str, str] = global_args
+
+    while index < len(lines):
+        start_line = index + 1
+        stripped = lines[index].strip()
+        index += 1
+        if not stripped or stripped.startswith("#"):
+            continue
+
+        parts: List[str] = []
+        current = stripped
+        while current.endswith(escape):
+            parts.append(current[:-1])
+            parts.append(" ")
+            current = None
+            while index < len(lines):
+                candidate = lines[index].strip()
+                index += 1
+                if not candidate or candidate.startswith("#"):
+                    continue
+                current = candidate
+                break
+            if current is None:
+                break
+        if current is not None:
+            parts.append(current)
+        logical = "".join(parts).strip()
+        if not logical:
+            continue
+
+        words = logical.split(None, 1)
+        keyword = words[0].upper()
+        raw = words[1].strip() if len(words) > 1 else ""
+
+        heredocs: List[Heredoc] = []
+        if keyword in {"RUN", "COPY", "ADD"} and "<<" in raw:
+            for match in _HEREDOC.finditer(raw):
+                terminator = match.group(3)
+                strip_tabs = match.group(1) == "-"
+                body: List[str] = []
+                while index < len(lines):
+                    body_line = lines[index]
+                    index += 1
+                    check = body_line.lstrip("\t") if strip_tabs else body_line
+                    if check == terminator:
+                        break
+                    body.append(body_line)
+                heredocs.append(Heredoc(name=terminator, body="\n".join(body), strip_tabs=strip_tabs))
+
+        if keyword == "FROM":
+            item = _build_instruction(keyword, raw, start_line, len(stages), heredocs, global_args)
+            words = item.arguments
+            image = words[0] if words else ""
+            name = words[2] if len(words) >= 3 and words[1].lower() == "as" else None
+            # A stage built FROM an earlier stage inherits its ENV values; ARGs must be redeclared.
+            parent = next((stage for stage in stages if stage.name and stage.name == image), None)
+            stage = Stage(
+                index=len(stages),
+                image=image,
+                name=name,
+                variables=dict(parent.env) if parent else {},
+                env=dict(parent.env) if parent else {},
+            )
+            stages.append(stage)
+            variables = stage.variables
+            stage.instructions.append(item)
+            instructions.append(item)
+            continue
+
+        stage_index = len(stages) - 1
+        item = _build_instruction(keyword, raw, start_line, stage_index, heredocs, variables)
+        instructions.append(item)
+        if stages:
+            stages[-1].instructions.append(item)
+
+        if keyword == "ARG":
+            for key, value in _parse_assignments(raw):
+                if value is not None:
+                    variables[key] = substitute(value, variables)
+                elif key in global_args and key not in variables:
+                    # Re-declaring a global ARG inside a stage brings its value into scope.
+                    variables[key] = global_args[key]
+        elif keyword == "ENV" and stages:
+            for key, value in _parse_assignments(raw, legacy=True):
+                if value is not None:
+                    variables[key] = stages[-1].env[key] = substitute(value, variables)
+
+    return DockerfileAST(
+        text=text,
+        escape=escape,
+        directives=directives,
+        global_args=global_args,
+        instructions=instructions,
+        stages=stages,
+    )
+
+
+@lru_cache(maxsize=256)
+def parse_dockerfile(text: str) -> DockerfileAST:
+    """Parse ``text`` once; repeated calls with the same text share the AST.
+
+    Callers must treat the returned AST as read-only.
+    """
+    return _parse(text)
@@ -0,0 +1,173 @@
+import os
+import re
+from pathlib import Path
+from typing import List, Optional, Pattern, Tuple
+
+_WILDCARDS = "*?["
+
+
+def _translate_segment(segment: str) -> str:
+    out: List[str] = []
+    index = 0
+    while index < len(segment):
+        char = segment[index]
+        if char == "*":
+            out.append("[^/]*")
+        elif char == "?":
+            out.append("[^/]")
+        elif char == "[":
+            end = segment.find("]", index + 1)
+            if end == -1:
+                out.append(re.escape(char))
+            else:
+                body = segment[index + 1 : end]
+                if body.startswith(("!", "^")):
+                    body = "^" + body[1:]
+                out.append(f"[{body.replace(chr(92), chr(92) * 2)}]")
+                index = end
+        elif char == "\\" and index + 1 < len(segment):
+            index += 1
+            out.append(re.escape(segment[index]))
+        else:
+            out.append(re.escape(char))
+        index += 1
+    return "".join(out)
+
+
+def clean_pattern(pattern: str) -> str:
+    parts = [part for part in pattern.strip().strip("/").split("/") if part not in ("", ".")]
+    return "/".join(parts)
+
+
+def translate_glob(pattern: str) -> str:
+    """Translate a Docker/Go-style glob into a regex over ``/``-separated paths.
+
+    ``*`` and ``?`` never cross ``/``; a ``**`` segment matches any number of
+    directories, including none.
+    """
+    parts = clean_pattern(pattern).split("/")
+    out: List[str] = []
+    for index, part in enumerate(parts):
+        last = index == len(parts) - 1
+        if part == "**":
+            out.append(".*" if last else "(?:[^/]*/)*")
+        else:
+            out.append(_translate_segment(part) + ("" if last else "/"))
+    return "".join(out)
+
+
+def literal_prefix(pattern: str) -> str:
+    """The leading path segments of ``pattern`` that contain no wildcard."""
+    literal: List[str] = []
+    for part in clean_pattern(pattern).split("/"):
+        if any(char in part for char in _WILDCARDS):
+            break
+        literal.append(part)
+    return "/".join(literal)
+
+
+class DockerIgnore:
+    """Compiled ``.dockerignore`` rules.
+
+    All rules are folded into one regex whose alternatives are ordered from
+    the last rule to the first, so the alternative that matches is the rule
+    that wins under Docker's last-match semantics. A rule also matches every
+    path below a matching directory.
+    """
+
+    def __init__(self, patterns: List[str]) -> None:
+        self.rules: List[Tuple[bool, str]] = []
+        for raw in patterns:
+            line = raw.strip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            cleaned = clean_pattern(line[1:] if negated else line)
+            if cleaned:
+                self.rules.append((negated, cleaned))
+
+        self._matcher: Optional[Pattern[str]] = None
+        if self.rules:
+            alternatives = [
+                f"(?P<r{index}>{translate_glob(pattern)})"
+                for index, (_, pattern) in reversed(list(enumerate(self.rules)))
+            ]
+            self._matcher = re.compile(f"(?:{'|'.join(alternatives)})(?:/.*)?")
+        self._negated_prefixes = [literal_prefix(pattern) for negated, pattern in self.rules if negated]
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    @classmethod
+    def load(cls, context_dir: Path, dockerfile_path: Optional[Path] = None) -> "DockerIgnore":
+        """Read ``<Dockerfile>.dockerignore`` if present, else ``.dockerignore`` in the context."""
+        candidates = []
+        if dockerfile_path is not None:
+            candidates.append(dockerfile_path.with_name(f"{dockerfile_path.name}.dockerignore"))
+        candidates.append(context_dir / ".dockerignore")
+        for candidate in candidates:
+            try:
+                return cls(candidate.read_text(encoding="utf-8").splitlines())
+            except (OSError, UnicodeDecodeError):
+                continue
+        return cls([])
+
+    def is_ignored(self, rel_path: str) -> bool:
+        if self._matcher is None:
+            return False
+        match = self._matcher.fullmatch(rel_path.strip("/"))
+        if not match or match.lastgroup is None:
+            return False
+        negated, _ = self.rules[int(match.lastgroup[1:])]
+        return not negated
+
+    def can_prune(self, rel_dir: str) -> bool:
+        """True when ``rel_dir`` is ignored and no ``!`` rule can re-include anything below it."""
+        if not self.is_ignored(rel_dir):
+            return False
+        prefix = rel_dir.strip("/") + "/"
+        for literal in self._negated_prefixes:
+            if not literal or literal.startswith(prefix) or prefix.startswith(literal + "/"):
+                return False
+        return True
+
+
+def glob_context(base_dir: Path, pattern: str, ignore: DockerIgnore) -> List[Path]:
+    """Expand a COPY/ADD source glob inside ``base_dir`` with ``os.scandir``.
+
+    Only the pattern's literal prefix directory is walked, depth is bounded
+    unless the pattern has ``**``, and ignored subtrees are never entered.
+    """
+    cleaned = clean_pattern(pattern)
+    if not cleaned:
+        return []
+    regex = re.compile(translate_glob(cleaned))
+    segments = cleaned.split("/")
+    root_rel = literal_prefix("/".join(segments[:-1])) if len(segments) > 1 else ""
+    root_depth = len(root_rel.split("/")) if root_rel else 0
+    max_depth = None if "**" in segments else len(segments) - root_depth
+
+    results: List[Path] = []
+    stack: List[Tuple[str, int]] = [(root_rel, 1)]
+    while stack:
+        rel_dir, depth = stack.pop()
+        try:
+            iterator = os.scandir(base_dir / rel_dir if rel_dir else base_dir)
+        except OSError:
+            continue
+        with iterator as entries:
+            for entry in entries:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if is_dir:
+                    if max_depth is not None and depth >= max_depth:
+                        continue
+                    if ignore.can_prune(rel):
+                        continue
+                    stack.append((rel, depth + 1))
+                elif regex.fullmatch(rel) and not ignore.is_ignored(rel):
+                    results.append(base_dir / rel)
+    return sorted(results)
@@ -0,0 +1,148 @@
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Pattern, Sequence, Tuple
+
+from agent.dockerignore import clean_pattern, literal_prefix, translate_glob
+from agent.related_files import BINARY_SUFFIXES
+
+# Directories no knowledge or build-context glob is meant to reach into.
+PRUNED_DIRS = {".git", ".hg", ".svn", ".venv", "__pycache__", "node_modules"}
+
+
+@dataclass
+class _Compiled:
+    index: int
+    regex: Pattern[str]
+    wants_binary: bool
+
+
+@dataclass
+class _Root:
+    rel: str
+    patterns: List[_Compiled]
+    combined: Pattern[str]
+    max_depth: Optional[int]
+
+
+def _split_root(pattern: str) -> Tuple[str, Optional[int]]:
+    """Literal directory a pattern starts in, and how deep below it matches can be (None = unbounded)."""
+    segments = pattern.split("/")
+    root = literal_prefix("/".join(segments[:-1])) if len(segments) > 1 else ""
+    if "**" in segments:
+        return root, None
+    return root, len(segments) - (len(root.split("/")) if root else 0)
+
+
+def _is_within(rel: str, root: str) -> bool:
+    return not root or rel == root or rel.startswith(root + "/")
+
+
+def _build_roots(patterns: Sequence[str]) -> List[_Root]:
+    per_root: Dict[str, List[Tuple[int, str, Optional[int]]]] = {}
+    for index, pattern in enumerate(patterns):
+        root, depth = _split_root(pattern)
+        per_root.setdefault(root, []).append((index, pattern, depth))
+
+    # Fold roots nested inside another root into it, so every subtree is walked once.
+    walk_roots: List[str] = []
+    for root in sorted(per_root, key=lambda item: (item.count("/") if item else -1, item)):
+        if not any(_is_within(root, outer) for outer in walk_roots):
+            walk_roots.append(root)
+
+    roots: List[_Root] = []
+    for walk_root in walk_roots:
+        members: List[_Compiled] = []
+        depths: List[Optional[int]] = []
+        for root, entries in per_root.items():
+            if not _is_within(root, walk_root):
+                continue
+            extra = len(root.split("/")) - (len(walk_root.split("/")) if walk_root else 0) if root else 0
+            for index, pattern, depth in entries:
+                last = pattern.rsplit("/", 1)[-1].lower()
+                members.append(
+                    _Compiled(
+                        index=index,
+                        regex=re.compile(translate_glob(pattern)),
+                        wants_binary=any(suffix in last for suffix in BINARY_SUFFIXES),
+                    )
+                )
+                depths.append(None if depth is None else depth + extra)
+        combined = re.compile("|".join(f"(?:{item.regex.pattern})" for item in members))
+        max_depth = None if any(depth is None for depth in depths) else max(depths)
+        roots.append(_Root(rel=walk_root, patterns=members, combined=combined, max_depth=max_depth))
+    return roots
+
+
+def expand_patterns(
+    base_dir: Path,
+    patterns: Iterable[str],
+    pruned_dirs: Iterable[str] = PRUNED_DIRS,
+) -> Dict[str, List[Path]]:
+    """Expand many glob patterns with one ``os.scandir`` walk per distinct subtree.
+
+    Patterns use pathlib semantics (``*`` stays within a segment, ``**``
+    spans directories) and are grouped by literal prefix; nested prefixes
+    share their ancestor's walk. Each file is checked against one combined
+    regex first, then against the individual patterns. Directories in
+    ``pruned_dirs`` are never entered, and files with a binary suffix are
+    only offered to patterns that name such a suffix (e.g. ``*.tar.gz``).
+    Unlike pathlib, a trailing ``**`` matches every file below it. As in
+    pathlib, ``**`` walks do not enter symlinked directories.
+    Returns the sorted matching files for every pattern.
+    """
+    originals = list(dict.fromkeys(patterns))
+    cleaned = [clean_pattern(pattern) for pattern in originals]
+    results: Dict[str, List[Path]] = {pattern: [] for pattern in originals}
+    pruned = set(pruned_dirs)
+
+    wildcard: List[int] = []
+    for index, pattern in enumerate(cleaned):
+        if any(char in pattern for char in "*?["):
+            wildcard.append(index)
+        elif pattern and (base_dir / pattern).is_file():
+            results[originals[index]].append(base_dir / pattern)
+
+    roots = _build_roots([cleaned[index] for index in wildcard])
+    for root in roots:
+        stack: List[Tuple[str, int]] = [(root.rel, 1)]
+        while stack:
+            rel_dir, depth = stack.pop()
+            try:
+                iterator = os.scandir(base_dir / rel_dir if rel_dir else base_dir)
+            except OSError:
+                continue
+            with iterator as entries:
+                for entry in entries:
+                    rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        continue
+                    if is_dir:
+                        if entry.name in pruned or (root.max_depth is not None and depth >= root.max_depth):
+                            continue
+                        # Like pathlib, ``**`` does not follow directory symlinks, so link cycles end.
+                        if root.max_depth is None and entry.is_symlink():
+                            continue
+                        stack.append((rel, depth + 1))
+                        continue
+                    if not root.combined.fullmatch(rel):
+                        continue
+                    binary = os.path.splitext(entry.name)[1].lower() in BINARY_SUFFIXES
+                    for compiled in root.patterns:
+                        if binary and not compiled.wants_binary:
+                            continue
+                        if compiled.regex.fullmatch(rel):
+                            results[originals[wildcard[compiled.index]]].append(base_dir / rel)
+
+    return {pattern: sorted(paths) for pattern, paths in results.items()}
+
+
+def expand_unique(base_dir: Path, patterns: Iterable[str]) -> List[Path]:
+    """All files matched by any of ``patterns``, sorted and without duplicates."""
+    found = set()
+    for paths in expand_patterns(base_dir, patterns).values():
+        found.update(paths)
+    return sorted(found)
@@ -0,0 +1,296 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from agent import profiling
+from agent.config import AgentConfig
+from agent.context.compaction import compact
+from agent.dockerignore import clean_pattern, literal_prefix
+from agent.globbing import expand_patterns
+from agent.knowledge_base import KnowledgeBase, KnowledgeBundle, load_knowledge_base
+
+ARTIFACT_VERSION = 1
+CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class CompiledFile:
+    size: int
+    mtime_ns: int
+    sha: Optional[str]
+    content: Optional[str] = None
+    original_chars: int = 0
+    tokens: int = 0
+
+
+@dataclass
+class CompiledKnowledge:
+    """Everything knowledge preparation derives from the tree, in one JSON file.
+
+    ``sources`` (index and bundle manifests) and ``files`` are validated by
+    size/mtime with a content-hash fallback; ``directories`` holds the mtime
+    of every directory a glob walked, so added or removed files invalidate
+    the expanded file lists.
+    """
+
+    index_path: str
+    compaction: bool
+    built_at: float
+    global_reference_globs: List[str]
+    bundles: List[KnowledgeBundle]
+    globs: Dict[str, List[str]]
+    files: Dict[str, CompiledFile]
+    sources: Dict[str, CompiledFile]
+    directories: Dict[str, int]
+    repo_root: Path = field(default=Path("."), repr=False)
+
+    def knowledge_base(self) -> KnowledgeBase:
+        return KnowledgeBase(
+            index_path=self.repo_root / self.index_path,
+            global_reference_globs=list(self.global_reference_globs),
+            bundles=list(self.bundles),
+            compiled=self,
+        )
+
+    def glob(self, pattern: str) -> Optional[List[Path]]:
+        """Files matching ``pattern`` at build time, or ``None`` if it was not compiled."""
+        matches = self.globs.get(pattern)
+        if matches is None:
+            return None
+        return [self.repo_root / rel for rel in matches]
+
+    def content(self, path: Path) -> Optional[Tuple[str, int]]:
+        """Compacted text and original length of a reference file, if compiled."""
+        try:
+            rel = path.relative_to(self.repo_root).as_posix()
+        except ValueError:
+            return None
+        entry = self.files.get(rel)
+        if entry is None or entry.content is None:
+            return None
+        return entry.content, entry.original_chars
+
+    def stale_reason(self) -> Optional[str]:
+        for rel, mtime_ns in self.directories.items():
+            try:
+                if os.stat(self.repo_root / rel).st_mtime_ns != mtime_ns:
+                    return f"directory changed: {rel}"
+            except OSError:
+                return f"directory removed: {rel}"
+        for table in (self.sources, self.files):
+            for rel, entry in table.items():
+                if not _unchanged(self.repo_root / rel, entry):
+                    return f"file changed: {rel}"
+        return None
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(entry.tokens for entry in self.files.values())
+
+
+def _digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _unchanged(path: Path, entry: CompiledFile) -> bool:
+    try:
+        stat = path.stat()
+    except OSError:
+        return False
+    if stat.st_size == entry.size and stat.st_mtime_ns == entry.mtime_ns:
+        return True
+    if entry.sha is None or stat.st_size != entry.size:
+        return False
+    try:
+        return _digest(path) == entry.sha
+    except OSError:
+        return False
+
+
+def _stat_entry(path: Path, hashed: bool = True) -> CompiledFile:
+    stat = path.stat()
+    return CompiledFile(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha=_digest(path) if hashed else None)
+
+
+def _walked_directories(repo_root: Path, pattern: str) -> Dict[str, int]:
+    """Directories whose listing decides the matches of ``pattern``."""
+    directory_part = pattern.rsplit("/", 1)[0] if "/" in pattern else ""
+    root_rel = literal_prefix(directory_part)
+    root = repo_root / root_rel
+    directories = [str(root)]
+    if root_rel != clean_pattern(directory_part):
+        directories.extend(_subdirectories(root))
+    result: Dict[str, int] = {}
+    for directory in directories:
+        try:
+            result[Path(directory).relative_to(repo_root).as_posix()] = os.stat(directory).st_mtime_ns
+        except OSError:
+            continue
+    return result
+
+
+def _subdirectories(root: Path) -> List[str]:
+    found: List[str] = []
+    for directory, dirnames, _ in os.walk(root):
+        found.extend(os.path.join(directory, name) for name in dirnames)
+    return found
+
+
+def compile_knowledge(config: AgentConfig, index_path: Optional[Path] = None) -> CompiledKnowledge:
+    repo_root = config.repo_root
+    index_path = index_path or config.knowledge_index_path
+    with profiling.span("load_knowledge_base"):
+        knowledge_base = load_knowledge_base(repo_root, index_path)
+    compaction = config.reference_compaction != "off"
+
+    index_rel = Path(os.path.relpath(knowledge_base.index_path, repo_root)).as_posix()
+    sources = {index_rel: _stat_entry(knowledge_base.index_path)}
+    index_data = json.loads(knowledge_base.index_path.read_text(encoding="utf-8"))
+    for entry in index_data.get("bundles") or []:
+        manifest = entry.get("manifest") if isinstance(entry, dict) else entry
+        if manifest:
+            sources[str(manifest)] = _stat_entry(repo_root / str(manifest))
+
+    reference_patterns = list(knowledge_base.global_reference_globs)
+    asset_patterns: List[str] = []
+    for bundle in knowledge_base.bundles:
+        reference_patterns.extend(bundle.reference_globs)
+        asset_patterns.extend(bundle.asset_globs)
+
+    globs: Dict[str, List[str]] = {}
+    files: Dict[str, CompiledFile] = {}
+    directories: Dict[str, int] = {}
+    with profiling.span("expand_patterns"):
+        expanded = expand_patterns(repo_root, reference_patterns + asset_patterns)
+    for pattern, matches in expanded.items():
+        globs[pattern] = [path.relative_to(repo_root).as_posix() for path in matches]
+        directories.update(_walked_directories(repo_root, pattern))
+        is_asset = pattern not in reference_patterns
+        for path in matches:
+            rel = path.relative_to(repo_root).as_posix()
+            if rel in files:
+                continue
+            if is_asset:
+                # Assets are only listed; hashing multi-megabyte tarballs would cost more than a glob.
+                files[rel] = _stat_entry(path, hashed=False)
+                continue
+            data = path.read_bytes()
+            stat = path.stat()
+            entry = CompiledFile(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha=hashlib.sha256(data).hexdigest())
+            try:
+                original = data.decode("utf-8").replace("\r\n", "\n")
+            except UnicodeDecodeError:
+                files[rel] = entry
+                continue
+            content = compact(path, original) if compaction else original
+            entry.content = content
+            entry.original_chars = len(original)
+            entry.tokens = -(-len(content) // CHARS_PER_TOKEN)
+            files[rel] = entry
+
+    return CompiledKnowledge(
+        index_path=index_rel,
+        compaction=compaction,
+        built_at=time.time(),
+        global_reference_globs=knowledge_base.global_reference_globs,
+        bundles=knowledge_base.bundles,
+        globs=globs,
+        files=files,
+        sources=sources,
+        directories=directories,
+        repo_root=repo_root,
+    )
+
+
+def write_artifact(compiled: CompiledKnowledge, path: Path) -> None:
+    payload = {
+        "version": ARTIFACT_VERSION,
+        "index_path": compiled.index_path,
+        "compaction": compiled.compaction,
+        "built_at": compiled.built_at,
+        "global_reference_globs": compiled.global_reference_globs,
+        "bundles": [asdict(bundle) for bundle in compiled.bundles],
+        "globs": compiled.globs,
+        "files": {rel: asdict(entry) for rel, entry in compiled.files.items()},
+        "sources": {rel: asdict(entry) for rel, entry in compiled.sources.items()},
+        "directories": compiled.directories,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(payload), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def read_artifact(path: Path, repo_root: Path) -> Optional[CompiledKnowledge]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != ARTIFACT_VERSION:
+        return None
+    try:
+        return CompiledKnowledge(
+            index_path=data["index_path"],
+            compaction=bool(data["compaction"]),
+            built_at=float(data["built_at"]),
+            global_reference_globs=list(data["global_reference_globs"]),
+            bundles=[KnowledgeBundle(**item) for item in data["bundles"]],
+            globs=data["globs"],
+            files={rel: CompiledFile(**item) for rel, item in data["files"].items()},
+            sources={rel: CompiledFile(**item) for rel, item in data["sources"].items()},
+            directories=data["directories"],
+            repo_root=repo_root,
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def artifact_stale_reason(
+    config: AgentConfig,
+    compiled: Optional[CompiledKnowledge],
+    index_path: Optional[Path] = None,
+) -> Optional[str]:
+    """Why ``compiled`` cannot serve ``index_path`` with the current settings, or None if it can."""
+    if compiled is None:
+        return "no artifact"
+    index_path = index_path or config.knowledge_index_path
+    if config.resolve(Path(compiled.index_path)).resolve() != config.resolve(index_path).resolve():
+        return "different knowledge index"
+    if compiled.compaction != (config.reference_compaction != "off"):
+        return "compaction setting changed"
+    with profiling.span("stale_check"):
+        return compiled.stale_reason()
+
+
+def load_knowledge(
+    config: AgentConfig,
+    index_path: Optional[Path] = None,
+    log: Callable[[str], None] = print,
+) -> KnowledgeBase:
+    """Load the knowledge base from the compiled artifact, rebuilding it when stale."""
+    index_path = index_path or config.knowledge_index_path
+    artifact_path = config.resolve(config.knowledge_artifact_path)
+
+    with profiling.span("read_artifact"):
+        compiled = read_artifact(artifact_path, config.repo_root)
+    reason = artifact_stale_reason(config, compiled, index_path)
+    if reason is None and compiled is not None:
+        return compiled.knowledge_base()
+
+    if compiled is not None:
+        log(f"[knowledge] rebuilding artifact ({reason})")
+    with profiling.span("compile_knowledge"):
+        compiled = compile_knowledge(config, index_path)
+    try:
+        write_artifact(compiled, artifact_path)
+    except OSError as exc:
+        log(f"[knowledge] could not write {artifact_path}: {exc}")
+    return compiled.knowledge_base()
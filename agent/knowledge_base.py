@@ -1,12 +1,19 @@
 import json
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
 
-try:
-    import yaml
-except ModuleNotFoundError:
-    yaml = None
+if TYPE_CHECKING:
+    from agent.knowledge_artifact import CompiledKnowledge
+
+
+def _yaml():
+    """PyYAML, imported on first use (most manifests are JSON), or ``None`` when it is not installed."""
+    try:
+        import yaml
+    except ModuleNotFoundError:
+        return None
+    return yaml
 
 
 @dataclass(frozen=True)
@@ -29,6 +36,8 @@ class KnowledgeBase:
     index_path: Path
     global_reference_globs: List[str]
     bundles: List[KnowledgeBundle]
+    # Set when loaded from the compiled artifact (see agent.knowledge_artifact).
+    compiled: Optional["CompiledKnowledge"] = field(default=None, compare=False, repr=False)
 
     @property
     def bundle_ids(self) -> List[str]:
@@ -54,6 +63,7 @@ def _load_document(path: Path):
         return json.loads(text)
 
     if suffix in {".yml", ".yaml"}:
+        yaml = _yaml()
         if yaml is None:
             raise ModuleNotFoundError(
                 f"PyYAML is required to parse {path}. Install it or switch to JSON manifests."
@@ -63,6 +73,7 @@ def _load_document(path: Path):
     try:
         return json.loads(text)
     except json.JSONDecodeError:
+        yaml = _yaml()
         if yaml is None:
             raise ValueError(f"Unsupported knowledge format for {path}")
         return yaml.safe_load(text)
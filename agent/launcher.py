@@ -3,23 +3,33 @@ import sys
 from pathlib import Path
 from typing import List, Optional
 
-try:
-    from rich import box
-    from rich.console import Console
-    from rich.panel import Panel
-    from rich.prompt import Confirm, Prompt
-    from rich.table import Table
-    from rich.text import Text
-except ModuleNotFoundError:
-    box = None
-    Console = None
-    Panel = None
-    Prompt = None
-    Confirm = None
-    Table = None
-    Text = None
-
-console = Console() if Console else None
+box = None
+Console = None
+Panel = None
+Prompt = None
+Confirm = None
+Table = None
+Text = None
+console = None
+_rich_loaded = False
+
+
+def _load_rich() -> None:
+    """Import rich on the first code path that draws with it; the Textual launcher never does."""
+    global box, Console, Panel, Prompt, Confirm, Table, Text, console, _rich_loaded
+    if _rich_loaded:
+        return
+    _rich_loaded = True
+    try:
+        from rich import box
+        from rich.console import Console
+        from rich.panel import Panel
+        from rich.prompt import Confirm, Prompt
+        from rich.table import Table
+        from rich.text import Text
+    except ModuleNotFoundError:
+        return
+    console = Console()
 
 
 def _repo_root() -> Path:
@@ -32,6 +42,7 @@ def _agent_cmd() -> List[str]:
 
 
 def run_agent(args: List[str], title: str = "Running Agent") -> int:
+    _load_rich()
     cmd = _agent_cmd() + args
     if console:
         console.rule(f"[bold cyan]{title}")
@@ -67,6 +78,7 @@ def run_agent(args: List[str], title: str = "Running Agent") -> int:
 
 
 def validate_knowledge() -> int:
+    _load_rich()
     root = _repo_root()
     python_bin = root / ".venv" / "bin" / "python"
     cmd = [str(python_bin), "-m", "agent.validate_knowledge"] if python_bin.exists() else ["python3", "-m", "agent.validate_knowledge"]
@@ -220,6 +232,7 @@ def render_banner() -> None:
 
 
 def run_launcher() -> int:
+    _load_rich()
     render_banner()
 
     while True:
@@ -0,0 +1,131 @@
+import re
+from collections import deque
+from pathlib import Path
+from typing import Deque, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+_MARKDOWN_PREFIXES = ("# ", "## ", "### ", "- ", "* ")
+_BOLD = re.compile(r"\*\*[^*]+\*\*")
+_NUMBERED = re.compile(r"\d+\.\s")
+# First match wins; ``[done]`` lines are styled by outcome.
+_STYLES = (
+    ("[run]", None, "bold cyan"),
+    ("[done]", "success", "bold green"),
+    ("[done]", "failed", "bold red"),
+    ("[error]", None, "bold red"),
+    ("[warn]", None, "yellow"),
+    ("[reply]", None, "bold magenta"),
+    ("[log]", None, "dim"),
+)
+
+
+def looks_like_markdown(text: str) -> bool:
+    stripped = text.strip()
+    if not stripped:
+        return False
+    if stripped.startswith(_MARKDOWN_PREFIXES):
+        return True
+    # The regexes only run on lines that could match them.
+    if "**" in stripped and _BOLD.search(stripped):
+        return True
+    return stripped[0].isdigit() and _NUMBERED.match(stripped) is not None
+
+
+def line_kind(text: str) -> str:
+    """``table`` (pipe row), ``markdown`` or ``text``."""
+    stripped = text.strip()
+    if stripped.startswith("|") and stripped.count("|") >= 3:
+        return "table"
+    if looks_like_markdown(text):
+        return "markdown"
+    return "text"
+
+
+def line_style(text: str) -> Optional[str]:
+    if not text.startswith("["):
+        return None
+    for prefix, contains, style in _STYLES:
+        if text.startswith(prefix) and (contains is None or contains in text):
+            return style
+    return None
+
+
+def group_lines(lines: Iterable[str]) -> List[Tuple[str, List[str]]]:
+    """Contiguous lines of the same kind, so each run renders as one block."""
+    groups: List[Tuple[str, List[str]]] = []
+    for line in lines:
+        kind = line_kind(line)
+        if groups and groups[-1][0] == kind:
+            groups[-1][1].append(line)
+        else:
+            groups.append((kind, [line]))
+    return groups
+
+
+class LogBuffer:
+    """The last ``capacity`` lines of a log in memory; older lines are appended to ``spill_path``.
+
+    The spill file is opened on first overflow, so short logs never touch disk.
+    """
+
+    def __init__(self, capacity: int, spill_path: Optional[Path] = None) -> None:
+        self.capacity = max(1, capacity)
+        self.spill_path = spill_path
+        self.spilled = 0
+        self._lines: Deque[str] = deque()
+        self._spill: Optional[TextIO] = None
+
+    def append(self, line: str) -> None:
+        if len(self._lines) >= self.capacity:
+            self._spill_line(self._lines.popleft())
+        self._lines.append(line)
+
+    def _spill_line(self, line: str) -> None:
+        self.spilled += 1
+        if self.spill_path is None:
+            return
+        if self._spill is None:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            self._spill = self.spill_path.open("a", encoding="utf-8")
+        self._spill.write(line + "\n")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._lines)
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def close(self) -> None:
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+
+class LogBatcher:
+    """Lines waiting for the next frame, at most ``max_pending`` of them.
+
+    A burst is rendered over several frames; when lines keep arriving
+    faster than that, the oldest pending ones are dropped (the job's
+    ``LogBuffer`` keeps them) and counted.
+    """
+
+    def __init__(self, max_pending: int) -> None:
+        self._pending: Deque[str] = deque(maxlen=max(1, max_pending))
+        self._dropped = 0
+
+    def push(self, line: str) -> None:
+        if len(self._pending) == self._pending.maxlen:
+            self._dropped += 1
+        self._pending.append(line)
+
+    def clear(self) -> None:
+        self._pending.clear()
+        self._dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def take(self, limit: Optional[int] = None) -> Tuple[int, List[Tuple[str, List[str]]]]:
+        """Dropped-line count and the oldest ``limit`` pending lines, grouped, for one frame."""
+        dropped, self._dropped = self._dropped, 0
+        count = len(self._pending) if limit is None else min(limit, len(self._pending))
+        return dropped, group_lines(self._pending.popleft() for _ in range(count))
@@ -1,21 +1,29 @@
 import argparse
-import asyncio
 import os
 import sys
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional
-
-from dotenv import load_dotenv
+from typing import Callable, Dict, List, MutableMapping, Optional, Sequence, Tuple
 
+from agent import profiling
+from agent.cli import list_reference_groups, parse_args
 from agent.config import AgentConfig
-from agent.context import ReferenceLoader
-from agent.knowledge_base import load_knowledge_base
-from agent.prompts import build_system_prompt
+from agent.context import ReferenceBundle
+from agent.context.reference_loader import loader_for
+from agent.context.retrieval import ChunkIndex, open_chunk_index, query_terms
+from agent.knowledge_artifact import load_knowledge
+from agent.knowledge_base import KnowledgeBase
+from agent.metrics import MetricsLog, RequestMetrics, ToolCall, open_metrics_log
+from agent.prompts import PromptSegment, build_prompt_segments, describe_segments, join_segments
 from agent.reference_assets import find_newrelic_assets, pick_latest_asset
-from agent.reference_selection import detect_base, detect_php_tag, select_references
-from agent.related_files import discover_related_files
+from agent.reference_selection import SelectionResult, detect_base, detect_php_tag, select_references
+from agent.related_files import FileClassCache, RelatedFilesResult, discover_related_files
+from agent.response_cache import ResponseCache, open_response_cache
+from agent.transport import LiveTransport, open_transport
 from agent.ui import Spinner, prompt_choice, render_response, supports_color
 from agent.utils import (
+    FileBlock,
+    FileBlockStream,
     backup_path,
     default_output_path,
     ensure_exists,
@@ -23,6 +31,7 @@ from agent.utils import (
     extract_file_blocks,
     migrated_output_path,
     parse_dockerfile_from_blocks,
+    parse_fenced_blocks,
     resolve_output_path,
     trim_text,
     write_text,
@@ -93,6 +102,22 @@ def discover_ci_files(target_path: Path, max_parent_levels: int = 4) -> List[Pat
     return ci_files
 
 
+@dataclass
+class MigrationPlan:
+    target_path: Path
+    task: str
+    mode: str
+    base: Optional[str]
+    selection: SelectionResult
+    related_result: Optional[RelatedFilesResult]
+    related_files: List[Path]
+    allowed_tools: List[str]
+    prompt_segments: List[PromptSegment]
+    system_prompt: str
+    user_prompt: str
+    references: Optional[ReferenceBundle] = None
+
+
 async def run_agent(
     prompt: str,
     system_prompt: str,
@@ -100,15 +125,22 @@ async def run_agent(
     debug: bool,
     ui_enabled: bool,
     spinner_enabled: bool,
+    on_text: Optional[Callable[[str], None]] = None,
+    transport=None,
+    metrics: Optional[RequestMetrics] = None,
 ) -> str:
     import time
 
-    from claude_agent_sdk import ClaudeAgentOptions, AssistantMessage, ResultMessage, query
+    from claude_agent_sdk import ClaudeAgentOptions, AssistantMessage, ResultMessage, UserMessage
+    from claude_agent_sdk.types import StreamEvent, ToolResultBlock, ToolUseBlock
+
+    transport = transport or LiveTransport()
 
     options = ClaudeAgentOptions(
         allowed_tools=allowed_tools,
         permission_mode="acceptEdits",
         system_prompt=system_prompt,
+        include_partial_messages=on_text is not None,
     )
 
     output_chunks: List[str] = []
@@ -119,7 +151,23 @@ async def run_agent(
     spinner = Spinner(message="Thinking", enabled=spinner_enabled and not debug)
     spinner.start()
 
-    async for message in query(prompt=prompt, options=options):
+    # Text deltas feed ``on_text`` as they arrive; a turn without deltas falls
+    # back to the complete AssistantMessage text.
+    saw_delta = False
+    # Tool calls waiting for their result, by tool_use_id.
+    pending_tools: Dict[str, Tuple[ToolCall, float]] = {}
+    async for message in transport.query(prompt, options):
+        profiling.mark("first_message")
+        if isinstance(message, StreamEvent):
+            event = message.event
+            delta = event.get("delta") or {}
+            if on_text and event.get("type") == "content_block_delta" and delta.get("type") == "text_delta":
+                profiling.mark("first_token")
+                if metrics and metrics.ttft_s is None:
+                    metrics.ttft_s = time.monotonic() - start
+                saw_delta = True
+                on_text(delta.get("text") or "")
+            continue
         if debug:
             elapsed = time.monotonic() - start
             msg_type = message.__class__.__name__
@@ -128,17 +176,36 @@ async def run_agent(
             for block in message.content:
                 text = getattr(block, "text", None)
                 if text:
+                    profiling.mark("first_token")
+                    if metrics and metrics.ttft_s is None:
+                        metrics.ttft_s = time.monotonic() - start
                     if not ui_enabled:
                         print(text, end="", flush=True)
+                    if on_text and not saw_delta:
+                        on_text(text)
                     output_chunks.append(text)
-                elif debug:
+                    continue
+                if metrics and isinstance(block, ToolUseBlock):
+                    call = ToolCall(name=block.name)
+                    metrics.tool_calls.append(call)
+                    pending_tools[block.id] = (call, time.monotonic())
+                if debug:
                     block_type = getattr(block, "type", block.__class__.__name__)
                     name = getattr(block, "name", None)
                     info = f"{block_type}"
                     if name:
                         info += f" name={name}"
                     print(f"[debug]   block: {info}", file=sys.stderr)
+            saw_delta = False
+        elif isinstance(message, UserMessage) and metrics and isinstance(message.content, list):
+            for block in message.content:
+                if isinstance(block, ToolResultBlock) and block.tool_use_id in pending_tools:
+                    call, called_at = pending_tools.pop(block.tool_use_id)
+                    call.duration_s = round(time.monotonic() - called_at, 4)
+                    call.is_error = bool(block.is_error)
         elif isinstance(message, ResultMessage):
+            if metrics:
+                metrics.record_result(message)
             if not ui_enabled:
                 print(f"\n\n[done] {message.subtype}")
             elif debug:
@@ -149,7 +216,99 @@ async def run_agent(
 
     spinner.stop()
 
-    return "".join(output_chunks)
+    response = "".join(output_chunks)
+    if metrics:
+        metrics.finish(time.monotonic() - start, response)
+    return response
+
+
+async def run_agent_cached(
+    prompt: str,
+    plan: MigrationPlan,
+    cache: Optional[ResponseCache],
+    refresh: bool,
+    debug: bool,
+    ui_enabled: bool,
+    spinner_enabled: bool,
+    log: Callable[[str], None] = print,
+    on_text: Optional[Callable[[str], None]] = None,
+    transport=None,
+    metrics_log: Optional[MetricsLog] = None,
+    followup: bool = False,
+) -> str:
+    """``run_agent`` with a lookup in the on-disk response cache first.
+
+    The key covers both prompts, the mode and the current contents of the
+    target and related files, so any edit to them forces a fresh call.
+    With ``metrics_log`` every request, cache hits included, is appended to it.
+    """
+    metrics = None
+    if metrics_log is not None:
+        metrics = RequestMetrics(
+            target=plan.target_path.as_posix(),
+            mode=plan.mode,
+            bundles=[bundle.id for bundle in plan.selection.selected],
+            transport=getattr(transport, "name", "live"),
+            followup=followup,
+            prompt_chars=len(plan.system_prompt) + len(prompt),
+        )
+
+    if cache is None:
+        with profiling.span("run_agent"):
+            response = await run_agent(
+                prompt,
+                plan.system_prompt,
+                plan.allowed_tools,
+                debug,
+                ui_enabled,
+                spinner_enabled,
+                on_text,
+                transport,
+                metrics,
+            )
+        if metrics_log is not None and metrics is not None:
+            metrics_log.append(metrics)
+        return response
+
+    key = cache.key_for(
+        plan.system_prompt,
+        prompt,
+        plan.mode,
+        [plan.target_path, *plan.related_files],
+    )
+    if not refresh:
+        with profiling.span("response_cache") as stage:
+            cached = cache.get(key)
+            stage.set(hit=cached is not None)
+        if cached is not None:
+            log(f"[cache] hit {key[:12]}")
+            if not ui_enabled:
+                print(cached)
+            if on_text:
+                on_text(cached)
+            if metrics_log is not None and metrics is not None:
+                metrics.cached = True
+                metrics.response_chars = len(cached)
+                metrics_log.append(metrics)
+            return cached
+
+    with profiling.span("run_agent"):
+        response = await run_agent(
+            prompt,
+            plan.system_prompt,
+            plan.allowed_tools,
+            debug,
+            ui_enabled,
+            spinner_enabled,
+            on_text,
+            transport,
+            metrics,
+        )
+    if metrics_log is not None and metrics is not None:
+        metrics_log.append(metrics)
+    if response:
+        cache.put(key, response, target=plan.target_path, mode=plan.mode)
+    return response
 
 
 def sync_newrelic_asset(
@@ -158,16 +317,17 @@ def sync_newrelic_asset(
     base: Optional[str],
     assets,
     binary_files: List[Path],
+    log: Callable[[str], None] = print,
 ) -> None:
     import shutil
 
     if not assets:
-        print("[newrelic] No reference assets available to sync.")
+        log("[newrelic] No reference assets available to sync.")
         return
 
     latest = pick_latest_asset(assets, base)
     if not latest:
-        print("[newrelic] Unable to determine latest asset.")
+        log("[newrelic] Unable to determine latest asset.")
         return
 
     candidate_targets = [
@@ -181,135 +341,322 @@ def sync_newrelic_asset(
         dest_dir = default_dir
 
     if dest_dir is None:
-        print("[newrelic] Target newrelic directory not found. Skipping asset sync.")
+        log("[newrelic] Target newrelic directory not found. Skipping asset sync.")
         return
 
     source_path = repo_root / latest.path
     if not source_path.exists():
-        print(f"[newrelic] Reference asset missing on disk: {source_path}")
+        log(f"[newrelic] Reference asset missing on disk: {source_path}")
         return
 
     dest_dir.mkdir(parents=True, exist_ok=True)
     dest_path = dest_dir / source_path.name
     if dest_path.exists():
-        print(f"[newrelic] Latest asset already present: {dest_path}")
+        log(f"[newrelic] Latest asset already present: {dest_path}")
         return
 
     shutil.copy2(source_path, dest_path)
-    print(f"[newrelic] Copied {source_path} -> {dest_path}")
-
-
-def parse_args() -> argparse.Namespace:
-    parser = argparse.ArgumentParser(description="Dockerfile migration agent")
-    parser.add_argument("--target", help="Path to Dockerfile to migrate")
-    parser.add_argument("--task", help="Migration task description")
-    parser.add_argument(
-        "--mode",
-        choices=["propose", "apply"],
-        default="propose",
-        help="propose: read-only; apply: allow edits",
-    )
-    parser.add_argument(
-        "--output",
-        help="Write extracted Dockerfile to this path",
-    )
-    parser.add_argument(
-        "--write",
-        action="store_true",
-        help="Write extracted files to default .migrated paths",
-    )
-    parser.add_argument(
-        "--backup",
-        action="store_true",
-        help="Create a .backup file next to the target before writing output",
-    )
-    parser.add_argument(
-        "--reference-glob",
-        action="append",
-        default=[],
-        help="Additional glob(s) to include in reference bundle",
-    )
-    parser.add_argument(
-        "--reference-group",
-        action="append",
-        default=[],
-        help="Force-include a knowledge bundle ID (use --list-reference-groups to see options)",
-    )
-    parser.add_argument(
-        "--knowledge-index",
-        help="Override knowledge index path (default: KNOWLEDGE_INDEX_PATH or knowledge/index.json)",
-    )
-    parser.add_argument(
-        "--list-reference-groups",
-        action="store_true",
-        help="List available reference group names and exit",
-    )
-    parser.add_argument(
-        "--base",
-        choices=["alpine", "debian"],
-        help="Override base selection when it cannot be inferred",
-    )
-    parser.add_argument(
-        "--no-related",
-        action="store_true",
-        help="Disable related file discovery",
-    )
-    parser.add_argument(
-        "--sync-newrelic",
-        action="store_true",
-        help="Copy latest New Relic tarball from references into the target repo when detected",
-    )
-    parser.add_argument(
-        "--print-system-prompt",
-        action="store_true",
-        help="Print system prompt and exit (debug)",
-    )
-    parser.add_argument(
-        "--debug",
-        action="store_true",
-        help="Print tool-call timing and event info to stderr",
-    )
-    parser.add_argument(
-        "--interactive",
-        action="store_true",
-        help="Prompt for follow-up requests after the first response",
-    )
-    parser.add_argument(
-        "--followup-context-chars",
-        type=int,
-        default=6000,
-        help="How many chars of the last response to include in follow-ups",
-    )
-    parser.add_argument(
-        "--ui",
-        dest="ui",
-        action="store_true",
-        help="Enable styled output and spinner",
-    )
-    parser.add_argument(
-        "--no-ui",
-        dest="ui",
-        action="store_false",
-        help="Disable styled output and spinner",
-    )
-    parser.set_defaults(ui=None)
-    parser.add_argument(
-        "--no-spinner",
-        action="store_true",
-        help="Disable loading spinner",
+    log(f"[newrelic] Copied {source_path} -> {dest_path}")
+
+
+def _prompt_base() -> str:
+    while True:
+        choice = input("Base image not clear. Choose base (alpine/debian): ").strip().lower()
+        if choice in {"alpine", "debian"}:
+            return choice
+        print("Please enter 'alpine' or 'debian'.")
+
+
+def prepare_migration(
+    config: AgentConfig,
+    knowledge_base: KnowledgeBase,
+    target_path: Path,
+    task: str,
+    mode: str,
+    base: Optional[str] = None,
+    reference_groups: Sequence[str] = (),
+    reference_globs: Sequence[str] = (),
+    include_related: bool = True,
+    sync_newrelic: bool = False,
+    choose_base: Optional[Callable[[], str]] = None,
+    log: Callable[[str], None] = print,
+    class_cache: Optional[FileClassCache] = None,
+    chunk_index: Optional[ChunkIndex] = None,
+    reference_cache: Optional[MutableMapping[Tuple, ReferenceBundle]] = None,
+) -> MigrationPlan:
+    """Run every local stage up to (but excluding) the LLM call for one target.
+
+    When the base image cannot be inferred, ``choose_base`` is asked for it;
+    without one the target fails instead of blocking on input.
+    ``reference_cache`` lets long-lived callers reuse loaded references for
+    the same bundles, counterparts and retrieval query; it is bypassed when
+    ``reference_globs`` add files outside the knowledge base.
+    """
+    error = ensure_exists(target_path)
+    if error:
+        raise SystemExit(error)
+
+    target_text = target_path.read_text(encoding="utf-8")
+    related_result = None
+    if include_related:
+        if class_cache is None:
+            class_cache = FileClassCache(config.resolve(config.file_class_cache_path))
+        with profiling.span("discover_related_files"):
+            related_result = discover_related_files(target_path, target_text, class_cache=class_cache)
+        for item in related_result.skipped:
+            log(f"[related] {item}")
+
+    requested_php_tag = detect_php_tag(task, "")
+    target_php_tag = detect_php_tag("", target_text)
+
+    base_override = base or detect_base(task, target_text)
+    if base_override is None:
+        if choose_base is None:
+            raise SystemExit("Base image not clear. Pass --base alpine|debian.")
+        base_override = choose_base()
+
+    with profiling.span("select_references"):
+        selection = select_references(
+            task=task,
+            target_path=target_path,
+            target_text=target_text,
+            bundles=knowledge_base.bundles,
+            base_override=base_override,
+            forced_groups=list(reference_groups),
+        )
+    if selection.selected:
+        log("[refs] " + ", ".join(bundle.id for bundle in selection.selected))
+    for warning in selection.warnings:
+        log(f"[warn] {warning}")
+
+    if chunk_index is None and config.reference_retrieval == "bm25":
+        with profiling.span("open_chunk_index"):
+            chunk_index = open_chunk_index(config)
+
+    counterparts = [target_path.name]
+    if related_result:
+        counterparts.extend(item.path.name for item in related_result.files)
+    query = query_terms(task, target_text) if chunk_index else set()
+    cache_key = None
+    if reference_cache is not None and not reference_globs:
+        cache_key = (
+            tuple(item.id for item in selection.selected),
+            tuple(sorted({name.lower() for name in counterparts})),
+            tuple(sorted(query)),
+        )
+    bundle = reference_cache.get(cache_key) if cache_key is not None else None
+    if bundle is None:
+        loader = loader_for(
+            config,
+            knowledge_base,
+            selection.selected,
+            globs=reference_globs,
+            counterparts=counterparts,
+            retriever=chunk_index,
+            query=query,
+        )
+        with profiling.span("ReferenceLoader.load") as stage:
+            bundle = loader.load()
+            stage.set(files=len(bundle.entries), chars=bundle.total_chars)
+        if cache_key is not None:
+            reference_cache[cache_key] = bundle
+    if config.reference_compaction != "off" and bundle.original_chars > bundle.total_chars:
+        log(
+            f"[refs] compacted {bundle.original_chars} -> {bundle.total_chars} chars "
+            f"({bundle.original_chars / max(bundle.total_chars, 1):.1f}x)"
+        )
+    if bundle.deduped_chars:
+        log(f"[refs] deduplicated {bundle.deduped_chars} chars of repeated references")
+    for item in bundle.dropped:
+        log(f"[refs] dropped {item.path}: {item.reason}")
+
+    with profiling.span("find_newrelic_assets"):
+        assets = find_newrelic_assets(config.repo_root, selection.selected, knowledge_base.compiled)
+    if sync_newrelic and related_result:
+        sync_newrelic_asset(
+            repo_root=config.repo_root,
+            target_path=target_path,
+            base=base_override,
+            assets=assets,
+            binary_files=related_result.binary_files,
+            log=log,
+        )
+    with profiling.span("build_system_prompt"):
+        prompt_segments = build_prompt_segments(bundle, selection, assets)
+        system_prompt = join_segments(prompt_segments)
+
+    allowed_tools = ["Read"]
+    if mode == "apply":
+        allowed_tools.append("Edit")
+
+    related_files = [item.path for item in related_result.files] if related_result else []
+    binary_files = related_result.binary_files if related_result else []
+    if include_related:
+        known_paths = {path.resolve() for path in related_files if path.exists()}
+        with profiling.span("discover_ci_files"):
+            ci_files = discover_ci_files(target_path)
+        for ci_file in ci_files:
+            resolved = ci_file.resolve()
+            if resolved in known_paths:
+                continue
+            related_files.append(ci_file)
+            known_paths.add(resolved)
+            log(f"[related] CI config added: {ci_file}")
+    user_prompt = build_user_prompt(
+        target_path,
+        task,
+        mode,
+        related_files,
+        binary_files,
+        requested_php_tag,
+        target_php_tag,
     )
-    parser.add_argument(
-        "--wizard",
-        action="store_true",
-        help="Interactive prompts for target/task/options",
+
+    return MigrationPlan(
+        target_path=target_path,
+        task=task,
+        mode=mode,
+        base=base_override,
+        selection=selection,
+        related_result=related_result,
+        related_files=related_files,
+        allowed_tools=allowed_tools,
+        prompt_segments=prompt_segments,
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        references=bundle,
     )
-    return parser.parse_args()
 
 
-def main() -> None:
+def _write_block(
+    block: FileBlock,
+    target_path: Path,
+    backup: bool,
+    log: Callable[[str], None],
+) -> Path:
+    source_path = resolve_output_path(target_path, block.path)
+    output_path = migrated_output_path(source_path)
+    if backup and source_path.exists():
+        backup_file = backup_path(source_path)
+        write_text(backup_file, source_path.read_text(encoding="utf-8"))
+        log(f"\n[backup] {backup_file}")
+    write_text(output_path, block.content)
+    log(f"\n[written] {output_path}")
+    return output_path
+
+
+class StreamingFileWriter:
+    """Write ``.migrated`` files while the response is still streaming.
+
+    Feed it response text through ``run_agent(on_text=...)``; each file block
+    is written, and a ``[written]`` line logged, once its closing fence
+    arrives.
+    """
+
+    def __init__(self, target_path: Path, backup: bool = False, log: Callable[[str], None] = print) -> None:
+        self.target_path = target_path
+        self.backup = backup
+        self.log = log
+        self.written: List[Path] = []
+        self._stream = FileBlockStream()
+
+    def feed(self, text: str) -> None:
+        self._write(self._stream.feed(text))
+
+    def finish(self) -> List[Path]:
+        """Flush the stream and return the files written since the last call."""
+        self._write(self._stream.finish())
+        self._stream = FileBlockStream()
+        written, self.written = self.written, []
+        return written
+
+    def _write(self, blocks: List[FileBlock]) -> None:
+        for block in blocks:
+            self.written.append(_write_block(block, self.target_path, self.backup, self.log))
+
+
+def write_outputs(
+    response: str,
+    target_path: Path,
+    output: Optional[Path] = None,
+    write: bool = False,
+    backup: bool = False,
+    log: Callable[[str], None] = print,
+    streamed: Optional[List[Path]] = None,
+) -> List[Path]:
+    """Write the files in ``response``.
+
+    ``streamed`` lists files a StreamingFileWriter already wrote for this
+    response; when it is non-empty nothing is rewritten.
+    """
+    if not (output or write):
+        return []
+    if streamed and not output:
+        return list(streamed)
+
+    fenced = parse_fenced_blocks(response)
+    blocks = extract_file_blocks(response, fenced)
+    if output:
+        dockerfile = parse_dockerfile_from_blocks(blocks) or extract_dockerfile(response, fenced)
+        if not dockerfile:
+            raise SystemExit("No Dockerfile code block found in response.")
+        if backup and output.exists():
+            backup_file = backup_path(output)
+            write_text(backup_file, output.read_text(encoding="utf-8"))
+            log(f"\n[backup] {backup_file}")
+        write_text(output, dockerfile)
+        log(f"\n[written] {output}")
+        return [output]
+
+    if not blocks:
+        dockerfile = extract_dockerfile(response, fenced)
+        if not dockerfile:
+            raise SystemExit("No Dockerfile code block found in response.")
+        output_path = default_output_path(target_path)
+        if backup and target_path.exists():
+            backup_file = backup_path(target_path)
+            write_text(backup_file, target_path.read_text(encoding="utf-8"))
+            log(f"\n[backup] {backup_file}")
+        write_text(output_path, dockerfile)
+        log(f"\n[written] {output_path}")
+        return [output_path]
+
+    return [_write_block(block, target_path, backup, log) for block in blocks]
+
+
+def main(args: Optional[argparse.Namespace] = None) -> None:
+    from dotenv import load_dotenv
+
     load_dotenv()
 
-    args = parse_args()
+    if args is None:
+        args = parse_args()
+    if args.profile is None and not args.profile_cprofile:
+        run(args)
+        return
+
+    profiler = profiling.enable(cpu=bool(args.profile_cprofile))
+    try:
+        run(args)
+    finally:
+        profiling.disable()
+        report_path = Path(args.profile) if args.profile not in (None, "-") else None
+        text = profiling.write_report(
+            profiler,
+            report_path,
+            Path(args.profile_cprofile) if args.profile_cprofile else None,
+        )
+        if report_path is None and args.profile == "-":
+            print(text, file=sys.stderr)
+        elif report_path is not None:
+            print(f"[profile] {report_path}", file=sys.stderr)
+        if args.profile_cprofile:
+            print(f"[profile] cProfile stats: {args.profile_cprofile} (python -m pstats)", file=sys.stderr)
+
+
+def run(args: argparse.Namespace) -> None:
+    import asyncio
+
     ui_enabled = args.ui if args.ui is not None else sys.stdout.isatty()
     color_enabled = ui_enabled and supports_color(sys.stdout)
 
@@ -376,162 +723,89 @@ def main() -> None:
         args.debug = args.debug or debug_choice == "y"
 
     config = AgentConfig()
-    knowledge_index_path = Path(args.knowledge_index) if args.knowledge_index else config.knowledge_index_path
-    knowledge_base = load_knowledge_base(config.repo_root, knowledge_index_path)
-
     if args.list_reference_groups:
-        for bundle_id in knowledge_base.bundle_ids:
-            print(bundle_id)
+        list_reference_groups(args.knowledge_index)
         return
     if not args.target or not args.task:
         raise SystemExit("Missing --target or --task. Use --wizard for interactive mode.")
 
-    target_path = Path(args.target)
-    error = ensure_exists(target_path)
-    if error:
-        raise SystemExit(error)
-
-    target_text = target_path.read_text(encoding="utf-8")
-    related_result = None
-    if not args.no_related:
-        related_result = discover_related_files(target_path, target_text)
-        for item in related_result.skipped:
-            print(f"[related] {item}")
-
-    requested_php_tag = detect_php_tag(args.task, "")
-    target_php_tag = detect_php_tag("", target_text)
-
-    base_override = args.base or detect_base(args.task, target_text)
-    if base_override is None:
-        while True:
-            choice = input("Base image not clear. Choose base (alpine/debian): ").strip().lower()
-            if choice in {"alpine", "debian"}:
-                base_override = choice
-                break
-            print("Please enter 'alpine' or 'debian'.")
-
-    selection = select_references(
-        task=args.task,
-        target_path=target_path,
-        target_text=target_text,
-        bundles=knowledge_base.bundles,
-        base_override=base_override,
-        forced_groups=args.reference_group,
-    )
-    if selection.selected:
-        print("[refs] " + ", ".join(bundle.id for bundle in selection.selected))
-    for warning in selection.warnings:
-        print(f"[warn] {warning}")
-
-    globs: List[str] = []
-    globs.extend(knowledge_base.global_reference_globs)
-    for selected_bundle in selection.selected:
-        globs.extend(selected_bundle.reference_globs)
-    globs.extend(args.reference_glob)
-    loader = ReferenceLoader(
-        repo_root=config.repo_root,
-        globs=globs,
-        max_total_chars=config.max_reference_chars_total,
-        max_chars_per_file=config.max_reference_chars_per_file,
-    )
-    bundle = loader.load()
-
-    assets = find_newrelic_assets(config.repo_root, selection.selected)
-    if args.sync_newrelic and related_result:
-        sync_newrelic_asset(
-            repo_root=config.repo_root,
-            target_path=target_path,
-            base=base_override,
-            assets=assets,
-            binary_files=related_result.binary_files,
+    knowledge_index_path = Path(args.knowledge_index) if args.knowledge_index else config.knowledge_index_path
+    with profiling.span("load_knowledge", cpu=True):
+        knowledge_base = load_knowledge(config, knowledge_index_path)
+
+    with profiling.span("prepare_migration", cpu=True):
+        plan = prepare_migration(
+            config=config,
+            knowledge_base=knowledge_base,
+            target_path=Path(args.target),
+            task=args.task,
+            mode=args.mode,
+            base=args.base,
+            reference_groups=args.reference_group,
+            reference_globs=args.reference_glob,
+            include_related=not args.no_related,
+            sync_newrelic=args.sync_newrelic,
+            choose_base=_prompt_base,
         )
-    system_prompt = build_system_prompt(bundle, selection, assets)
+    if args.prompt_segments or args.debug:
+        for line in describe_segments(plan.prompt_segments):
+            print(f"[prompt] {line}", file=sys.stderr)
+        for line in plan.references.compaction_report() if plan.references else []:
+            print(f"[compact] {line}", file=sys.stderr)
     if args.print_system_prompt:
-        print(system_prompt)
+        print(plan.system_prompt)
         return
 
-    if not os.getenv("ANTHROPIC_API_KEY"):
+    transport = open_transport(
+        config,
+        args.transport,
+        Path(args.recordings) if args.recordings else None,
+        args.replay_speed,
+    )
+    if transport.name != "replay" and not os.getenv("ANTHROPIC_API_KEY"):
         raise SystemExit("ANTHROPIC_API_KEY is not set. Add it to .env or your shell environment.")
 
-    allowed_tools = ["Read"]
-    if args.mode == "apply":
-        allowed_tools.append("Edit")
-
-    related_files = [item.path for item in related_result.files] if related_result else []
-    binary_files = related_result.binary_files if related_result else []
-    if not args.no_related:
-        known_paths = {path.resolve() for path in related_files if path.exists()}
-        for ci_file in discover_ci_files(target_path):
-            resolved = ci_file.resolve()
-            if resolved in known_paths:
-                continue
-            related_files.append(ci_file)
-            known_paths.add(resolved)
-            print(f"[related] CI config added: {ci_file}")
-    user_prompt = build_user_prompt(
-        target_path,
-        args.task,
-        args.mode,
-        related_files,
-        binary_files,
-        requested_php_tag,
-        target_php_tag,
-    )
-    def write_outputs(response: str) -> None:
-        if not (args.output or args.write):
-            return
-
-        blocks = extract_file_blocks(response)
-        if args.output:
-            output_path = Path(args.output)
-            dockerfile = parse_dockerfile_from_blocks(blocks) or extract_dockerfile(response)
-            if not dockerfile:
-                raise SystemExit("No Dockerfile code block found in response.")
-            if args.backup and output_path.exists():
-                backup_file = backup_path(output_path)
-                write_text(backup_file, output_path.read_text(encoding="utf-8"))
-                print(f"\n[backup] {backup_file}")
-            write_text(output_path, dockerfile)
-            print(f"\n[written] {output_path}")
-            return
-
-        if not blocks:
-            dockerfile = extract_dockerfile(response)
-            if not dockerfile:
-                raise SystemExit("No Dockerfile code block found in response.")
-            output_path = default_output_path(target_path)
-            if args.backup and target_path.exists():
-                backup_file = backup_path(target_path)
-                write_text(backup_file, target_path.read_text(encoding="utf-8"))
-                print(f"\n[backup] {backup_file}")
-            write_text(output_path, dockerfile)
-            print(f"\n[written] {output_path}")
-            return
+    # Only --write emits per-file outputs; --output waits for the whole Dockerfile.
+    streamer = None
+    if args.write and not args.output:
+        streamer = StreamingFileWriter(plan.target_path, backup=args.backup)
+
+    def emit(response: str) -> None:
+        with profiling.span("write_outputs", cpu=True):
+            write_outputs(
+                response,
+                plan.target_path,
+                output=Path(args.output) if args.output else None,
+                write=args.write,
+                backup=args.backup,
+                streamed=streamer.finish() if streamer else None,
+            )
 
-        for block in blocks:
-            source_path = resolve_output_path(target_path, block.path)
-            output_path = migrated_output_path(source_path)
-            if args.backup and source_path.exists():
-                backup_file = backup_path(source_path)
-                write_text(backup_file, source_path.read_text(encoding="utf-8"))
-                print(f"\n[backup] {backup_file}")
-            write_text(output_path, block.content)
-            print(f"\n[written] {output_path}")
+    # Apply mode edits files through tools, so replaying text would skip the edits.
+    # Record and replay must reach the transport, so they skip the cache too.
+    cache = None
+    if not args.no_cache and args.mode == "propose" and transport.name == "live":
+        cache = open_response_cache(config)
 
+    metrics_log = open_metrics_log(config)
     spinner_enabled = ui_enabled and not args.no_spinner
     response_text = asyncio.run(
-        run_agent(
-            user_prompt,
-            system_prompt,
-            allowed_tools,
+        run_agent_cached(
+            plan.user_prompt,
+            plan,
+            cache,
+            args.refresh,
             args.debug,
             ui_enabled,
             spinner_enabled,
+            on_text=streamer.feed if streamer else None,
+            transport=transport,
+            metrics_log=metrics_log,
         )
     )
     if ui_enabled:
         print(render_response(response_text, color_enabled))
-    write_outputs(response_text)
+    emit(response_text)
 
     if args.interactive:
         print("\n[interactive] Follow-up mode enabled. Press enter on empty input to finish.")
@@ -550,19 +824,23 @@ def main() -> None:
                 f"{context}\n"
             )
             last_response = asyncio.run(
-                run_agent(
+                run_agent_cached(
                     followup_prompt,
-                    system_prompt,
-                    allowed_tools,
+                    plan,
+                    cache,
+                    args.refresh,
                     args.debug,
                     ui_enabled,
                     spinner_enabled,
+                    on_text=streamer.feed if streamer else None,
+                    transport=transport,
+                    metrics_log=metrics_log,
+                    followup=True,
                 )
             )
             if ui_enabled:
                 print(render_response(last_response, color_enabled))
-            write_outputs(last_response)
-
+            emit(last_response)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from agent.config import AgentConfig
+
+GROUP_KEYS = ("bundles", "mode", "target", "transport")
+METRIC_FIELDS = ("ttft_s", "duration_s", "input_tokens", "output_tokens", "cache_read_tokens", "tokens_per_s", "cost_usd")
+
+
+@dataclass
+class ToolCall:
+    name: str
+    duration_s: Optional[float] = None
+    is_error: bool = False
+
+
+@dataclass
+class RequestMetrics:
+    """One model request: what was asked, how long it took and what it cost."""
+
+    target: str = ""
+    mode: str = ""
+    bundles: List[str] = field(default_factory=list)
+    transport: str = "live"
+    cached: bool = False
+    followup: bool = False
+    timestamp: float = field(default_factory=time.time)
+    status: Optional[str] = None
+    is_error: bool = False
+    ttft_s: Optional[float] = None
+    duration_s: Optional[float] = None
+    api_duration_s: Optional[float] = None
+    num_turns: Optional[int] = None
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_creation_tokens: int = 0
+    cost_usd: Optional[float] = None
+    tokens_per_s: Optional[float] = None
+    prompt_chars: int = 0
+    response_chars: int = 0
+    tool_calls: List[ToolCall] = field(default_factory=list)
+
+    def record_result(self, message: Any) -> None:
+        """Copy status, turns, usage and cost from the SDK ``ResultMessage``."""
+        usage = getattr(message, "usage", None) or {}
+        self.status = getattr(message, "subtype", None)
+        self.is_error = bool(getattr(message, "is_error", False))
+        self.num_turns = getattr(message, "num_turns", None)
+        duration_api_ms = getattr(message, "duration_api_ms", None)
+        self.api_duration_s = duration_api_ms / 1000 if duration_api_ms is not None else None
+        self.cost_usd = getattr(message, "total_cost_usd", None)
+        self.input_tokens = int(usage.get("input_tokens") or 0)
+        self.output_tokens = int(usage.get("output_tokens") or 0)
+        self.cache_read_tokens = int(usage.get("cache_read_input_tokens") or 0)
+        self.cache_creation_tokens = int(usage.get("cache_creation_input_tokens") or 0)
+
+    def finish(self, duration_s: float, response: str) -> None:
+        self.duration_s = round(duration_s, 4)
+        self.response_chars = len(response)
+        if self.ttft_s is not None:
+            self.ttft_s = round(self.ttft_s, 4)
+            generating = duration_s - self.ttft_s
+            if self.output_tokens and generating > 0:
+                self.tokens_per_s = round(self.output_tokens / generating, 1)
+
+
+@dataclass
+class MetricsLog:
+    """Append-only JSON-lines file of ``RequestMetrics``."""
+
+    path: Path
+
+    def append(self, metrics: RequestMetrics) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        line = json.dumps(asdict(metrics), separators=(",", ":")) + "\n"
+        # One write per record on an O_APPEND descriptor keeps concurrent writers from interleaving lines.
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+
+def open_metrics_log(config: AgentConfig) -> Optional[MetricsLog]:
+    """The configured metrics file, or ``None`` when ``METRICS_PATH`` is empty or ``off``."""
+    if config.metrics_path.strip().lower() in ("", "off"):
+        return None
+    return MetricsLog(config.resolve(Path(config.metrics_path)))
+
+
+def load_metrics(path: Path) -> List[Dict[str, Any]]:
+    records: List[Dict[str, Any]] = []
+    try:
+        handle = path.open(encoding="utf-8")
+    except OSError:
+        return records
+    with handle:
+        for line in handle:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                records.append(record)
+    return records
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile, ``None`` for no values."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def _group_key(record: Dict[str, Any], by: Tuple[str, ...]) -> str:
+    parts = []
+    for key in by:
+        value = record.get(key)
+        if isinstance(value, list):
+            value = "+".join(sorted(value)) or "-"
+        parts.append(str(value if value not in (None, "") else "-"))
+    return " | ".join(parts)
+
+
+def _stats(values: Iterable[Optional[float]]) -> Dict[str, Optional[float]]:
+    present = [float(value) for value in values if value is not None]
+    return {
+        "p50": percentile(present, 50),
+        "p95": percentile(present, 95),
+        "max": max(present) if present else None,
+    }
+
+
+def summarize(records: List[Dict[str, Any]], by: Tuple[str, ...] = ("bundles", "mode")) -> Dict[str, Any]:
+    """Percentiles per group for the model requests (cache hits are only counted)."""
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        groups.setdefault(_group_key(record, by), []).append(record)
+
+    summary: Dict[str, Any] = {}
+    for name in sorted(groups):
+        items = groups[name]
+        live = [item for item in items if not item.get("cached")]
+        tools: Dict[str, List[Optional[float]]] = {}
+        for item in live:
+            for call in item.get("tool_calls") or []:
+                tools.setdefault(str(call.get("name")), []).append(call.get("duration_s"))
+        summary[name] = {
+            "requests": len(items),
+            "cache_hits": len(items) - len(live),
+            "errors": sum(1 for item in live if item.get("is_error")),
+            "cost_usd": round(sum(item.get("cost_usd") or 0.0 for item in live), 4),
+            "metrics": {metric: _stats(item.get(metric) for item in live) for metric in METRIC_FIELDS},
+            "tools": {
+                tool: {"calls": len(durations), **_stats(durations)} for tool, durations in sorted(tools.items())
+            },
+        }
+    return summary
+
+
+def _fmt(value: Optional[float], digits: int = 2) -> str:
+    if value is None:
+        return "-"
+    return f"{value:.{digits}f}" if isinstance(value, float) and not value.is_integer() else f"{value:.0f}"
+
+
+def _print_summary(summary: Dict[str, Any], by: Tuple[str, ...]) -> None:
+    print(f"Grouped by: {', '.join(by)}")
+    for name, group in summary.items():
+        print(
+            f"\n{name}: {group['requests']} request(s), {group['cache_hits']} cache hit(s), "
+            f"{group['errors']} error(s), ${group['cost_usd']:.4f}"
+        )
+        print(f"  {'metric':<18} {'p50':>10} {'p95':>10} {'max':>10}")
+        for metric, stats in group["metrics"].items():
+            if stats["max"] is None:
+                continue
+            digits = 4 if metric == "cost_usd" else 2
+            print(
+                f"  {metric:<18} {_fmt(stats['p50'], digits):>10} {_fmt(stats['p95'], digits):>10} "
+                f"{_fmt(stats['max'], digits):>10}"
+            )
+        for tool, stats in group["tools"].items():
+            print(
+                f"  tool {tool:<13} {_fmt(stats['p50'], 3):>10} {_fmt(stats['p95'], 3):>10} "
+                f"{_fmt(stats['max'], 3):>10}  ({stats['calls']} calls, s)"
+            )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Summarise per-request LLM metrics")
+    parser.add_argument("--path", help="Metrics file (default: METRICS_PATH or .cache/llm-metrics.jsonl)")
+    parser.add_argument(
+        "--by",
+        action="append",
+        choices=GROUP_KEYS,
+        help="Group by these fields (repeatable; default: bundles and mode)",
+    )
+    parser.add_argument("--since-hours", type=float, help="Only requests from the last N hours")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    config = AgentConfig()
+    metrics_log = open_metrics_log(config)
+    if args.path:
+        path = Path(args.path)
+    elif metrics_log is not None:
+        path = metrics_log.path
+    else:
+        raise SystemExit("Metrics are disabled (METRICS_PATH is off); pass --path.")
+    records = load_metrics(path)
+    if args.since_hours is not None:
+        cutoff = time.time() - args.since_hours * 3600
+        records = [item for item in records if (item.get("timestamp") or 0) >= cutoff]
+    if not records:
+        print(f"No metrics in {path}")
+        return 1
+
+    by = tuple(args.by or ("bundles", "mode"))
+    summary = summarize(records, by)
+    if args.json:
+        print(json.dumps({"path": str(path), "requests": len(records), "by": list(by), "groups": summary}, indent=2))
+    else:
+        print(f"Metrics: {path} ({len(records)} requests)")
+        _print_summary(summary, by)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
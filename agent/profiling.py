@@ -0,0 +1,169 @@
+import cProfile
+import json
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    duration: Optional[float] = None
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    marks: Dict[str, float] = field(default_factory=dict)
+    children: List["Span"] = field(default_factory=list)
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "ms": round((self.duration or 0.0) * 1000, 3),
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.marks:
+            data["marks_ms"] = {name: round((at - self.start) * 1000, 3) for name, at in self.marks.items()}
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+class Profiler:
+    """Collects a tree of timed spans and, optionally, cProfile stats for spans marked ``cpu``."""
+
+    def __init__(self, cpu: bool = False) -> None:
+        self.root = Span(name="run", start=time.perf_counter())
+        self.cpu = cProfile.Profile() if cpu else None
+        self._cpu_depth = 0
+
+    def cpu_enter(self) -> None:
+        if self.cpu is not None:
+            if self._cpu_depth == 0:
+                self.cpu.enable()
+            self._cpu_depth += 1
+
+    def cpu_exit(self) -> None:
+        if self.cpu is not None and self._cpu_depth:
+            self._cpu_depth -= 1
+            if self._cpu_depth == 0:
+                self.cpu.disable()
+
+    def report(self) -> Dict[str, Any]:
+        if self.root.duration is None:
+            self.root.duration = time.perf_counter() - self.root.start
+        totals: Dict[str, Dict[str, float]] = {}
+
+        def visit(span: Span) -> None:
+            for child in span.children:
+                entry = totals.setdefault(child.name, {"count": 0, "ms": 0.0})
+                entry["count"] += 1
+                entry["ms"] = round(entry["ms"] + (child.duration or 0.0) * 1000, 3)
+                visit(child)
+
+        visit(self.root)
+        return {"tree": self.root.to_dict(self.root.start), "totals": totals}
+
+
+_profiler: Optional[Profiler] = None
+_current: ContextVar[Optional[Span]] = ContextVar("profiling_span", default=None)
+
+
+class _NullSpan:
+    """What ``span`` returns while profiling is off: enter/exit do nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _ActiveSpan:
+    __slots__ = ("profiler", "span", "cpu", "token")
+
+    def __init__(self, profiler: Profiler, name: str, cpu: bool) -> None:
+        self.profiler = profiler
+        self.span = Span(name=name, start=0.0)
+        self.cpu = cpu
+        self.token = None
+
+    def __enter__(self) -> "_ActiveSpan":
+        parent = _current.get() or self.profiler.root
+        parent.children.append(self.span)
+        self.token = _current.set(self.span)
+        if self.cpu:
+            self.profiler.cpu_enter()
+        self.span.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.span.duration = time.perf_counter() - self.span.start
+        if self.cpu:
+            self.profiler.cpu_exit()
+        if exc_type is not None:
+            self.span.attrs["error"] = exc_type.__name__
+        _current.reset(self.token)
+        return False
+
+    def set(self, **attrs: Any) -> None:
+        self.span.attrs.update(attrs)
+
+
+def span(name: str, cpu: bool = False):
+    """Time the ``with`` block as a child of the enclosing span.
+
+    ``cpu=True`` also runs the block under cProfile when it was requested.
+    With profiling disabled this returns a shared no-op object, so
+    instrumented code pays one global lookup per span.
+    """
+    profiler = _profiler
+    if profiler is None:
+        return _NULL_SPAN
+    return _ActiveSpan(profiler, name, cpu)
+
+
+def mark(name: str) -> None:
+    """Record a point in time (e.g. first token) on the enclosing span; the first mark of a name wins."""
+    if _profiler is None:
+        return
+    current = _current.get() or _profiler.root
+    current.marks.setdefault(name, time.perf_counter())
+
+
+def enable(cpu: bool = False) -> Profiler:
+    global _profiler
+    _profiler = Profiler(cpu=cpu)
+    return _profiler
+
+
+def disable() -> Optional[Profiler]:
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.root.duration = time.perf_counter() - profiler.root.start
+        if profiler.cpu is not None:
+            profiler.cpu.disable()
+    return profiler
+
+
+def write_report(profiler: Profiler, path: Optional[Path], cprofile_path: Optional[Path] = None) -> str:
+    """Write the timing tree as JSON to ``path`` (or return it for stderr) and dump cProfile stats."""
+    text = json.dumps(profiler.report(), indent=2)
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text + "\n", encoding="utf-8")
+    if cprofile_path is not None and profiler.cpu is not None:
+        cprofile_path.parent.mkdir(parents=True, exist_ok=True)
+        profiler.cpu.dump_stats(str(cprofile_path))
+    return text
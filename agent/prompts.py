@@ -1,33 +1,27 @@
-from pathlib import Path
-from typing import List
+import hashlib
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional
 
-from agent.context.reference_loader import ReferenceBundle
+from agent.context.compaction import code_fence_lang
+from agent.context.reference_loader import ReferenceBundle, ReferenceEntry
 from agent.reference_assets import ReferenceAsset
 from agent.reference_selection import SelectionResult
 
+MAX_CACHE_BREAKPOINTS = 4
 
-def _code_fence_lang(path: Path) -> str:
-    name = path.name
-    suffix = path.suffix.lower()
 
-    if name == "Dockerfile" or suffix == ".dockerfile":
-        return "dockerfile"
-    if suffix in {".sh"}:
-        return "bash"
-    if suffix in {".yml", ".yaml"}:
-        return "yaml"
-    if suffix in {".md"}:
-        return "markdown"
-    if suffix in {".ini", ".conf", ".cf", ".template"}:
-        return "ini"
-    return "text"
+@dataclass(frozen=True)
+class PromptSegment:
+    name: str
+    text: str
+    cache_breakpoint: bool = False
 
+    @property
+    def digest(self) -> str:
+        return hashlib.sha256(self.text.encode("utf-8")).hexdigest()[:12]
 
-def build_system_prompt(
-    bundle: ReferenceBundle,
-    selection: SelectionResult,
-    assets: List[ReferenceAsset],
-) -> str:
+
+def _rules_segment() -> PromptSegment:
     parts: List[str] = []
     parts.append("You are a Dockerfile migration agent for this repository.")
     parts.append("Follow the established patterns in the reference files below.")
@@ -35,6 +29,49 @@ def build_system_prompt(
     parts.append("Do not invent new tools or practices without clear evidence in references.")
     parts.append("Do not include binary file contents in responses.")
     parts.append("")
+    parts.append("Migration rules:")
+    parts.append("- Preserve multi-stage structure and base image conventions.")
+    parts.append("- Keep version pinning and local New Relic tarball usage if present.")
+    parts.append("- If the user specifies a PHP version, follow it even if references differ.")
+    parts.append("- If no PHP version is specified, preserve the target Dockerfile's PHP version.")
+    parts.append("- Update Dockerfile-related files (entrypoint/supervisor/php configs) when they are part of the migration.")
+    parts.append("- Prefer minimal, targeted changes aligned with the references.")
+    parts.append("- If you cannot find a pattern, ask for guidance rather than guessing.")
+    parts.append("")
+    parts.append("When responding:")
+    parts.append("- Explain what will change and why.")
+    parts.append("- Provide each changed file in a full code block.")
+    parts.append("- Use `file: <relative/path>` fence info for non-Dockerfile files.")
+    parts.append("- Call out risks and required follow-up actions only when necessary.")
+    return PromptSegment(name="rules", text="\n".join(parts))
+
+
+def _reference_segment(name: str, entries: List[ReferenceEntry]) -> PromptSegment:
+    parts: List[str] = []
+    for entry in entries:
+        if entry.diff_base:
+            parts.append(f"### Reference: {entry.path.as_posix()} (diff against {entry.diff_base.as_posix()})")
+            parts.append("```diff")
+        else:
+            note = f" ({entry.note})" if entry.note else ""
+            parts.append(f"### Reference: {entry.path.as_posix()}{note}")
+            parts.append(f"```{code_fence_lang(entry.path)}")
+        parts.append(entry.content)
+        parts.append("```")
+        if entry.aliases:
+            parts.append("Identical copies: " + ", ".join(alias.as_posix() for alias in entry.aliases))
+        if entry.truncated:
+            parts.append("(reference truncated)")
+        parts.append("")
+    return PromptSegment(name=name, text="\n".join(parts).rstrip("\n"))
+
+
+def _run_segment(
+    bundle: ReferenceBundle,
+    selection: SelectionResult,
+    assets: List[ReferenceAsset],
+) -> PromptSegment:
+    parts: List[str] = []
     parts.append(
         f"Selected base: {selection.base or 'unknown'} | "
         f"stack: {selection.stack or 'unknown'} | "
@@ -51,34 +88,81 @@ def build_system_prompt(
             suffix = "musl" if asset.is_musl else "glibc"
             version = ".".join(str(p) for p in asset.version) if asset.version else "unknown"
             parts.append(f"- {asset.path.as_posix()} (version {version}, {suffix})")
-    parts.append("")
 
     if not bundle.entries:
+        parts.append("")
         parts.append("No reference files were loaded. Be conservative and ask for clarification.")
+    extras = [entry for entry in bundle.entries if entry.per_run]
+    if extras:
         parts.append("")
+        parts.append("Target-specific references:")
+        parts.append(_reference_segment("run", extras).text)
+    return PromptSegment(name="run", text="\n".join(parts))
+
 
+def build_prompt_segments(
+    bundle: ReferenceBundle,
+    selection: SelectionResult,
+    assets: List[ReferenceAsset],
+) -> List[PromptSegment]:
+    """Split the system prompt into segments ordered from most to least stable.
+
+    Static rules come first, then the global references, then one block per
+    bundle (golden bundles before stacks, each sorted by id) and finally the
+    per-run values, including references chosen for this target. Runs
+    sharing a bundle combination therefore share a byte-identical prefix
+    that provider-side prompt caching can reuse.
+    """
+    by_group: Dict[Optional[str], List[ReferenceEntry]] = {}
     for entry in bundle.entries:
-        parts.append(f"### Reference: {entry.path.as_posix()}")
-        parts.append(f"```{_code_fence_lang(entry.path)}")
-        parts.append(entry.content)
-        parts.append("```")
-        if entry.truncated:
-            parts.append("(reference truncated)")
-        parts.append("")
+        if not entry.per_run:
+            by_group.setdefault(entry.group, []).append(entry)
+
+    selected = sorted(
+        (item for item in selection.selected if item.id in by_group),
+        key=lambda item: (0 if item.stack == "golden" or "golden" in item.tags else 1, item.id),
+    )
+    ordered: List[Optional[str]] = ["global", *(item.id for item in selected)]
+    ordered.extend(sorted((name for name in by_group if name and name not in ordered)))
+    if None in by_group:
+        ordered.append(None)
+
+    segments: List[PromptSegment] = [_rules_segment()]
+    for name in ordered:
+        entries = by_group.get(name)
+        if entries:
+            label = "references" if name is None else f"references:{name}"
+            segments.append(_reference_segment(label, entries))
+
+    # Each stable segment ends in a breakpoint; the Messages API honours at
+    # most four per request, so the longest prefixes win.
+    stable = [index for index, segment in enumerate(segments) if segment.name != "references"]
+    for index in stable[-MAX_CACHE_BREAKPOINTS:]:
+        segments[index] = replace(segments[index], cache_breakpoint=True)
+
+    segments.append(_run_segment(bundle, selection, assets))
+    return segments
 
-    parts.append("Migration rules:")
-    parts.append("- Preserve multi-stage structure and base image conventions.")
-    parts.append("- Keep version pinning and local New Relic tarball usage if present.")
-    parts.append("- If the user specifies a PHP version, follow it even if references differ.")
-    parts.append("- If no PHP version is specified, preserve the target Dockerfile's PHP version.")
-    parts.append("- Update Dockerfile-related files (entrypoint/supervisor/php configs) when they are part of the migration.")
-    parts.append("- Prefer minimal, targeted changes aligned with the references.")
-    parts.append("- If you cannot find a pattern, ask for guidance rather than guessing.")
-    parts.append("")
-    parts.append("When responding:")
-    parts.append("- Explain what will change and why.")
-    parts.append("- Provide each changed file in a full code block.")
-    parts.append("- Use `file: <relative/path>` fence info for non-Dockerfile files.")
-    parts.append("- Call out risks and required follow-up actions only when necessary.")
 
-    return "\n".join(parts)
+def join_segments(segments: List[PromptSegment]) -> str:
+    return "\n\n".join(segment.text for segment in segments)
+
+
+def describe_segments(segments: List[PromptSegment]) -> List[str]:
+    lines: List[str] = []
+    offset = 0
+    for segment in segments:
+        marker = " [cache]" if segment.cache_breakpoint else ""
+        lines.append(
+            f"{segment.name} sha={segment.digest} chars={len(segment.text)} offset={offset}{marker}"
+        )
+        offset += len(segment.text) + 2
+    return lines
+
+
+def build_system_prompt(
+    bundle: ReferenceBundle,
+    selection: SelectionResult,
+    assets: List[ReferenceAsset],
+) -> str:
+    return join_segments(build_prompt_segments(bundle, selection, assets))
@@ -1,10 +1,14 @@
 import re
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List, Optional, Tuple
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
 
+from agent.globbing import expand_patterns
 from agent.knowledge_base import KnowledgeBundle
 
+if TYPE_CHECKING:
+    from agent.knowledge_artifact import CompiledKnowledge
+
 
 @dataclass(frozen=True)
 class ReferenceAsset:
@@ -30,14 +34,24 @@ def _asset_from_path(path: Path) -> ReferenceAsset:
     return ReferenceAsset(path=path, version=version, is_musl=is_musl)
 
 
-def find_newrelic_assets(repo_root: Path, bundles: Iterable[KnowledgeBundle]) -> List[ReferenceAsset]:
+def find_newrelic_assets(
+    repo_root: Path,
+    bundles: Iterable[KnowledgeBundle],
+    compiled: Optional["CompiledKnowledge"] = None,
+) -> List[ReferenceAsset]:
     assets: List[ReferenceAsset] = []
     seen: set[Path] = set()
+    bundles = list(bundles)
+    patterns = [pattern for bundle in bundles for pattern in bundle.asset_globs]
+    expanded = {} if compiled else expand_patterns(repo_root, patterns)
 
     for bundle in bundles:
         for pattern in bundle.asset_globs:
-            for path in repo_root.glob(pattern):
-                if not path.is_file() or "newrelic-php5-" not in path.name:
+            matches = compiled.glob(pattern) if compiled else None
+            if matches is None:
+                matches = expanded.get(pattern) or expand_patterns(repo_root, [pattern])[pattern]
+            for path in matches:
+                if "newrelic-php5-" not in path.name:
                     continue
                 rel = path.relative_to(repo_root)
                 if rel in seen:
@@ -4,6 +4,7 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import List, Optional
 
+from agent.dockerfile import parse_dockerfile
 from agent.knowledge_base import KnowledgeBundle
 
 
@@ -16,6 +17,14 @@ class SelectionResult:
     warnings: List[str]
 
 
+_PHP_VERSION_PATTERNS = (
+    re.compile(r"php\s*([0-9]+\.[0-9]+)"),
+    re.compile(r"php\s*([0-9]{2})\b"),
+    re.compile(r"php([0-9]{2})\b"),
+)
+_PHP_IMAGE_TAG = re.compile(r"^([0-9]+\.[0-9]+)")
+
+
 def detect_base(task: str, target_text: str) -> Optional[str]:
     task_lower = task.lower()
     if "alpine" in task_lower:
@@ -23,9 +32,12 @@ def detect_base(task: str, target_text: str) -> Optional[str]:
     if "debian" in task_lower:
         return "debian"
 
-    text = target_text.lower()
-    alpine = bool(re.search(r"^from\s+.*alpine", text, re.MULTILINE)) or "apk add" in text
-    debian = bool(re.search(r"^from\s+.*debian", text, re.MULTILINE)) or "apt-get" in text
+    ast = parse_dockerfile(target_text)
+    from_lines = [item.text.lower() for item in ast.by_keyword("FROM")]
+    from_lines.extend(stage.image.lower() for stage in ast.stages)
+    run_text = "\n".join(item.raw.lower() for item in ast.by_keyword("RUN"))
+    alpine = any("alpine" in line for line in from_lines) or "apk add" in run_text
+    debian = any("debian" in line for line in from_lines) or "apt-get" in run_text
 
     if alpine and not debian:
         return "alpine"
@@ -38,7 +50,7 @@ def detect_base(task: str, target_text: str) -> Optional[str]:
 def detect_stack(task: str, target_path: Path, target_text: str) -> Optional[str]:
     task_lower = task.lower()
     path_lower = target_path.as_posix().lower()
-    text_lower = target_text.lower()
+    text_lower = parse_dockerfile(target_text).lower_text
 
     if "laravel" in task_lower or "laravel" in path_lower or "laravel" in text_lower:
         return "laravel"
@@ -55,18 +67,21 @@ def detect_stack(task: str, target_path: Path, target_text: str) -> Optional[str
 
 
 def detect_php_tag(task: str, target_text: str) -> Optional[str]:
-    text = f"{task}\n{target_text}".lower()
-    match = re.search(r"php\s*([0-9]+\.[0-9]+)", text)
-    if match:
-        return _normalize_php_tag(match.group(1))
-
-    match = re.search(r"php\s*([0-9]{2})\b", text)
-    if match:
-        return _normalize_php_tag(match.group(1))
-
-    match = re.search(r"php([0-9]{2})\b", text)
-    if match:
-        return _normalize_php_tag(match.group(1))
+    task_lower = task.lower()
+    ast = parse_dockerfile(target_text)
+    for pattern in _PHP_VERSION_PATTERNS:
+        for text in (task_lower, ast.lower_text):
+            match = pattern.search(text)
+            if match:
+                return _normalize_php_tag(match.group(1))
+
+    # Official images carry the version in the tag, e.g. ``php:${PHP_VERSION}-fpm``
+    # once ARG values are substituted.
+    for stage in ast.stages:
+        if stage.repository.lower().endswith("php") and stage.tag:
+            match = _PHP_IMAGE_TAG.match(stage.tag)
+            if match:
+                return _normalize_php_tag(match.group(1))
 
     return None
 
@@ -122,7 +137,7 @@ def _score_bundle(
     return score
 
 
-def _is_golden(bundle: KnowledgeBundle) -> bool:
+def is_golden(bundle: KnowledgeBundle) -> bool:
     return bundle.stack == "golden" or "golden" in bundle.tags
 
 
@@ -154,14 +169,14 @@ def select_references(
 
     if base:
         golden_candidates = [
-            bundle for bundle in bundles if _is_golden(bundle) and bundle.base_os == base
+            bundle for bundle in bundles if is_golden(bundle) and bundle.base_os == base
         ]
         if golden_candidates:
             golden = sorted(golden_candidates, key=lambda item: item.priority, reverse=True)[0]
             if golden not in selected:
                 selected.append(golden)
 
-    non_golden = [bundle for bundle in bundles if not _is_golden(bundle)]
+    non_golden = [bundle for bundle in bundles if not is_golden(bundle)]
     ranked = sorted(
         non_golden,
         key=lambda item: _score_bundle(item, target_rel, stack, base, php_tag),
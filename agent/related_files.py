@@ -1,9 +1,13 @@
+import codecs
 import json
-import re
-import shlex
+import os
+from collections import deque
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional, Sequence, Tuple
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from agent.dockerfile import parse_dockerfile
+from agent.dockerignore import DockerIgnore, clean_pattern, glob_context
 
 
 @dataclass
@@ -21,135 +25,290 @@ class RelatedFilesResult:
     binary_files: List[Path]
 
 
-def _join_lines(dockerfile_text: str) -> List[str]:
-    lines: List[str] = []
-    buffer = ""
-    for raw in dockerfile_text.splitlines():
-        stripped = raw.strip()
-        if not stripped or stripped.startswith("#"):
-            continue
-        if stripped.endswith("\\"):
-            buffer += stripped[:-1] + " "
-            continue
-        buffer += stripped
-        lines.append(buffer)
-        buffer = ""
-    if buffer:
-        lines.append(buffer)
-    return lines
+BINARY_SUFFIXES = {
+    ".7z", ".apk", ".bin", ".bz2", ".class", ".deb", ".dll", ".exe", ".gif", ".gz",
+    ".ico", ".jar", ".jpeg", ".jpg", ".mo", ".o", ".otf", ".pdf", ".phar", ".png",
+    ".pyc", ".so", ".tar", ".tgz", ".ttf", ".webp", ".whl", ".woff", ".woff2", ".xz",
+    ".zip", ".zst",
+}
 
+MAGIC_NUMBERS = (
+    b"\x1f\x8b",  # gzip
+    b"PK\x03\x04",  # zip, jar, whl
+    b"\x7fELF",
+    b"\x89PNG",
+    b"%PDF",
+    b"BZh",
+    b"\xfd7zXZ\x00",
+    b"\x28\xb5\x2f\xfd",  # zstd
+    b"7z\xbc\xaf",
+    b"GIF8",
+    b"\xff\xd8\xff",  # jpeg
+    b"\xca\xfe\xba\xbe",  # java class / mach-o fat
+)
 
-def _parse_copy_sources(line: str) -> Tuple[List[str], Optional[str]]:
-    match = re.match(r"^(COPY|ADD)\s+(.+)$", line, re.IGNORECASE)
-    if not match:
-        return [], None
+SNIFF_CHUNK_BYTES = 8192
+SNIFF_MAX_BYTES = 65536
 
-    payload = match.group(2).strip()
-    has_from = "--from=" in payload
 
-    json_start = payload.find("[")
-    json_end = payload.rfind("]")
-    if json_start != -1 and json_end != -1 and json_end > json_start:
-        try:
-            json_payload = payload[json_start : json_end + 1]
-            items = json.loads(json_payload)
-            if not isinstance(items, list) or len(items) < 2:
-                return [], None
-            if has_from:
-                return [], None
-            return items[:-1], "json"
-        except json.JSONDecodeError:
-            return [], None
+def _is_probably_binary(path: Path) -> bool:
+    """Classify a file from its suffix, magic number and a bounded prefix.
 
+    At most ``SNIFF_MAX_BYTES`` are read, in chunks, so the cost does not
+    depend on the file size.
+    """
+    if "".join(path.suffixes[-2:]).lower() == ".tar.gz" or path.suffix.lower() in BINARY_SUFFIXES:
+        return True
+    decoder = codecs.getincrementaldecoder("utf-8")()
     try:
-        tokens = shlex.split(payload, comments=False, posix=True)
-    except ValueError:
-        return [], None
+        with path.open("rb") as handle:
+            read = 0
+            while read < SNIFF_MAX_BYTES:
+                chunk = handle.read(SNIFF_CHUNK_BYTES)
+                if not chunk:
+                    decoder.decode(b"", final=True)
+                    return False
+                if read == 0 and chunk.startswith(MAGIC_NUMBERS):
+                    return True
+                if b"\x00" in chunk:
+                    return True
+                decoder.decode(chunk)
+                read += len(chunk)
+    except UnicodeDecodeError:
+        return True
+    except Exception:
+        return True
+    return False
 
-    if any(token.startswith("--from=") for token in tokens):
-        return [], None
 
-    tokens = [t for t in tokens if not t.startswith("--")]
-    if len(tokens) < 2:
-        return [], None
+class FileClassCache:
+    """Persistent (path, size, mtime) -> binary/text classification cache.
 
-    return tokens[:-1], "shell"
+    Stored as one JSON file; an entry is reused only while the file's size
+    and mtime are unchanged, so repeated discovery over the same trees skips
+    content reads entirely.
+    """
 
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = path
+        self._entries: Dict[str, List] = {}
+        self._dirty = False
+        if path is not None:
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                if isinstance(data, dict):
+                    self._entries = data
+            except (OSError, ValueError):
+                self._entries = {}
 
-def _is_probably_binary(path: Path) -> bool:
-    try:
-        data = path.read_bytes()
-    except Exception:
-        return True
-    if b"\x00" in data[:1024]:
-        return True
-    try:
-        data.decode("utf-8")
-        return False
-    except UnicodeDecodeError:
-        return True
+    def is_binary(self, path: Path, stat: os.stat_result) -> bool:
+        key = str(path.resolve())
+        cached = self._entries.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return bool(cached[2])
+        is_binary = _is_probably_binary(path)
+        self._entries[key] = [stat.st_size, stat.st_mtime_ns, is_binary]
+        self._dirty = True
+        return is_binary
 
+    def save(self) -> None:
+        if self.path is None or not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(self._entries), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+        self._dirty = False
 
-def _expand_source(source: str, base_dir: Path) -> List[Path]:
+
+def _context_rel(path: Path, base_dir: Path) -> Optional[str]:
+    """``path`` relative to the build context, or None when ``..`` takes it outside."""
+    rel = Path(os.path.relpath(path, base_dir)).as_posix()
+    return None if rel == ".." or rel.startswith("../") else rel
+
+
+def _expand_source(source: str, base_dir: Path, ignore: DockerIgnore) -> List[Path]:
     if source.startswith("http://") or source.startswith("https://"):
         return []
-    cleaned = source.lstrip("/")
+    cleaned = clean_pattern(source)
     if any(char in cleaned for char in "*?["):
-        return [p for p in base_dir.glob(cleaned) if p.is_file()]
+        return glob_context(base_dir, cleaned, ignore)
     path = base_dir / cleaned
     return [path] if path.exists() else []
 
 
+CONFIG_SUFFIXES = {
+    ".cf", ".cnf", ".conf", ".env", ".ini", ".json", ".properties", ".template", ".toml",
+    ".xml", ".yaml", ".yml",
+}
+CONFIG_NAMES = {".bashrc", ".profile", ".vimrc", "bashrc", "crontab", "vimrc"}
+SCRIPT_SUFFIXES = {".bash", ".ksh", ".pl", ".py", ".rb", ".sh", ".zsh"}
+SKIPPED_SUFFIXES = {".bak", ".lock", ".log", ".map", ".pid", ".sock", ".swp", ".tmp"}
+SKIPPED_DIRS = {".git", ".hg", ".svn", "__pycache__"}
+
+
+def _directory_priority(name: str) -> int:
+    """Lower is earlier: configs, then scripts, then other text, then binaries."""
+    suffix = os.path.splitext(name)[1].lower()
+    if suffix in CONFIG_SUFFIXES or name in CONFIG_NAMES:
+        return 0
+    if suffix in SCRIPT_SUFFIXES or "entrypoint" in name.lower():
+        return 1
+    if suffix in BINARY_SUFFIXES:
+        return 3
+    return 2
+
+
+def _walk_directory(
+    root: Path,
+    base_dir: Path,
+    ignore: DockerIgnore,
+    max_entries: int,
+) -> Tuple[List[Tuple[Path, int]], bool]:
+    """List files under a COPY'd directory, best candidates first.
+
+    Breadth-first ``os.scandir`` walk that prunes ignored and VCS
+    directories and stops after ``max_entries`` directory entries. Returns
+    ``(path, size)`` pairs ordered by priority, depth and path, plus whether
+    the scan budget cut the walk short.
+    """
+    found: List[Tuple[int, int, str, Path, int]] = []
+    queue: Deque[Tuple[Path, int]] = deque([(root, 0)])
+    scanned = 0
+    while queue:
+        directory, depth = queue.popleft()
+        try:
+            iterator = os.scandir(directory)
+        except OSError:
+            continue
+        with iterator as entries:
+            for entry in entries:
+                scanned += 1
+                if scanned > max_entries:
+                    found.sort()
+                    return [(path, size) for _, _, _, path, size in found], True
+                path = Path(entry.path)
+                rel = _context_rel(path, base_dir)
+                if rel is None:
+                    continue
+                try:
+                    if entry.is_dir():
+                        if entry.name not in SKIPPED_DIRS and not ignore.can_prune(rel):
+                            queue.append((path, depth + 1))
+                        continue
+                    if not entry.is_file():
+                        continue
+                    size = entry.stat().st_size
+                except OSError:
+                    continue
+                if os.path.splitext(entry.name)[1].lower() in SKIPPED_SUFFIXES or ignore.is_ignored(rel):
+                    continue
+                found.append((_directory_priority(entry.name), depth, rel, path, size))
+    found.sort()
+    return [(path, size) for _, _, _, path, size in found], False
+
+
 def discover_related_files(
     dockerfile_path: Path,
     dockerfile_text: str,
     max_files: int = 40,
     max_file_bytes: int = 200_000,
+    class_cache: Optional[FileClassCache] = None,
+    max_dir_files: int = 20,
+    max_dir_bytes: int = 400_000,
+    max_dir_entries: int = 5_000,
 ) -> RelatedFilesResult:
-    base_dir = dockerfile_path.parent
+    """Collect files the Dockerfile COPY/ADDs from its build context.
+
+    Directory sources are expanded recursively, configs and scripts first,
+    within ``max_dir_files``/``max_dir_bytes`` of text per directory and
+    ``max_dir_entries`` scanned entries.
+    """
+    base_dir = Path(os.path.normpath(dockerfile_path.parent))
     files: List[RelatedFile] = []
     skipped: List[str] = []
     binary_files: List[Path] = []
 
     seen: set[Path] = set()
+    ignore = DockerIgnore.load(base_dir, dockerfile_path)
+    class_cache = class_cache or FileClassCache()
 
-    for line in _join_lines(dockerfile_text):
-        sources, _ = _parse_copy_sources(line)
-        if not sources:
-            continue
-        for source in sources:
-            for path in _expand_source(source, base_dir):
-                if path in seen:
-                    continue
-                seen.add(path)
-                if path.is_dir():
-                    skipped.append(f"Directory skipped: {path}")
-                    continue
-                try:
-                    size = path.stat().st_size
-                except OSError:
-                    skipped.append(f"Unreadable file: {path}")
-                    continue
-                if size > max_file_bytes:
-                    skipped.append(f"Large file skipped: {path} ({size} bytes)")
-                    continue
-                is_binary = _is_probably_binary(path)
-                if is_binary:
-                    binary_files.append(path)
-                    continue
-                files.append(
-                    RelatedFile(
-                        path=path,
-                        reason=f"Referenced by: {line}",
-                        is_binary=is_binary,
-                        size_bytes=size,
-                    )
-                )
-                if len(files) >= max_files:
-                    skipped.append("Related file limit reached.")
-                    return RelatedFilesResult(files=files, skipped=skipped, binary_files=binary_files)
-
-    return RelatedFilesResult(files=files, skipped=skipped, binary_files=binary_files)
+    def consider(path: Path, reason: str, stat: Optional[os.stat_result] = None) -> int:
+        """Classify one file; return its size when it was added as a text file, else 0."""
+        if stat is None:
+            try:
+                stat = path.stat()
+            except OSError:
+                skipped.append(f"Unreadable file: {path}")
+                return 0
+        if class_cache.is_binary(path, stat):
+            binary_files.append(path)
+            return 0
+        if stat.st_size > max_file_bytes:
+            skipped.append(f"Large file skipped: {path} ({stat.st_size} bytes)")
+            return 0
+        files.append(RelatedFile(path=path, reason=reason, is_binary=False, size_bytes=stat.st_size))
+        return stat.st_size
+
+    def expand_directory(directory: Path, line: str) -> None:
+        candidates, scan_truncated = _walk_directory(directory, base_dir, ignore, max_dir_entries)
+        if scan_truncated:
+            skipped.append(f"Directory scan budget reached: {directory} ({max_dir_entries} entries)")
+        dir_files = 0
+        dir_bytes = 0
+        for path, _ in candidates:
+            if len(files) >= max_files:
+                return
+            if dir_files >= max_dir_files or dir_bytes >= max_dir_bytes:
+                remaining = sum(1 for item, _ in candidates if item not in seen)
+                skipped.append(f"Directory budget reached: {directory} ({remaining} more files not listed)")
+                return
+            if path in seen:
+                continue
+            seen.add(path)
+            try:
+                stat = path.stat()
+            except OSError:
+                skipped.append(f"Unreadable file: {path}")
+                continue
+            # Binaries are listed whatever their size; the byte budget is for text only.
+            text = not class_cache.is_binary(path, stat)
+            if text and stat.st_size <= max_file_bytes and dir_bytes + stat.st_size > max_dir_bytes:
+                skipped.append(f"Directory byte budget skipped: {path} ({stat.st_size} bytes)")
+                continue
+            before = len(files)
+            dir_bytes += consider(path, f"Referenced by: {line}", stat)
+            dir_files += len(files) - before
+
+    try:
+        for instruction, sources in parse_dockerfile(dockerfile_text).copy_sources():
+            line = instruction.text
+            for source in sources:
+                for path in _expand_source(source, base_dir, ignore):
+                    if len(files) >= max_files:
+                        skipped.append("Related file limit reached.")
+                        return RelatedFilesResult(files=files, skipped=skipped, binary_files=binary_files)
+                    path = Path(os.path.normpath(path))
+                    if path in seen:
+                        continue
+                    seen.add(path)
+                    rel = _context_rel(path, base_dir)
+                    if rel is None:
+                        skipped.append(f"Outside the build context: {path}")
+                        continue
+                    if ignore and path != base_dir and ignore.is_ignored(rel):
+                        skipped.append(f"Ignored by .dockerignore: {path}")
+                        continue
+                    if path.is_dir():
+                        expand_directory(path, line)
+                        continue
+                    consider(path, f"Referenced by: {line}")
+
+        if len(files) >= max_files:
+            skipped.append("Related file limit reached.")
+        return RelatedFilesResult(files=files, skipped=skipped, binary_files=binary_files)
+    finally:
+        class_cache.save()
 
 
 def list_newrelic_tarballs(paths: Sequence[Path]) -> List[Path]:
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from agent.config import AgentConfig
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    try:
+        with path.open("rb") as handle:
+            for chunk in iter(lambda: handle.read(1 << 16), b""):
+                digest.update(chunk)
+    except OSError:
+        return "missing"
+    return digest.hexdigest()
+
+
+@dataclass
+class ResponseCache:
+    """Content-addressed store of LLM responses on disk.
+
+    Entries are JSON files named after the cache key. An entry's mtime is
+    its creation time and is never touched by reads, so ``max_age_s``
+    expires frequently read entries too; hits set the atime, and size
+    eviction drops the least recently used entries. Both checks need only
+    ``stat``.
+    """
+
+    root: Path
+    max_bytes: int
+    max_age_s: float
+
+    def key_for(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        mode: str,
+        files: Iterable[Path],
+    ) -> str:
+        digest = hashlib.sha256()
+        for part in (mode, system_prompt, user_prompt):
+            digest.update(hashlib.sha256(part.encode("utf-8")).digest())
+        for path in sorted({item.resolve() for item in files}):
+            digest.update(path.as_posix().encode("utf-8"))
+            digest.update(_file_digest(path).encode("ascii"))
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def _expired(self, stat: os.stat_result, now: float) -> bool:
+        return self.max_age_s > 0 and now - stat.st_mtime > self.max_age_s
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._entry_path(key)
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        now = time.time()
+        if self._expired(stat, now):
+            path.unlink(missing_ok=True)
+            return None
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            path.unlink(missing_ok=True)
+            return None
+        # Mark the hit in atime only; mtime keeps the creation time.
+        os.utime(path, (now, stat.st_mtime))
+        response = data.get("response") if isinstance(data, dict) else None
+        return response if isinstance(response, str) else None
+
+    def put(self, key: str, response: str, target: Optional[Path] = None, mode: str = "") -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "key": key,
+            "created_at": time.time(),
+            "mode": mode,
+            "target": target.as_posix() if target else None,
+            "response": response,
+        }
+        path = self._entry_path(key)
+        # A unique temporary name per writer: threads of one process may store the same key.
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=self.root, prefix=f"{path.name}.", suffix=".tmp", delete=False
+        ) as handle:
+            handle.write(json.dumps(payload))
+        os.replace(handle.name, path)
+        self.prune()
+
+    def prune(self) -> int:
+        """Apply age and size limits. Returns the number of entries removed."""
+        entries: List[Tuple[float, int, Path]] = []
+        removed = 0
+        now = time.time()
+        try:
+            candidates = list(self.root.glob("*.json"))
+        except OSError:
+            return 0
+        for path in candidates:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if self._expired(stat, now):
+                path.unlink(missing_ok=True)
+                removed += 1
+                continue
+            entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        if self.max_bytes > 0 and total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                path.unlink(missing_ok=True)
+                removed += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+        return removed
+
+
+def open_response_cache(config: AgentConfig) -> ResponseCache:
+    return ResponseCache(
+        root=config.resolve(config.response_cache_dir),
+        max_bytes=config.response_cache_max_bytes,
+        max_age_s=config.response_cache_max_age_days * 86400,
+    )
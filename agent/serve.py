@@ -0,0 +1,308 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import signal
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.cli import parse_args as parse_agent_args
+from agent.client import LOCAL_ONLY_FLAGS, PROTOCOL_VERSION, env_digest, needs_local, request, socket_path
+from agent.config import AgentConfig
+from agent.session import AgentSession, LRUCache, MigrationRequest, SessionEvent
+from agent.transport import open_transport
+
+
+class MigrationServer:
+    """Accept migration jobs on a Unix socket and run them through warm sessions.
+
+    Sessions are kept in an LRU keyed by the resolved knowledge index, so
+    each index is loaded once and its references stay cached between jobs.
+    At most ``workers`` jobs run at a time; the rest wait in arrival order.
+    Every connection speaks JSON lines: one request, then events until
+    ``exit`` (``run``) or a single reply (``health``, ``status``, ``stop``).
+    """
+
+    def __init__(self, config: AgentConfig, path: Path, workers: int, max_indices: int, reference_cache: int) -> None:
+        self.config = config
+        self.path = path
+        self.workers = max(1, workers)
+        self.sessions = LRUCache(max_indices)
+        self.reference_cache = reference_cache
+        self.started = time.monotonic()
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self._slots = asyncio.Semaphore(self.workers)
+        # Sessions share the reference LRU, file-class cache and chunk index, so local stages take turns.
+        self._prepare_lock = asyncio.Lock()
+        self._stop = asyncio.Event()
+
+    def session_for(self, knowledge_index: Optional[Path]) -> AgentSession:
+        index_path = self.config.resolve(knowledge_index or self.config.knowledge_index_path).resolve()
+        key = index_path.as_posix()
+        session = self.sessions.get(key)
+        if session is None:
+            session = AgentSession(self.config, index_path, reference_cache_size=self.reference_cache)
+            self.sessions[key] = session
+        return session
+
+    def health(self) -> Dict[str, Any]:
+        return {"ok": True, "pid": os.getpid(), "uptime_s": round(time.monotonic() - self.started, 1)}
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            **self.health(),
+            "socket": str(self.path),
+            "queue": {"running": self.running, "waiting": self.waiting, "workers": self.workers},
+            "jobs": {"completed": self.completed, "failed": self.failed},
+            "session_cache": {
+                "entries": len(self.sessions),
+                "maxsize": self.sessions.maxsize,
+                "hit_rate": self.sessions.hit_rate,
+            },
+            "sessions": [session.status() for session in self.sessions.values()],
+        }
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        def send(event: str, **data: Any) -> None:
+            if not writer.is_closing():
+                writer.write((json.dumps({"event": event, **data}) + "\n").encode("utf-8"))
+
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            message = json.loads(line)
+            op = message.get("op")
+            if message.get("version") != PROTOCOL_VERSION:
+                send("error", text=f"[error] protocol version {message.get('version')} is not {PROTOCOL_VERSION}")
+                send("exit", code=2)
+            elif op == "health":
+                send("health", **self.health())
+            elif op == "status":
+                send("status", **self.status())
+            elif op == "stop":
+                send("stop", ok=True)
+                self._stop.set()
+            elif op == "run":
+                code = await self.run_job(message, reader, send)
+                send("exit", code=code)
+            else:
+                send("error", text=f"[error] unknown op: {op}")
+                send("exit", code=2)
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def env_differences(self, client_env: Dict[str, str]) -> List[str]:
+        """``CONFIG_ENV`` names whose value in a local run of the client would differ from the daemon's.
+
+        A local run loads the repo's ``.env`` for anything its shell does not
+        set, so that file fills the gaps in the client's environment.
+        """
+        from dotenv import dotenv_values
+
+        expected = {**env_digest(dotenv_values(self.config.repo_root / ".env")), **client_env}
+        actual = env_digest(dict(os.environ))
+        return sorted(key for key in set(expected) | set(actual) if expected.get(key) != actual.get(key))
+
+    async def run_job(self, message: Dict[str, Any], reader: asyncio.StreamReader, send) -> int:
+        differences = self.env_differences(dict(message.get("env") or {}))
+        if differences:
+            send("local", text=f"[client] daemon environment differs ({', '.join(differences)}); running locally")
+            return 0
+        cwd = Path(message.get("cwd") or os.getcwd())
+        try:
+            job, transport, knowledge_index = self.parse_job(list(message.get("argv") or []), cwd)
+        except SystemExit as exc:
+            send("error", text=str(exc))
+            return 2
+
+        async def replies() -> str:
+            send("prompt")
+            line = await reader.readline()
+            # A client that went away ends the follow-up loop.
+            return str(json.loads(line).get("text") or "") if line else ""
+
+        loop = asyncio.get_running_loop()
+        loop_thread = threading.get_ident()
+
+        def emit(event: SessionEvent) -> None:
+            # Local stages run on a worker thread; the stream writer belongs to the loop.
+            if threading.get_ident() != loop_thread:
+                loop.call_soon_threadsafe(lambda: send(event.kind, text=event.text))
+                return
+            send(event.kind, text=event.text)
+
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            await self.session_for(knowledge_index).migrate(
+                job, emit, replies=replies, prepare=self._prepare, transport=transport
+            )
+            self.completed += 1
+            return 0
+        except SystemExit as exc:
+            send("error", text=f"[error] {exc}")
+        except Exception as exc:
+            send("error", text=f"[error] {exc.__class__.__name__}: {exc}")
+        finally:
+            self.running -= 1
+            self._slots.release()
+        self.failed += 1
+        return 1
+
+    async def _prepare(self, func, *args) -> Any:
+        """Run a session stage on a thread, one job at a time, so the loop keeps serving other connections.
+
+        A cancelled job keeps the lock until its thread returns, so the next
+        job never touches the shared caches concurrently.
+        """
+        async with self._prepare_lock:
+            task = asyncio.ensure_future(asyncio.to_thread(func, *args))
+            try:
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                await asyncio.wait([task])
+                raise
+
+    def parse_job(self, argv: List[str], cwd: Path) -> Tuple[MigrationRequest, Any, Optional[Path]]:
+        """The client's ``bin/agent`` arguments as a request, resolving paths against its working directory."""
+        if needs_local(argv):
+            raise SystemExit(f"The daemon does not serve {', '.join(LOCAL_ONLY_FLAGS)}; run them locally.")
+        stderr = io.StringIO()
+        try:
+            with contextlib.redirect_stderr(stderr):
+                args = parse_agent_args(argv, prog="agent")
+        except SystemExit:
+            raise SystemExit(stderr.getvalue().strip() or "Invalid arguments.") from None
+        if not args.target or not args.task:
+            raise SystemExit("Missing --target or --task.")
+
+        def resolve(value: Optional[str]) -> Optional[Path]:
+            if not value:
+                return None
+            path = Path(value).expanduser()
+            return path if path.is_absolute() else cwd / path
+
+        transport = None
+        if args.transport or args.recordings or args.replay_speed is not None:
+            transport = open_transport(self.config, args.transport, resolve(args.recordings), args.replay_speed)
+        job = MigrationRequest(
+            target=resolve(args.target),
+            task=args.task,
+            mode=args.mode,
+            base=args.base,
+            reference_groups=list(args.reference_group),
+            reference_globs=list(args.reference_glob),
+            output=resolve(args.output),
+            write=args.write,
+            backup=args.backup,
+            include_related=not args.no_related,
+            sync_newrelic=args.sync_newrelic,
+            interactive=args.interactive,
+            use_cache=not args.no_cache,
+            refresh=args.refresh,
+            followup_context_chars=args.followup_context_chars,
+        )
+        # Like agent.main, a relative index is relative to the repo root (see session_for).
+        return job, transport, Path(args.knowledge_index) if args.knowledge_index else None
+
+    async def serve(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        server = await asyncio.start_unix_server(self.handle, path=str(self.path))
+        os.chmod(self.path, 0o600)
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self._stop.set)
+        print(f"[serve] listening on {self.path} (workers {self.workers})", flush=True)
+        try:
+            async with server:
+                await self._stop.wait()
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                self.path.unlink()
+            print("[serve] stopped", flush=True)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve migrations from warm knowledge over a Unix socket")
+    parser.add_argument("--socket", help="Socket path (default: AGENT_SOCKET or .cache/agent.sock)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("AGENT_SERVE_WORKERS", "2")),
+        help="Jobs run at once; later ones queue",
+    )
+    parser.add_argument("--max-indices", type=int, default=4, help="Knowledge indices kept loaded (LRU)")
+    parser.add_argument(
+        "--reference-cache",
+        type=int,
+        default=32,
+        help="Loaded reference sets kept per knowledge index (LRU)",
+    )
+    parser.add_argument(
+        "--knowledge-index",
+        action="append",
+        default=[],
+        help="Knowledge index to load at startup (repeatable; default: KNOWLEDGE_INDEX_PATH)",
+    )
+    endpoint = parser.add_mutually_exclusive_group()
+    endpoint.add_argument("--health", action="store_true", help="Ask the running daemon whether it is up")
+    endpoint.add_argument("--status", action="store_true", help="Print the running daemon's queue and cache stats")
+    endpoint.add_argument("--stop", action="store_true", help="Ask the running daemon to exit")
+    return parser.parse_args()
+
+
+def main() -> int:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    args = parse_args()
+    config = AgentConfig()
+    path = Path(args.socket).expanduser() if args.socket else socket_path()
+    if path is None:
+        raise SystemExit("AGENT_SOCKET is off; pass --socket.")
+    path = config.resolve(path)
+
+    op = "health" if args.health else "status" if args.status else "stop" if args.stop else None
+    if op:
+        try:
+            reply = request(path, op)
+        except OSError as exc:
+            print(json.dumps({"ok": False, "socket": str(path), "error": str(exc)}))
+            return 1
+        print(json.dumps(reply, indent=2))
+        return 0
+
+    if path.exists():
+        try:
+            request(path, "health", timeout=1.0)
+        except OSError:
+            path.unlink()
+        else:
+            raise SystemExit(f"A daemon is already listening on {path}.")
+
+    server = MigrationServer(config, path, args.workers, args.max_indices, args.reference_cache)
+    for index in args.knowledge_index or [None]:
+        session = server.session_for(Path(index) if index else None)
+        session.warm()
+        print(f"[serve] loaded {session.knowledge_index} ({len(session.list_bundles())} bundles)", flush=True)
+    asyncio.run(server.serve())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
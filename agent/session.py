@@ -0,0 +1,348 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from agent.config import AgentConfig
+from agent.context.retrieval import ChunkIndex, open_chunk_index
+from agent.knowledge_artifact import load_knowledge
+from agent.knowledge_base import KnowledgeBase
+from agent.main import StreamingFileWriter, prepare_migration, run_agent_cached, write_outputs
+from agent.metrics import MetricsLog, RequestMetrics, open_metrics_log
+from agent.related_files import FileClassCache
+from agent.response_cache import open_response_cache
+from agent.transport import open_transport
+from agent.utils import trim_text
+
+EVENT_KINDS = ("log", "text", "response")
+
+
+@dataclass
+class SessionEvent:
+    """What a job reports: ``log`` lines, streamed ``text`` deltas and each complete ``response``."""
+
+    kind: str
+    text: str
+
+
+EventCallback = Callable[[SessionEvent], None]
+
+
+@dataclass
+class MigrationRequest:
+    target: Path
+    task: str
+    mode: str = "propose"
+    base: Optional[str] = None
+    reference_groups: List[str] = field(default_factory=list)
+    reference_globs: List[str] = field(default_factory=list)
+    output: Optional[Path] = None
+    write: bool = False
+    backup: bool = False
+    include_related: bool = True
+    sync_newrelic: bool = False
+    interactive: bool = False
+    use_cache: bool = True
+    refresh: bool = False
+    followup_context_chars: int = 6000
+
+
+class LRUCache(OrderedDict):
+    """Bounded mapping that evicts the least recently used entry and counts ``get`` hits."""
+
+    def __init__(self, maxsize: int = 32) -> None:
+        super().__init__()
+        self.maxsize = max(1, maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        if key in self:
+            self.hits += 1
+            self.move_to_end(key)
+            return self[key]
+        self.misses += 1
+        return default
+
+    def __setitem__(self, key, value) -> None:
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        lookups = self.hits + self.misses
+        return round(self.hits / lookups, 3) if lookups else None
+
+
+@dataclass
+class SessionStats:
+    jobs: int = 0
+    failed: int = 0
+    knowledge_loads: int = 0
+    requests: int = 0
+    response_cache_hits: int = 0
+
+
+@dataclass
+class _CountingMetricsLog:
+    """Counts response-cache hits for the session, then forwards to the configured metrics file."""
+
+    stats: SessionStats
+    inner: Optional[MetricsLog] = None
+
+    def append(self, metrics: RequestMetrics) -> None:
+        self.stats.requests += 1
+        if metrics.cached:
+            self.stats.response_cache_hits += 1
+        if self.inner is not None:
+            self.inner.append(metrics)
+
+
+class AgentSession:
+    """The migration pipeline as a library, with its caches kept warm between jobs.
+
+    Long-lived front ends (the Textual launcher, ``agent.serve``) create one
+    session per knowledge index and run every job through it: the knowledge
+    base, chunk index, loaded references, file-class cache, response cache
+    and transport are loaded once instead of per process. Knowledge is
+    reloaded, and the reference cache dropped, only when its sources change
+    on disk. Output goes to the ``emit`` callback of each call, never to stdout.
+    """
+
+    def __init__(
+        self,
+        config: Optional[AgentConfig] = None,
+        knowledge_index: Optional[Path] = None,
+        reference_cache_size: int = 32,
+    ) -> None:
+        self.config = config or AgentConfig()
+        self.knowledge_index = knowledge_index or self.config.knowledge_index_path
+        self.references = LRUCache(reference_cache_size)
+        self.stats = SessionStats()
+        self._knowledge: Optional[KnowledgeBase] = None
+        self._chunk_index: Optional[ChunkIndex] = None
+        self._class_cache: Optional[FileClassCache] = None
+        self._transport = None
+        self._cache = None
+        self._metrics_log = _CountingMetricsLog(self.stats)
+        # Warm-up may run on a worker thread while the first job starts.
+        self._lock = threading.RLock()
+
+    def knowledge(self, emit: Optional[EventCallback] = None) -> KnowledgeBase:
+        """The loaded knowledge base, rebuilt if a bundle or reference changed since it was loaded."""
+        log = _logger(emit)
+        with self._lock:
+            current = self._knowledge
+            if current is not None and current.compiled is not None:
+                reason = current.compiled.stale_reason()
+                if reason is not None:
+                    log(f"[knowledge] reloading ({reason})")
+                    current = None
+                    self._chunk_index = None
+                    self.references.clear()
+            if current is None:
+                current = load_knowledge(self.config, self.knowledge_index, log=log)
+                self._knowledge = current
+                self.stats.knowledge_loads += 1
+            return current
+
+    def warm(self, emit: Optional[EventCallback] = None) -> None:
+        """Load everything a migration needs up front, so the first job starts warm too."""
+        self.knowledge(emit)
+        self._ensure_caches()
+
+    def _ensure_caches(self) -> None:
+        with self._lock:
+            if self._class_cache is None:
+                self._class_cache = FileClassCache(self.config.resolve(self.config.file_class_cache_path))
+            if self._chunk_index is None and self.config.reference_retrieval == "bm25":
+                self._chunk_index = open_chunk_index(self.config)
+            if self._transport is None:
+                # Importing the SDK takes about a second; do it here, on the caller's worker
+                # thread, rather than inside the first model call on the event loop.
+                import claude_agent_sdk  # noqa: F401
+
+                self._transport = open_transport(self.config)
+                if self._transport.name == "live":
+                    self._cache = open_response_cache(self.config)
+                self._metrics_log.inner = open_metrics_log(self.config)
+
+    def status(self) -> Dict[str, Any]:
+        """Counters and cache hit rates, as reported by ``agent.serve``'s status endpoint."""
+        requests = self.stats.requests
+        return {
+            "knowledge_index": str(self.knowledge_index),
+            "loaded": self._knowledge is not None,
+            **asdict(self.stats),
+            "response_cache_hit_rate": round(self.stats.response_cache_hits / requests, 3) if requests else None,
+            "reference_cache": {
+                "entries": len(self.references),
+                "maxsize": self.references.maxsize,
+                "hits": self.references.hits,
+                "misses": self.references.misses,
+                "hit_rate": self.references.hit_rate,
+            },
+        }
+
+    def list_bundles(self, emit: Optional[EventCallback] = None) -> List[str]:
+        return self.knowledge(emit).bundle_ids
+
+    def validate(self, emit: EventCallback, strict: bool = False) -> bool:
+        """``agent.validate_knowledge`` against the loaded knowledge; True when it passes."""
+        from agent.validate_knowledge import format_report, run_checks
+
+        compiled = self.knowledge(emit).compiled
+        if compiled is None:
+            raise SystemExit("Knowledge base was not loaded from a compiled artifact.")
+        with self._lock:
+            if self._chunk_index is None and self.config.reference_retrieval == "bm25":
+                self._chunk_index = open_chunk_index(self.config)
+        bundles, budgets, errors = run_checks(
+            self.config,
+            compiled,
+            workers=min(8, os.cpu_count() or 1),
+            strict=strict,
+            chunk_index=self._chunk_index,
+        )
+        for line in format_report(compiled, bundles, budgets, errors):
+            emit(SessionEvent("log", line))
+        return not errors
+
+    async def migrate(
+        self,
+        request: MigrationRequest,
+        emit: EventCallback,
+        replies: Optional[Callable[[], Awaitable[str]]] = None,
+        prepare: Optional[Callable[..., Awaitable]] = None,
+        transport=None,
+    ) -> List[Path]:
+        """Run one migration and return the files written.
+
+        With ``request.interactive`` each follow-up prompt is awaited from
+        ``replies``; an empty reply ends the session. ``prepare`` runs the
+        synchronous local stages (default: inline); front ends pass
+        ``asyncio.to_thread`` to keep their event loop responsive.
+        ``transport`` overrides the session's for this job only.
+        """
+        self.stats.jobs += 1
+        try:
+            return await self._migrate(request, emit, replies, prepare or _inline, transport)
+        except BaseException:
+            self.stats.failed += 1
+            raise
+
+    async def _migrate(
+        self,
+        request: MigrationRequest,
+        emit: EventCallback,
+        replies: Optional[Callable[[], Awaitable[str]]],
+        prepare: Callable[..., Awaitable],
+        transport,
+    ) -> List[Path]:
+        log = _logger(emit)
+        knowledge_base = await prepare(self.knowledge, emit)
+        await prepare(self._ensure_caches)
+        transport = transport or self._transport
+        if transport.name != "replay" and not os.getenv("ANTHROPIC_API_KEY"):
+            raise SystemExit("ANTHROPIC_API_KEY is not set. Add it to .env or your shell environment.")
+
+        started = time.monotonic()
+        plan = await prepare(
+            lambda: prepare_migration(
+                config=self.config,
+                knowledge_base=knowledge_base,
+                target_path=request.target,
+                task=request.task,
+                mode=request.mode,
+                base=request.base,
+                reference_groups=request.reference_groups,
+                reference_globs=request.reference_globs,
+                include_related=request.include_related,
+                sync_newrelic=request.sync_newrelic,
+                log=log,
+                class_cache=self._class_cache,
+                chunk_index=self._chunk_index,
+                reference_cache=self.references,
+            )
+        )
+        log(f"[prepare] {time.monotonic() - started:.2f}s")
+
+        # Same rule as the CLI: only live propose runs read or fill the response cache.
+        cache = None
+        if request.use_cache and request.mode == "propose" and transport.name == "live":
+            cache = self._cache
+        streamer = None
+        if request.write and not request.output:
+            streamer = StreamingFileWriter(plan.target_path, backup=request.backup, log=log)
+
+        def on_text(text: str) -> None:
+            if streamer:
+                streamer.feed(text)
+            emit(SessionEvent("text", text))
+
+        written: List[Path] = []
+        prompt = plan.user_prompt
+        followup = False
+        while True:
+            response = await run_agent_cached(
+                prompt,
+                plan,
+                cache,
+                request.refresh,
+                debug=False,
+                ui_enabled=True,
+                spinner_enabled=False,
+                log=log,
+                on_text=on_text,
+                transport=transport,
+                metrics_log=self._metrics_log,
+                followup=followup,
+            )
+            emit(SessionEvent("response", response))
+            written.extend(
+                write_outputs(
+                    response,
+                    plan.target_path,
+                    output=request.output,
+                    write=request.write,
+                    backup=request.backup,
+                    log=log,
+                    streamed=streamer.finish() if streamer else None,
+                )
+            )
+            if not request.interactive or replies is None:
+                return written
+
+            log("[interactive] Awaiting follow-up input...")
+            reply = (await replies()).strip()
+            if not reply:
+                log("[interactive] Session finished.")
+                return written
+            context = trim_text(response, request.followup_context_chars)
+            prompt = (
+                "Follow-up request:\n"
+                f"{reply}\n\n"
+                "Context from previous response (truncated if needed):\n"
+                f"{context}\n"
+            )
+            followup = True
+
+
+def _logger(emit: Optional[EventCallback]) -> Callable[[str], None]:
+    if emit is None:
+        return print
+
+    def log(line: str) -> None:
+        for part in line.strip("\n").splitlines() or [""]:
+            emit(SessionEvent("log", part))
+
+    return log
+
+
+async def _inline(func: Callable, *args):
+    return func(*args)
@@ -1,9 +1,12 @@
 import asyncio
-import re
+import os
+import threading
 import time
+from dataclasses import dataclass, field
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
 from rich.markdown import Markdown
 from rich.text import Text
@@ -11,6 +14,10 @@ from textual import on
 from textual.app import App, ComposeResult
 from textual.containers import Horizontal, Vertical
 from textual.widgets import Button, Checkbox, DataTable, Footer, Header, Input, RichLog, Static
+from textual.worker import Worker
+
+from agent.log_sink import LogBatcher, LogBuffer, line_style
+from agent.session import AgentSession, MigrationRequest, SessionEvent
 
 
 DEFAULT_TASK = "Migrate this repo to multi-arch format while preserving current PHP version"
@@ -22,6 +29,39 @@ ASCII_BRAND = r"""
  |____/ \___/ \___|_|\_\___|_|    |_|  |_|_|\__, |_|  \__,_|\__|_|\___/|_| |_|
                                              |___/
 """
+JOB_LOG_LINES = 5000
+# Lines the log view keeps, and lines rendered per frame; the rest wait for later frames.
+LOG_VIEW_LINES = 2000
+LOG_FRAME_LINES = 200
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+
+@dataclass
+class LauncherJob:
+    """One queued action: a ``bin/agent`` subprocess (``cmd``) or an in-process coroutine (``run``)."""
+
+    id: int
+    title: str
+    target: str
+    cmd: Optional[List[str]] = None
+    run: Optional[Callable[["LauncherJob"], Awaitable[bool]]] = None
+    state: str = "queued"
+    created: str = field(default_factory=lambda: datetime.now().strftime("%H:%M:%S"))
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    returncode: Optional[int] = None
+    lines: LogBuffer = field(default_factory=lambda: LogBuffer(JOB_LOG_LINES))
+    process: Optional[asyncio.subprocess.Process] = None
+    replies: Optional[asyncio.Queue] = None
+    worker: Optional[Worker] = None
+    streamed_chars: int = 0
+    cancel_requested: bool = False
+
+    @property
+    def duration(self) -> str:
+        if self.started_at is None:
+            return "-"
+        return f"{(self.finished_at or time.monotonic()) - self.started_at:.1f}s"
 
 
 class MigrationLauncherApp(App):
@@ -143,6 +183,16 @@ class MigrationLauncherApp(App):
     #history_table {
       height: 1fr;
     }
+
+    #job_bar {
+      height: auto;
+      margin: 1 0 0 0;
+    }
+
+    #job_bar Button {
+      width: 1fr;
+      margin: 0 1 0 0;
+    }
     """
 
     BINDINGS = [
@@ -150,14 +200,32 @@ class MigrationLauncherApp(App):
         ("ctrl+l", "clear_logs", "Clear Logs"),
         ("ctrl+h", "clear_history", "Clear History"),
         ("ctrl+s", "send_reply", "Send Reply"),
+        ("ctrl+x", "cancel_job", "Cancel Job"),
+        ("ctrl+t", "retry_job", "Retry Job"),
+        ("ctrl+up", "move_job(-1)", "Move Up"),
+        ("ctrl+down", "move_job(1)", "Move Down"),
         ("q", "quit", "Quit"),
     ]
 
     def __init__(self) -> None:
         super().__init__()
         self.repo_root = Path(__file__).resolve().parents[1]
-        self.running = False
-        self._active_process: Optional[asyncio.subprocess.Process] = None
+        self.jobs: Dict[int, LauncherJob] = {}
+        # Queued job ids in start order; reprioritising reorders this list.
+        self._queue: List[int] = []
+        self._next_job_id = 1
+        self._selected_job: Optional[int] = None
+        # In-process jobs share one session, so knowledge and caches stay loaded between runs.
+        self.session = AgentSession()
+        # The session's local stages share caches, so jobs take turns; their LLM calls overlap.
+        self._prepare_lock = asyncio.Lock()
+        self._ui_thread = threading.get_ident()
+        # Log lines are rendered in batches at most ``LAUNCHER_LOG_FPS`` times a second.
+        self._batcher = LogBatcher(LOG_VIEW_LINES)
+        self._log_fps = max(1.0, float(os.getenv("LAUNCHER_LOG_FPS", "20")))
+        # Job log lines beyond JOB_LOG_LINES are appended to <dir>/<start>-job-<id>.log.
+        self._log_dir = self.repo_root / os.getenv("LAUNCHER_LOG_DIR", ".cache/launcher-logs")
+        self._log_stamp = datetime.now().strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
 
     def compose(self) -> ComposeResult:
         yield Header(show_clock=True)
@@ -176,7 +244,11 @@ class MigrationLauncherApp(App):
                 yield Button("Clear Logs", id="btn_clear", variant="default")
                 yield Button("Clear History", id="btn_clear_history", variant="warning")
                 yield Button("Quit", id="btn_quit", variant="error")
-                yield Static("Tip: ctrl+r run, ctrl+l logs, ctrl+h history, ctrl+s send, q quit", classes="hint")
+                yield Static(
+                    "Tip: ctrl+r run, ctrl+l logs, ctrl+h history, ctrl+s send, ctrl+x cancel, ctrl+t retry, "
+                    "ctrl+up/down reorder, q quit",
+                    classes="hint",
+                )
 
             with Vertical(id="form"):
                 yield Static("Migration Form", classes="section-title")
@@ -188,6 +260,8 @@ class MigrationLauncherApp(App):
                 yield Input(value="propose", id="mode")
                 yield Static("Base (auto/alpine/debian)", classes="field-label")
                 yield Input(value="auto", id="base")
+                yield Static("Parallel jobs", classes="field-label")
+                yield Input(value=os.getenv("LAUNCHER_WORKERS", "2"), id="workers")
 
                 yield Checkbox("Write .migrated outputs", value=False, id="opt_write")
                 yield Checkbox("Backup before write", value=True, id="opt_backup")
@@ -195,13 +269,14 @@ class MigrationLauncherApp(App):
                 yield Checkbox("Sync latest New Relic", value=False, id="opt_newrelic")
                 yield Checkbox("Interactive follow-ups", value=False, id="opt_interactive")
                 yield Checkbox("Debug logs", value=False, id="opt_debug")
+                yield Checkbox("Run in-process (warm cache)", value=True, id="opt_inprocess")
 
                 yield Static("Status: idle", id="status")
 
             with Vertical(id="right"):
                 with Vertical(id="logs"):
                     yield Static("Live Logs", classes="section-title")
-                    yield RichLog(id="log_view", wrap=True, markup=False, highlight=True)
+                    yield RichLog(id="log_view", max_lines=LOG_VIEW_LINES, wrap=True, markup=False, highlight=True)
                     with Horizontal(id="reply_bar"):
                         yield Input(
                             placeholder="Reply to agent prompts (enable Interactive follow-ups)",
@@ -209,26 +284,70 @@ class MigrationLauncherApp(App):
                         )
                         yield Button("Send Reply", id="btn_send_reply", variant="warning")
                 with Vertical(id="history"):
-                    yield Static("Job History", classes="section-title")
-                    yield DataTable(id="history_table", zebra_stripes=True)
+                    yield Static("Jobs (select a row to view its log)", classes="section-title")
+                    yield DataTable(id="history_table", zebra_stripes=True, cursor_type="row")
+                    with Horizontal(id="job_bar"):
+                        yield Button("Cancel", id="btn_job_cancel", variant="error")
+                        yield Button("Retry", id="btn_job_retry", variant="primary")
+                        yield Button("Move Up", id="btn_job_up", variant="default")
+                        yield Button("Move Down", id="btn_job_down", variant="default")
         yield Footer()
 
     def on_mount(self) -> None:
         table = self.query_one("#history_table", DataTable)
-        table.add_columns("Time", "Action", "Status", "Duration", "Target")
+        columns = (
+            ("#", "id"),
+            ("Time", "time"),
+            ("Action", "action"),
+            ("Status", "status"),
+            ("Duration", "duration"),
+            ("Target", "target"),
+        )
+        for label, key in columns:
+            table.add_column(label, key=key)
+        self.run_worker(self._warm_session(), exclusive=False)
+        self.set_interval(1.0, self._tick)
+        self.set_interval(1.0 / self._log_fps, self._flush_log)
+
+    def on_unmount(self) -> None:
+        for job in self.jobs.values():
+            job.lines.close()
 
     def action_run_guided(self) -> None:
         self._start_guided(debug_override=None)
 
     def action_clear_logs(self) -> None:
+        self._batcher.clear()
         self.query_one("#log_view", RichLog).clear()
 
     def action_clear_history(self) -> None:
-        self.query_one("#history_table", DataTable).clear(columns=False)
+        """Forget finished jobs; queued and running ones stay."""
+        table = self.query_one("#history_table", DataTable)
+        for job in [job for job in self.jobs.values() if job.state in FINISHED_STATES]:
+            table.remove_row(str(job.id))
+            del self.jobs[job.id]
+            if self._selected_job == job.id:
+                self._selected_job = None
+        self._refresh_status()
 
     def action_send_reply(self) -> None:
         self._send_reply_from_input()
 
+    def action_cancel_job(self) -> None:
+        job = self._current_job()
+        if job:
+            self._cancel_job(job)
+
+    def action_retry_job(self) -> None:
+        job = self._current_job()
+        if job:
+            self._retry_job(job)
+
+    def action_move_job(self, delta: int) -> None:
+        job = self._current_job()
+        if job:
+            self._move_job(job, delta)
+
     @on(Button.Pressed)
     def handle_button(self, event: Button.Pressed) -> None:
         button_id = event.button.id or ""
@@ -237,11 +356,25 @@ class MigrationLauncherApp(App):
         elif button_id == "btn_guided_debug":
             self._start_guided(debug_override=True)
         elif button_id == "btn_quick_wizard":
-            self._run_cmd(self._agent_cmd() + ["--wizard", "--ui"], "Quick Wizard")
+            self._submit("Quick Wizard", "-", cmd=self._agent_cmd() + ["--wizard", "--ui"])
         elif button_id == "btn_list_bundles":
-            self._run_cmd(self._agent_cmd() + ["--list-reference-groups"], "List Bundles")
+            if self._in_process():
+                self._submit("List Bundles", "-", run=self._list_bundles_job)
+            else:
+                self._submit("List Bundles", "-", cmd=self._agent_cmd() + ["--list-reference-groups"])
         elif button_id == "btn_validate":
-            self._run_cmd(self._validate_cmd(), "Validate Knowledge")
+            if self._in_process():
+                self._submit("Validate Knowledge", "-", run=self._validate_job)
+            else:
+                self._submit("Validate Knowledge", "-", cmd=self._validate_cmd())
+        elif button_id == "btn_job_cancel":
+            self.action_cancel_job()
+        elif button_id == "btn_job_retry":
+            self.action_retry_job()
+        elif button_id == "btn_job_up":
+            self.action_move_job(-1)
+        elif button_id == "btn_job_down":
+            self.action_move_job(1)
         elif button_id == "btn_clear":
             self.action_clear_logs()
         elif button_id == "btn_clear_history":
@@ -260,21 +393,12 @@ class MigrationLauncherApp(App):
             return [str(python_bin), "-m", "agent.validate_knowledge"]
         return ["python3", "-m", "agent.validate_knowledge"]
 
+    def _in_process(self) -> bool:
+        return self.query_one("#opt_inprocess", Checkbox).value
+
     def _set_status(self, text: str) -> None:
         self.query_one("#status", Static).update(f"Status: {text}")
 
-    def _looks_like_markdown(self, text: str) -> bool:
-        stripped = text.strip()
-        if not stripped:
-            return False
-        if stripped.startswith(("# ", "## ", "### ", "- ", "* ")):
-            return True
-        if re.search(r"\*\*[^*]+\*\*", stripped):
-            return True
-        if re.match(r"^\d+\.\s", stripped):
-            return True
-        return False
-
     def _render_table_line(self, text: str) -> Text:
         def clean_inline(value: str) -> str:
             cleaned = value.replace("**", "").replace("`", "")
@@ -300,45 +424,29 @@ class MigrationLauncherApp(App):
         return line
 
     def _log(self, text: str) -> None:
-        log = self.query_one("#log_view", RichLog)
-        stripped = text.strip()
+        """Queue a line for the log view; ``_flush_log`` renders it with the next frame."""
+        self._batcher.push(text)
 
-        if stripped.startswith("|") and stripped.count("|") >= 3:
-            log.write(self._render_table_line(stripped))
-            return
-        if self._looks_like_markdown(text):
-            log.write(Markdown(text))
-            return
-        if text.startswith("[run]"):
-            log.write(Text(text, style="bold cyan"))
-            return
-        if text.startswith("[done]") and "success" in text:
-            log.write(Text(text, style="bold green"))
-            return
-        if text.startswith("[done]") and "failed" in text:
-            log.write(Text(text, style="bold red"))
-            return
-        if text.startswith("[error]"):
-            log.write(Text(text, style="bold red"))
+    def _flush_log(self) -> None:
+        if not len(self._batcher):
             return
-        if text.startswith("[warn]"):
-            log.write(Text(text, style="yellow"))
-            return
-        if text.startswith("[reply]"):
-            log.write(Text(text, style="bold magenta"))
-            return
-
-        log.write(Text(text))
-
-    def _set_inputs_disabled(self, disabled: bool) -> None:
-        for button in self.query(Button):
-            if button.id != "btn_send_reply":
-                button.disabled = disabled
-        for inp in self.query(Input):
-            if inp.id != "reply_input":
-                inp.disabled = disabled
-        for chk in self.query(Checkbox):
-            chk.disabled = disabled
+        dropped, groups = self._batcher.take(LOG_FRAME_LINES)
+        log = self.query_one("#log_view", RichLog)
+        if dropped:
+            log.write(Text(f"[log] {dropped} lines skipped to keep up; the job log keeps them", style="dim"))
+        # One write per run of same-kind lines instead of one per line.
+        for kind, lines in groups:
+            if kind == "markdown":
+                log.write(Markdown("\n".join(lines)))
+            elif kind == "table":
+                log.write(Text("\n").join(self._render_table_line(line.strip()) for line in lines))
+            else:
+                text = Text()
+                for index, line in enumerate(lines):
+                    if index:
+                        text.append("\n")
+                    text.append(line, style=line_style(line) or "")
+                log.write(text)
 
     def _target_from_cmd(self, cmd: List[str]) -> str:
         if "--target" in cmd:
@@ -347,21 +455,29 @@ class MigrationLauncherApp(App):
                 return cmd[idx + 1]
         return "-"
 
-    def _append_history(self, title: str, cmd: List[str], returncode: int, duration_s: float) -> None:
-        table = self.query_one("#history_table", DataTable)
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        status = "OK" if returncode == 0 else f"FAIL({returncode})"
-        duration = f"{duration_s:.1f}s"
-        target = self._target_from_cmd(cmd)
-        table.add_row(timestamp, title, status, duration, target)
-
     def _start_guided(self, debug_override: Optional[bool]) -> None:
-        args = self._build_guided_args(debug_override)
-        if not args:
+        form = self._read_guided_form(debug_override)
+        if not form:
             return
-        self._run_cmd(self._agent_cmd() + args, "Guided Migration")
+        # The agent's debug trace goes to stderr, so debug runs keep the subprocess and its pipe.
+        if self._in_process() and not form["debug"]:
+            request = MigrationRequest(
+                target=form["target"],
+                task=form["task"],
+                mode=form["mode"],
+                base=form["base"],
+                write=form["write"],
+                backup=form["backup"],
+                include_related=form["include_related"],
+                sync_newrelic=form["sync_newrelic"],
+                interactive=form["interactive"],
+            )
+            self._submit("Guided Migration", str(request.target), run=lambda job: self._migrate_job(job, request))
+            return
+        cmd = self._agent_cmd() + self._guided_args(form)
+        self._submit("Guided Migration", self._target_from_cmd(cmd), cmd=cmd)
 
-    def _build_guided_args(self, debug_override: Optional[bool]) -> Optional[List[str]]:
+    def _read_guided_form(self, debug_override: Optional[bool]) -> Optional[Dict[str, Any]]:
         target = self.query_one("#target", Input).value.strip()
         task = self.query_one("#task", Input).value.strip()
         mode = self.query_one("#mode", Input).value.strip().lower() or "propose"
@@ -408,107 +524,350 @@ class MigrationLauncherApp(App):
         if debug_override is True:
             debug = True
 
+        return {
+            "target": target_path,
+            "task": task,
+            "mode": mode,
+            "base": None if base == "auto" else base,
+            "write": mode == "propose" and write_outputs,
+            "backup": backup,
+            "include_related": include_related,
+            "sync_newrelic": sync_newrelic,
+            "interactive": followups,
+            "debug": debug,
+        }
+
+    def _guided_args(self, form: Dict[str, Any]) -> List[str]:
         args = [
             "--target",
-            str(target_path),
+            str(form["target"]),
             "--task",
-            task,
+            form["task"],
             "--mode",
-            mode,
+            form["mode"],
             "--ui",
         ]
 
-        if base != "auto":
-            args += ["--base", base]
-        if mode == "propose" and write_outputs:
+        if form["base"]:
+            args += ["--base", form["base"]]
+        if form["write"]:
             args.append("--write")
-        if backup:
+        if form["backup"]:
             args.append("--backup")
-        if not include_related:
+        if not form["include_related"]:
             args.append("--no-related")
-        if sync_newrelic:
+        if form["sync_newrelic"]:
             args.append("--sync-newrelic")
-        if followups:
+        if form["interactive"]:
             args.append("--interactive")
-        if debug:
+        if form["debug"]:
             args.append("--debug")
 
         return args
 
+
     def _send_reply_from_input(self) -> None:
         reply_input = self.query_one("#reply_input", Input)
         message = reply_input.value.strip()
         if not message:
             self._log("[warn] reply input is empty")
             return
+        job = self._current_job()
+        if job is None or job.state != "running":
+            self._log("[warn] select a running job to reply to. Enable Interactive follow-ups before running.")
+            return
         reply_input.value = ""
-        self.run_worker(self._send_reply_async(message), exclusive=False)
+        self.run_worker(self._send_reply_async(job, message), exclusive=False)
 
-    async def _send_reply_async(self, message: str) -> None:
-        if self._active_process is None or self._active_process.stdin is None:
-            self._log("[warn] no active interactive session. Enable Interactive follow-ups before running.")
+    async def _send_reply_async(self, job: LauncherJob, message: str) -> None:
+        if job.replies is not None:
+            await job.replies.put(message)
+            self._job_log(job, f"[reply] {message}")
             return
-        if self._active_process.returncode is not None:
-            self._log("[warn] session already finished. Start a new run.")
+        if job.process is None or job.process.stdin is None:
+            self._job_log(job, "[warn] no active interactive session. Enable Interactive follow-ups before running.")
+            return
+        if job.process.returncode is not None:
+            self._job_log(job, "[warn] session already finished. Start a new run.")
             return
 
         try:
-            self._active_process.stdin.write((message + "\n").encode("utf-8"))
-            await self._active_process.stdin.drain()
-            self._log(f"[reply] {message}")
+            job.process.stdin.write((message + "\n").encode("utf-8"))
+            await job.process.stdin.drain()
+            self._job_log(job, f"[reply] {message}")
         except Exception as exc:
-            self._log(f"[error] failed to send reply: {exc}")
-
-    def _run_cmd(self, cmd: List[str], title: str) -> None:
-        if self.running:
-            self._log("[warn] another command is already running")
-            return
-        self.run_worker(self._run_cmd_async(cmd, title), exclusive=True)
+            self._job_log(job, f"[error] failed to send reply: {exc}")
 
-    async def _run_cmd_async(self, cmd: List[str], title: str) -> None:
-        self.running = True
-        self._set_inputs_disabled(True)
-        self._set_status(f"running {title}")
-        self._log("\n" + "=" * 72)
-        self._log(f"[run] {title}")
-        self._log("$ " + " ".join(cmd))
-        started = time.monotonic()
+    # Job queue
 
+    def _max_workers(self) -> int:
         try:
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                cwd=str(self.repo_root),
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT,
-            )
-            self._active_process = process
+            return max(1, int(self.query_one("#workers", Input).value.strip()))
+        except ValueError:
+            return 1
+
+    @on(Input.Changed, "#workers")
+    def _workers_changed(self, event: Input.Changed) -> None:
+        self._dispatch()
+
+    @on(DataTable.RowHighlighted, "#history_table")
+    def _job_highlighted(self, event: DataTable.RowHighlighted) -> None:
+        if event.row_key.value is not None:
+            self._select_job(int(event.row_key.value))
+
+    def _current_job(self) -> Optional[LauncherJob]:
+        job = self.jobs.get(self._selected_job) if self._selected_job is not None else None
+        if job is None:
+            self._log("[warn] no job selected")
+        return job
+
+    def _select_job(self, job_id: int) -> None:
+        if job_id == self._selected_job or job_id not in self.jobs:
+            return
+        self._selected_job = job_id
+        self._batcher.clear()
+        self.query_one("#log_view", RichLog).clear()
+        lines = self.jobs[job_id].lines
+        # Leave room in the batch for the notice line.
+        skip = max(0, len(lines) - LOG_VIEW_LINES + 1)
+        if lines.spilled + skip:
+            where = f" (full log: {lines.spill_path})" if lines.spilled and lines.spill_path else ""
+            self._log(f"[log] {lines.spilled + skip} earlier lines not shown{where}")
+        for line in islice(lines, skip, None):
+            self._log(line)
+        self._flush_log()
+        self._refresh_status()
+
+    def _submit(
+        self,
+        title: str,
+        target: str,
+        cmd: Optional[List[str]] = None,
+        run: Optional[Callable[[LauncherJob], Awaitable[bool]]] = None,
+    ) -> LauncherJob:
+        spill_path = self._log_dir / f"{self._log_stamp}-job-{self._next_job_id}.log"
+        job = LauncherJob(
+            id=self._next_job_id,
+            title=title,
+            target=target,
+            cmd=cmd,
+            run=run,
+            lines=LogBuffer(JOB_LOG_LINES, spill_path),
+        )
+        self._next_job_id += 1
+        self.jobs[job.id] = job
+        self._queue.append(job.id)
+        table = self.query_one("#history_table", DataTable)
+        table.add_row(str(job.id), job.created, title, "queued", "-", target, key=str(job.id))
+        self._job_log(job, "=" * 72)
+        self._job_log(job, f"[run] #{job.id} {title}" + ("" if cmd else " (in-process)"))
+        if cmd:
+            self._job_log(job, "$ " + " ".join(cmd))
+        # Follow the newest job unless the operator is reading a job that is still active.
+        current = self.jobs.get(self._selected_job) if self._selected_job is not None else None
+        if current is None or current.state in FINISHED_STATES:
+            table.move_cursor(row=table.get_row_index(str(job.id)))
+            self._select_job(job.id)
+        self._dispatch()
+        return job
+
+    def _dispatch(self) -> None:
+        running = sum(1 for job in self.jobs.values() if job.state == "running")
+        while self._queue and running < self._max_workers():
+            job = self.jobs[self._queue.pop(0)]
+            job.state = "running"
+            job.started_at = time.monotonic()
+            job.worker = self.run_worker(self._execute(job), exclusive=False, group="jobs")
+            running += 1
+        self._refresh_rows()
+
+    def _cancel_job(self, job: LauncherJob) -> None:
+        if job.state == "queued":
+            self._queue.remove(job.id)
+            job.state = "cancelled"
+            self._job_log(job, "[done] cancelled before start")
+            self._refresh_rows()
+        elif job.state == "running":
+            job.cancel_requested = True
+            self._job_log(job, "[warn] cancelling...")
+            if job.process is not None and job.process.returncode is None:
+                job.process.terminate()
+            elif job.worker is not None:
+                job.worker.cancel()
+        else:
+            self._log(f"[warn] job #{job.id} already finished")
+
+    def _retry_job(self, job: LauncherJob) -> None:
+        if job.state not in FINISHED_STATES:
+            self._log(f"[warn] job #{job.id} is still {job.state}")
+            return
+        retry = self._submit(f"{job.title} (retry #{job.id})", job.target, cmd=job.cmd, run=job.run)
+        self._log(f"[run] job #{job.id} queued again as #{retry.id}")
 
+    def _move_job(self, job: LauncherJob, delta: int) -> None:
+        if job.state != "queued":
+            self._log(f"[warn] only queued jobs can be reordered (#{job.id} is {job.state})")
+            return
+        index = self._queue.index(job.id)
+        new_index = min(max(index + delta, 0), len(self._queue) - 1)
+        self._queue.insert(new_index, self._queue.pop(index))
+        self._refresh_rows()
+
+    def _job_status(self, job: LauncherJob) -> str:
+        if job.state == "queued":
+            return f"queued ({self._queue.index(job.id) + 1})"
+        if job.state == "running" and job.streamed_chars:
+            return f"running ({job.streamed_chars} chars)"
+        if job.state == "done":
+            return "OK"
+        if job.state == "failed":
+            return f"FAIL({job.returncode})"
+        return job.state
+
+    def _refresh_rows(self) -> None:
+        table = self.query_one("#history_table", DataTable)
+        for job in self.jobs.values():
+            table.update_cell(str(job.id), "status", self._job_status(job))
+            table.update_cell(str(job.id), "duration", job.duration)
+        self._refresh_status()
+
+    def _refresh_status(self) -> None:
+        counts = {state: 0 for state in ("running", "queued", *FINISHED_STATES)}
+        for job in self.jobs.values():
+            counts[job.state] += 1
+        summary = ", ".join(f"{count} {state}" for state, count in counts.items() if count) or "idle"
+        if self._selected_job in self.jobs:
+            summary += f" | viewing #{self._selected_job}"
+        self._set_status(summary)
+
+    def _tick(self) -> None:
+        if any(job.state == "running" for job in self.jobs.values()):
+            self._refresh_rows()
+
+    def _job_log(self, job: LauncherJob, text: str) -> None:
+        job.lines.append(text)
+        if job.id == self._selected_job:
+            self._log(text)
+
+    async def _execute(self, job: LauncherJob) -> None:
+        returncode = 1
+        try:
+            if job.cmd is not None:
+                returncode = await self._run_process(job)
+            else:
+                assert job.run is not None
+                returncode = 0 if await job.run(job) else 1
+        except asyncio.CancelledError:
+            job.cancel_requested = True
+        except SystemExit as exc:
+            self._job_log(job, f"[error] {exc}")
+        except Exception as exc:  # pragma: no cover - defensive UI path
+            self._job_log(job, f"[error] {exc.__class__.__name__}: {exc}")
+        finally:
+            job.finished_at = time.monotonic()
+            job.returncode = returncode
+            job.process = None
+            job.replies = None
+            if job.cancel_requested:
+                job.state = "cancelled"
+                self._job_log(job, f"[done] cancelled after {job.duration}")
+            elif returncode == 0:
+                job.state = "done"
+                self._job_log(job, f"[done] success in {job.duration}")
+            else:
+                job.state = "failed"
+                self._job_log(job, f"[done] failed ({returncode})")
+            # Reopened on demand if a late line (e.g. a reply warning) overflows.
+            job.lines.close()
+            self._dispatch()
+
+    async def _run_process(self, job: LauncherJob) -> int:
+        assert job.cmd is not None
+        process = await asyncio.create_subprocess_exec(
+            *job.cmd,
+            cwd=str(self.repo_root),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        job.process = process
+        try:
             assert process.stdout is not None
             while True:
                 line = await process.stdout.readline()
                 if not line:
                     break
-                self._log(line.decode("utf-8", errors="replace").rstrip("\n"))
-
-            returncode = await process.wait()
-            elapsed = time.monotonic() - started
-            if returncode == 0:
-                self._set_status("completed")
-                self._log("[done] success")
-            else:
-                self._set_status(f"failed ({returncode})")
-                self._log(f"[done] failed ({returncode})")
-            self._append_history(title, cmd, returncode, elapsed)
-        except Exception as exc:  # pragma: no cover - defensive UI path
-            self._set_status("error")
-            self._log(f"[error] {exc}")
-            elapsed = time.monotonic() - started
-            self._append_history(title, cmd, 1, elapsed)
-        finally:
-            self._active_process = None
-            self.running = False
-            self._set_inputs_disabled(False)
+                self._job_log(job, line.decode("utf-8", errors="replace").rstrip("\n"))
+            return await process.wait()
+        except asyncio.CancelledError:
+            if process.returncode is None:
+                process.terminate()
+            raise
+
+    # In-process jobs
+
+    def _on_session_event(self, job: Optional[LauncherJob], event: SessionEvent) -> None:
+        if threading.get_ident() != self._ui_thread:
+            self.call_from_thread(self._on_session_event, job, event)
+            return
+        if job is None:
+            self._log(event.text)
+            return
+        if event.kind == "text":
+            # Deltas only move the status column; the complete response is logged once it arrives.
+            before = job.streamed_chars
+            job.streamed_chars += len(event.text)
+            if before // 512 != job.streamed_chars // 512:
+                self.query_one("#history_table", DataTable).update_cell(str(job.id), "status", self._job_status(job))
+            return
+        if event.kind == "response":
+            job.streamed_chars = 0
+            for line in event.text.splitlines():
+                self._job_log(job, line)
+            return
+        self._job_log(job, event.text)
+
+    def _emitter(self, job: Optional[LauncherJob]) -> Callable[[SessionEvent], None]:
+        return lambda event: self._on_session_event(job, event)
+
+    async def _prepare(self, func: Callable, *args) -> Any:
+        """Run a session stage on a thread, one job at a time.
+
+        A cancelled job keeps the lock until its thread returns, so the next
+        job never touches the shared caches concurrently.
+        """
+        async with self._prepare_lock:
+            task = asyncio.ensure_future(asyncio.to_thread(func, *args))
+            try:
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                await asyncio.wait([task])
+                raise
+
+    async def _warm_session(self) -> None:
+        try:
+            await self._prepare(self.session.warm, self._emitter(None))
+        except (SystemExit, Exception) as exc:
+            self._log(f"[warn] in-process session not warmed: {exc}")
+
+    async def _list_bundles_job(self, job: LauncherJob) -> bool:
+        bundle_ids = await self._prepare(self.session.list_bundles, self._emitter(job))
+        for bundle_id in bundle_ids:
+            self._job_log(job, bundle_id)
+        return True
+
+    async def _validate_job(self, job: LauncherJob) -> bool:
+        return await self._prepare(self.session.validate, self._emitter(job))
+
+    async def _migrate_job(self, job: LauncherJob, request: MigrationRequest) -> bool:
+        job.replies = asyncio.Queue() if request.interactive else None
+        await self.session.migrate(
+            request,
+            self._emitter(job),
+            replies=job.replies.get if job.replies is not None else None,
+            prepare=self._prepare,
+        )
+        return True
 
 
 def run() -> int:
@@ -0,0 +1,191 @@
+import dataclasses
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from agent.config import AgentConfig
+
+TRANSPORT_MODES = ("live", "record", "replay")
+RECORDING_VERSION = 1
+MESSAGE_TYPES = ("AssistantMessage", "ResultMessage", "StreamEvent", "SystemMessage", "UserMessage")
+BLOCK_TYPES = ("TextBlock", "ThinkingBlock", "ToolUseBlock", "ToolResultBlock")
+
+
+def recording_key(prompt: str, options: Any) -> str:
+    """Stable name for the exchange: both prompts and the allowed tools."""
+    digest = hashlib.sha256()
+    system_prompt = getattr(options, "system_prompt", None)
+    for part in (str(system_prompt or ""), prompt, ",".join(getattr(options, "allowed_tools", None) or [])):
+        digest.update(hashlib.sha256(part.encode("utf-8")).digest())
+    return digest.hexdigest()
+
+
+def _encode_value(value: Any) -> Any:
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return encode_message(value)
+    if isinstance(value, list):
+        return [_encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _encode_value(item) for key, item in value.items()}
+    return value
+
+
+def encode_message(message: Any) -> Dict[str, Any]:
+    """SDK message or content block -> JSON-safe dict tagged with its class name."""
+    data: Dict[str, Any] = {"_type": type(message).__name__}
+    for item in dataclasses.fields(message):
+        data[item.name] = _encode_value(getattr(message, item.name))
+    return data
+
+
+def _decode_value(value: Any, types) -> Any:
+    if isinstance(value, dict):
+        if value.get("_type") in BLOCK_TYPES:
+            return decode_message(value, types)
+        return {key: _decode_value(item, types) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode_value(item, types) for item in value]
+    return value
+
+
+def decode_message(data: Dict[str, Any], types=None) -> Any:
+    """Rebuild the SDK object, ignoring fields the installed SDK version does not have."""
+    if types is None:
+        from claude_agent_sdk import types
+    name = data.get("_type")
+    if name not in MESSAGE_TYPES + BLOCK_TYPES:
+        raise ValueError(f"unknown recorded message type: {name}")
+    cls = getattr(types, name)
+    known = {item.name for item in dataclasses.fields(cls)}
+    return cls(**{key: _decode_value(value, types) for key, value in data.items() if key in known})
+
+
+class LiveTransport:
+    """The real Agent SDK."""
+
+    name = "live"
+
+    async def query(self, prompt: str, options: Any) -> AsyncIterator[Any]:
+        from claude_agent_sdk import query
+
+        async for message in query(prompt=prompt, options=options):
+            yield message
+
+
+@dataclass
+class RecordingTransport:
+    """Pass the live stream through and save it, with arrival offsets, as ``<key>.jsonl``.
+
+    A recording is written only once its stream completes, so interrupted
+    calls never leave partial files for replay.
+    """
+
+    root: Path
+    inner: Any = None
+    name: str = "record"
+
+    async def query(self, prompt: str, options: Any) -> AsyncIterator[Any]:
+        inner = self.inner or LiveTransport()
+        key = recording_key(prompt, options)
+        lines: List[str] = [
+            json.dumps(
+                {
+                    "version": RECORDING_VERSION,
+                    "key": key,
+                    "recorded_at": time.time(),
+                    "prompt_chars": len(prompt),
+                    "partial_messages": bool(getattr(options, "include_partial_messages", False)),
+                }
+            )
+        ]
+        start = time.monotonic()
+        async for message in inner.query(prompt, options):
+            offset = round(time.monotonic() - start, 4)
+            lines.append(json.dumps({"t": offset, "message": encode_message(message)}))
+            yield message
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / f"{key}.jsonl"
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+def read_recording(path: Path) -> List[Dict[str, Any]]:
+    """Timed entries of a recording (header line dropped)."""
+    entries: List[Dict[str, Any]] = []
+    with path.open(encoding="utf-8") as handle:
+        header = json.loads(handle.readline() or "{}")
+        if header.get("version") != RECORDING_VERSION:
+            raise SystemExit(f"Unsupported recording format: {path}")
+        for line in handle:
+            if line.strip():
+                entries.append(json.loads(line))
+    return entries
+
+
+@dataclass
+class ReplayTransport:
+    """Emit a recorded message stream instead of calling the API.
+
+    ``source`` is a recordings directory, looked up by prompt key, or a single
+    ``.jsonl`` recording replayed for every query (handy for load tests where
+    prompts differ). Messages keep their recorded spacing divided by
+    ``speed``; ``speed=0`` emits them back to back. Stream events are dropped
+    when the caller did not ask for partial messages, as the SDK would.
+    """
+
+    source: Path
+    speed: float = 1.0
+    name: str = "replay"
+
+    def _recording_for(self, prompt: str, options: Any) -> Path:
+        if self.source.is_file():
+            return self.source
+        key = recording_key(prompt, options)
+        path = self.source / f"{key}.jsonl"
+        if not path.exists():
+            raise SystemExit(f"No recording for this prompt in {self.source} (key {key[:12]}). Record it first.")
+        return path
+
+    async def query(self, prompt: str, options: Any) -> AsyncIterator[Any]:
+        import asyncio
+
+        from claude_agent_sdk import types
+
+        entries = read_recording(self._recording_for(prompt, options))
+        partial = bool(getattr(options, "include_partial_messages", False))
+        start = time.monotonic()
+        for entry in entries:
+            data = entry["message"]
+            if data.get("_type") == "StreamEvent" and not partial:
+                continue
+            if self.speed > 0:
+                delay = start + float(entry.get("t", 0.0)) / self.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield decode_message(data, types)
+
+
+def open_transport(
+    config: AgentConfig,
+    mode: Optional[str] = None,
+    recordings: Optional[Path] = None,
+    speed: Optional[float] = None,
+):
+    """Transport for ``mode`` (default ``AGENT_TRANSPORT``), recording to or replaying from ``recordings``."""
+    mode = mode or config.agent_transport
+    if mode not in TRANSPORT_MODES:
+        raise SystemExit(f"Unknown transport '{mode}'. Choose one of: {', '.join(TRANSPORT_MODES)}.")
+    path = config.resolve(recordings or config.recordings_path)
+    if mode == "record":
+        return RecordingTransport(root=path)
+    if mode == "replay":
+        if not path.exists():
+            raise SystemExit(f"Recordings not found: {path}")
+        return ReplayTransport(source=path, speed=config.replay_speed if speed is None else speed)
+    return LiveTransport()
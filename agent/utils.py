@@ -1,21 +1,146 @@
-import re
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Iterator, List, Optional, Tuple
 
 
-def extract_dockerfile(text: str) -> str:
-    pattern = r"```dockerfile\n(.*?)```"
-    match = re.search(pattern, text, re.DOTALL)
-    if match:
-        return match.group(1).strip()
+@dataclass
+class FencedBlock:
+    """A fenced code block located in a response.
+
+    Offsets index into the parsed string: ``start``/``end`` span the whole
+    block including both fence lines, and ``text[content_start:content_end]``
+    is exactly ``content`` (the body lines, without the newline before the
+    closing fence). Unclosed blocks run to the end of the text with
+    ``closed=False``.
+    """
+
+    info: str
+    content: str
+    fence: str
+    start: int
+    end: int
+    content_start: int
+    content_end: int
+    closed: bool = True
+
+
+def _fence_marker(line: str) -> Optional[Tuple[str, str]]:
+    body = line.lstrip()
+    char = body[:1]
+    if char not in ("`", "~") or not body.startswith(char * 3):
+        return None
+    rest = body.lstrip(char)
+    return body[: len(body) - len(rest)], rest
+
+
+class FenceParser:
+    """Single-pass fence state machine fed one line at a time.
+
+    A block opens on a line starting with three or more backticks (or
+    tildes) and closes only on a line holding a fence of the same character
+    that is at least as long and has nothing after it. Shorter or inline
+    backtick runs inside the body never end the block, so a four-backtick
+    fence can wrap content containing ``` lines. Each line is inspected once,
+    so parsing is linear in the input size.
+    """
+
+    def __init__(self) -> None:
+        self._offset = 0
+        self._fence: Optional[str] = None
+        self._info = ""
+        self._start = 0
+        self._content_start = 0
+        self._lines: List[str] = []
+
+    def feed_line(self, line: str, newline: bool = True) -> Optional[FencedBlock]:
+        """Consume one line (without its newline) and return a block it closes."""
+        line_start = self._offset
+        self._offset += len(line) + (1 if newline else 0)
+        marker = _fence_marker(line)
+
+        if self._fence is None:
+            if marker is None:
+                return None
+            fence, rest = marker
+            if fence[0] == "`" and "`" in rest:
+                return None
+            self._fence = fence
+            self._info = rest.strip()
+            self._start = line_start
+            self._content_start = self._offset
+            self._lines = []
+            return None
+
+        if marker is not None:
+            fence, rest = marker
+            if fence[0] == self._fence[0] and len(fence) >= len(self._fence) and not rest.strip():
+                return self._emit(end=self._offset, closed=True)
+
+        self._lines.append(line)
+        return None
+
+    def close(self) -> Optional[FencedBlock]:
+        """End of input: return the still-open block, if any, as unclosed."""
+        if self._fence is None:
+            return None
+        return self._emit(end=self._offset, closed=False)
+
+    def _emit(self, end: int, closed: bool) -> FencedBlock:
+        content = "\n".join(self._lines)
+        block = FencedBlock(
+            info=self._info,
+            content=content,
+            fence=self._fence or "",
+            start=self._start,
+            end=end,
+            content_start=self._content_start,
+            content_end=self._content_start + len(content),
+            closed=closed,
+        )
+        self._fence = None
+        self._lines = []
+        return block
+
+
+def _iter_lines(text: str) -> Iterator[Tuple[str, bool]]:
+    position = 0
+    length = len(text)
+    while position < length:
+        newline = text.find("\n", position)
+        if newline == -1:
+            yield text[position:], False
+            return
+        yield text[position:newline], True
+        position = newline + 1
 
-    pattern = r"```\n(.*?)```"
-    match = re.search(pattern, text, re.DOTALL)
-    if match:
-        content = match.group(1).strip()
-        if content.startswith("FROM "):
-            return content
+
+def parse_fenced_blocks(text: str) -> List[FencedBlock]:
+    parser = FenceParser()
+    blocks: List[FencedBlock] = []
+    for line, newline in _iter_lines(text):
+        block = parser.feed_line(line, newline)
+        if block:
+            blocks.append(block)
+    trailing = parser.close()
+    if trailing:
+        blocks.append(trailing)
+    return blocks
+
+
+def extract_dockerfile(text: str, blocks: Optional[List[FencedBlock]] = None) -> str:
+    if blocks is None:
+        blocks = parse_fenced_blocks(text)
+    closed = [block for block in blocks if block.closed]
+
+    for block in closed:
+        if block.info == "dockerfile":
+            return block.content.strip()
+
+    for block in closed:
+        if not block.info:
+            content = block.content.strip()
+            if content.startswith("FROM "):
+                return content
 
     return ""
 
@@ -26,28 +151,73 @@ class FileBlock:
     content: str
 
 
-def extract_file_blocks(text: str) -> List[FileBlock]:
-    blocks: List[FileBlock] = []
-    pattern = r"```([^\n]*)\n(.*?)```"
-    for match in re.finditer(pattern, text, re.DOTALL):
-        info = match.group(1).strip()
-        content = match.group(2).strip()
-        path: Optional[str] = None
+def _file_block(info: str, content: str) -> Optional[FileBlock]:
+    info = info.strip()
+    content = content.strip()
+    path: Optional[str] = None
 
-        if info.lower().startswith("file:") or info.lower().startswith("path:"):
-            path = info.split(":", 1)[1].strip()
-        elif "dockerfile" in info.lower() and not info.lower().startswith("bash"):
-            path = "Dockerfile"
+    if info.lower().startswith("file:") or info.lower().startswith("path:"):
+        path = info.split(":", 1)[1].strip()
+    elif "dockerfile" in info.lower() and not info.lower().startswith("bash"):
+        path = "Dockerfile"
 
-        if not content:
-            continue
+    if not content:
+        return None
+
+    if path is None and not content.startswith("FROM "):
+        return None
+
+    return FileBlock(path=path, content=content)
 
-        if path is None and not content.startswith("FROM "):
+
+def extract_file_blocks(text: str, blocks: Optional[List[FencedBlock]] = None) -> List[FileBlock]:
+    if blocks is None:
+        blocks = parse_fenced_blocks(text)
+    file_blocks: List[FileBlock] = []
+    for block in blocks:
+        if not block.closed:
             continue
+        file_block = _file_block(block.info, block.content)
+        if file_block:
+            file_blocks.append(file_block)
 
-        blocks.append(FileBlock(path=path, content=content))
+    return file_blocks
 
-    return blocks
+
+class FileBlockStream:
+    """Incrementally extract file blocks from streamed response text.
+
+    Text is fed in arbitrary chunks; a block is returned from ``feed`` as soon
+    as the line holding its closing fence is complete.
+    """
+
+    def __init__(self) -> None:
+        self._parser = FenceParser()
+        self._pending: List[str] = []
+
+    def feed(self, text: str) -> List[FileBlock]:
+        if "\n" not in text:
+            self._pending.append(text)
+            return []
+        head, *lines, tail = text.split("\n")
+        self._pending.append(head)
+        lines.insert(0, "".join(self._pending))
+        self._pending = [tail] if tail else []
+        blocks: List[FileBlock] = []
+        for line in lines:
+            fenced = self._parser.feed_line(line)
+            file_block = _file_block(fenced.info, fenced.content) if fenced else None
+            if file_block:
+                blocks.append(file_block)
+        return blocks
+
+    def finish(self) -> List[FileBlock]:
+        """Flush a trailing line that has no newline (e.g. a final closing fence)."""
+        pending = "".join(self._pending)
+        self._pending = []
+        fenced = self._parser.feed_line(pending, newline=False) if pending else None
+        file_block = _file_block(fenced.info, fenced.content) if fenced else None
+        return [file_block] if file_block else []
 
 
 def resolve_output_path(target: Path, path_hint: Optional[str]) -> Path:
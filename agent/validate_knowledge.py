@@ -1,52 +1,224 @@
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
+from typing import List, Optional, Tuple
 
 from agent.config import AgentConfig
-from agent.knowledge_base import load_knowledge_base
+from agent.context.reference_loader import loader_for
+from agent.context.retrieval import ChunkIndex, open_chunk_index
+from agent.knowledge_artifact import CHARS_PER_TOKEN, CompiledKnowledge, compile_knowledge
+from agent.knowledge_base import KnowledgeBundle
+from agent.reference_selection import is_golden
 
 
-def _expand(repo_root: Path, patterns):
-    files = []
-    for pattern in patterns:
-        files.extend([path for path in repo_root.glob(pattern) if path.is_file()])
-    return files
+@dataclass
+class BundleReport:
+    id: str
+    refs: int
+    assets: int
+    base: Optional[str]
+    stack: Optional[str]
+    php: Optional[str]
+    errors: List[str] = field(default_factory=list)
 
 
-def main() -> int:
-    config = AgentConfig()
-    kb = load_knowledge_base(config.repo_root, config.knowledge_index_path)
+@dataclass
+class BudgetReport:
+    base: str
+    bundles: List[str]
+    native: bool
+    total_chars: int
+    budget_chars: int
+    est_tokens: int
+    files: int
+    retrieval: str = "off"
+    truncated: List[str] = field(default_factory=list)
+    over_budget: List[str] = field(default_factory=list)
+    partial: List[str] = field(default_factory=list)
 
-    print(f"Knowledge index: {kb.index_path}")
-    print(f"Bundles: {len(kb.bundles)}")
 
-    errors = []
-    for bundle in kb.bundles:
-        ref_files = _expand(config.repo_root, bundle.reference_globs)
-        asset_files = _expand(config.repo_root, bundle.asset_globs)
+def check_bundle(compiled: CompiledKnowledge, bundle: KnowledgeBundle) -> BundleReport:
+    """Pattern checks for one bundle, using the globs expanded once at compile time."""
+    refs = {path for pattern in bundle.reference_globs for path in compiled.globs.get(pattern, [])}
+    assets = {path for pattern in bundle.asset_globs for path in compiled.globs.get(pattern, [])}
+    report = BundleReport(
+        id=bundle.id,
+        refs=len(refs),
+        assets=len(assets),
+        base=bundle.base_os,
+        stack=bundle.stack,
+        php=bundle.php_tag,
+    )
+    if not refs:
+        report.errors.append(f"[{bundle.id}] no files match reference_globs")
+    for pattern in bundle.reference_globs:
+        if not compiled.globs.get(pattern):
+            report.errors.append(f"[{bundle.id}] no files matched pattern: {pattern}")
+    for pattern in bundle.asset_globs:
+        if not compiled.globs.get(pattern):
+            report.errors.append(f"[{bundle.id}] no files matched asset pattern: {pattern}")
+    return report
 
-        if not ref_files:
-            errors.append(f"[{bundle.id}] no files match reference_globs")
 
-        for pattern in bundle.reference_globs:
-            if not _expand(config.repo_root, [pattern]):
-                errors.append(f"[{bundle.id}] no files matched pattern: {pattern}")
+def combinations(bundles: List[KnowledgeBundle]) -> List[Tuple[str, List[KnowledgeBundle]]]:
+    """Bundle sets a run can select: the base's golden bundle plus each stack bundle, per base."""
+    stacks = [bundle for bundle in bundles if not is_golden(bundle)]
+    bases = sorted({bundle.base_os for bundle in bundles if bundle.base_os})
+    result: List[Tuple[str, List[KnowledgeBundle]]] = []
+    for base in bases:
+        goldens = [bundle for bundle in bundles if is_golden(bundle) and bundle.base_os == base]
+        golden = max(goldens, key=lambda item: item.priority) if goldens else None
+        for stack in stacks:
+            result.append((base, [item for item in (golden, stack) if item is not None]))
+    return result
 
-        for pattern in bundle.asset_globs:
-            if not _expand(config.repo_root, [pattern]):
-                errors.append(f"[{bundle.id}] no files matched asset pattern: {pattern}")
 
-        print(
-            f"- {bundle.id}: refs={len(ref_files)} assets={len(asset_files)} "
-            f"base={bundle.base_os or '-'} stack={bundle.stack or '-'} php={bundle.php_tag or '-'}"
+def simulate(
+    config: AgentConfig,
+    compiled: CompiledKnowledge,
+    base: str,
+    bundles: List[KnowledgeBundle],
+    chunk_index: Optional[ChunkIndex] = None,
+) -> BudgetReport:
+    """Load references for ``bundles`` as a run would, before any target-specific additions.
+
+    With ``chunk_index``, long files keep their bundle-matching sections as
+    in a ``REFERENCE_RETRIEVAL=bm25`` run; without it they are cut to their head.
+    """
+    loader = loader_for(config, compiled.knowledge_base(), bundles, counterparts=["Dockerfile"], retriever=chunk_index)
+    loaded = loader.load()
+    return BudgetReport(
+        base=base,
+        bundles=[bundle.id for bundle in bundles],
+        native=all(bundle.base_os in (None, base) for bundle in bundles),
+        total_chars=loaded.total_chars,
+        budget_chars=config.max_reference_chars_total,
+        est_tokens=-(-loaded.total_chars // CHARS_PER_TOKEN),
+        files=len(loaded.entries),
+        retrieval="bm25" if chunk_index is not None else "off",
+        truncated=[entry.path.as_posix() for entry in loaded.entries if entry.truncated],
+        over_budget=[item.path.as_posix() for item in loaded.dropped if item.kind == "over_budget"],
+        partial=[item.path.as_posix() for item in loaded.dropped if item.kind == "partial"],
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Validate knowledge bundles and simulate prompt budgets")
+    parser.add_argument(
+        "--knowledge-index",
+        help="Override knowledge index path (default: KNOWLEDGE_INDEX_PATH or knowledge/index.json)",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    parser.add_argument(
+        "--retrieval",
+        choices=["bm25", "off"],
+        help="Reference retrieval to simulate budgets with (default: REFERENCE_RETRIEVAL or bm25)",
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Also fail when any bundle combination drops files to fit the reference budget",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=min(8, os.cpu_count() or 1),
+        help="Bundles and combinations checked in parallel",
+    )
+    return parser.parse_args()
+
+
+def format_report(
+    compiled: CompiledKnowledge,
+    bundles: List[BundleReport],
+    budgets: List[BudgetReport],
+    errors: List[str],
+) -> List[str]:
+    lines = [f"Knowledge index: {compiled.repo_root / compiled.index_path}", f"Bundles: {len(bundles)}"]
+    for item in bundles:
+        lines.append(
+            f"- {item.id}: refs={item.refs} assets={item.assets} "
+            f"base={item.base or '-'} stack={item.stack or '-'} php={item.php or '-'}"
         )
 
+    retrieval = budgets[0].retrieval if budgets else "off"
+    lines.append(f"\nReference budget per combination (retrieval {retrieval}):")
+    header = f"{'base':<7} {'bundles':<40} {'chars':>7} {'budget':>7} {'tokens':>7} {'files':>5} {'trunc':>5} {'over':>5}"
+    lines.append(header)
+    lines.append("-" * len(header))
+    for item in budgets:
+        label = " + ".join(item.bundles) + ("" if item.native else " *")
+        lines.append(
+            f"{item.base:<7} {label:<40} {item.total_chars:>7} {item.budget_chars:>7} "
+            f"{item.est_tokens:>7} {item.files:>5} {len(item.truncated):>5} {len(item.over_budget):>5}"
+        )
+    if any(not item.native for item in budgets):
+        lines.append("* stack bundle built for another base (fallback selection)")
+    for item in budgets:
+        for path in item.over_budget:
+            lines.append(f"  [{item.base}: {' + '.join(item.bundles)}] over budget: {path}")
+
     if errors:
-        print("\nKnowledge validation failed:")
-        for item in errors:
-            print(f"  - {item}")
-        return 1
+        lines.append("\nKnowledge validation failed:")
+        lines.extend(f"  - {item}" for item in errors)
+    else:
+        lines.append("\nKnowledge validation passed.")
+    return lines
+
 
-    print("\nKnowledge validation passed.")
-    return 0
+def run_checks(
+    config: AgentConfig,
+    compiled: CompiledKnowledge,
+    workers: int = 1,
+    strict: bool = False,
+    chunk_index: Optional[ChunkIndex] = None,
+) -> Tuple[List[BundleReport], List[BudgetReport], List[str]]:
+    """Check every bundle and simulate every combination; returns the reports and the failures."""
+    bundles = compiled.bundles
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        bundle_reports = list(pool.map(lambda bundle: check_bundle(compiled, bundle), bundles))
+        budget_reports = list(
+            pool.map(lambda combo: simulate(config, compiled, combo[0], combo[1], chunk_index), combinations(bundles))
+        )
+
+    errors = [error for report in bundle_reports for error in report.errors]
+    if strict:
+        errors.extend(
+            f"[{report.base}: {' + '.join(report.bundles)}] {len(report.over_budget)} file(s) over budget"
+            for report in budget_reports
+            if report.over_budget
+        )
+    return bundle_reports, budget_reports, errors
+
+
+def main() -> int:
+    args = parse_args()
+    config = AgentConfig()
+    index_path = Path(args.knowledge_index) if args.knowledge_index else config.knowledge_index_path
+    compiled = compile_knowledge(config, index_path)
+    retrieval = args.retrieval or config.reference_retrieval
+    chunk_index = open_chunk_index(config) if retrieval == "bm25" else None
+    bundle_reports, budget_reports, errors = run_checks(config, compiled, args.workers, args.strict, chunk_index)
+
+    if args.json:
+        print(
+            json.dumps(
+                {
+                    "index": compiled.index_path,
+                    "bundles": [asdict(report) for report in bundle_reports],
+                    "budgets": [asdict(report) for report in budget_reports],
+                    "errors": errors,
+                },
+                indent=2,
+            )
+        )
+    else:
+        for line in format_report(compiled, bundle_reports, budget_reports, errors):
+            print(line)
+    return 1 if errors else 0
 
 
 if __name__ == "__main__":
@@ -0,0 +1 @@
+"""Offline benchmarks for the migration agent (run with ``python -m benchmarks.<name>``)."""
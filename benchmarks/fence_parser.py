@@ -0,0 +1,172 @@
+"""Microbenchmark: fenced-block parsing on large and adversarial responses.
+
+Compares ``agent.utils.parse_fenced_blocks`` (and the helpers built on it)
+with the previous regex implementation, and checks that parse time per
+character stays flat as inputs grow.
+
+    python -m benchmarks.fence_parser
+    python -m benchmarks.fence_parser --sizes 1,2,4,8 --json
+"""
+import argparse
+import json
+import re
+import time
+from typing import Callable, Dict, List
+
+from agent.utils import extract_dockerfile, extract_file_blocks, parse_fenced_blocks
+
+MB = 1024 * 1024
+
+
+def _legacy_extract(text: str) -> int:
+    # The regex pair the single-pass parser replaced.
+    count = len(re.findall(r"```([^\n]*)\n(.*?)```", text, re.DOTALL))
+    re.search(r"```dockerfile\n(.*?)```", text, re.DOTALL)
+    return count
+
+
+def _current_extract(text: str) -> int:
+    blocks = parse_fenced_blocks(text)
+    extract_file_blocks(text, blocks)
+    extract_dockerfile(text, blocks)
+    return len(blocks)
+
+
+def realistic(size: int) -> str:
+    unit = (
+        "The Dockerfile now builds for amd64 and arm64.\n\n"
+        "```dockerfile\nFROM alpine:3.20\nRUN apk add --no-cache php83 php83-fpm \\\n    supervisor\n"
+        "COPY core/ /opt/core/\n```\n\n"
+        "```file: core/php.ini\nmemory_limit = 512M\n; inline `code` and ``` in a comment\n```\n\n"
+    )
+    return (unit * (size // len(unit) + 1))[:size]
+
+
+def unclosed_fence(size: int) -> str:
+    # A long backtick run that never closes: every start position rescans the
+    # body, which makes the lazy DOTALL regex quadratic.
+    return "`" * (size // 2) + "\n" + "a" * (size // 2)
+
+
+def many_openers(size: int) -> str:
+    unit = "```x\n"
+    return unit * (size // len(unit))
+
+
+def backtick_noise(size: int) -> str:
+    unit = "RUN echo `date` ``x`` ```` not a fence\n"
+    return "````text\n" + unit * (size // len(unit))
+
+
+def long_single_line(size: int) -> str:
+    return "```dockerfile\nFROM " + ("a" * size)
+
+
+SCENARIOS: Dict[str, Callable[[int], str]] = {
+    "realistic": realistic,
+    "unclosed_fence": unclosed_fence,
+    "many_openers": many_openers,
+    "backtick_noise": backtick_noise,
+    "long_single_line": long_single_line,
+}
+
+
+def _time(func: Callable[[str], int], text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(sizes_mb: List[float], legacy_limit: int, repeat: int) -> List[dict]:
+    rows: List[dict] = []
+    for name, make in SCENARIOS.items():
+        for size_mb in sizes_mb:
+            text = make(int(size_mb * MB))
+            current = _time(_current_extract, text, repeat)
+            legacy = _time(_legacy_extract, text, 1) if len(text) <= legacy_limit else None
+            rows.append(
+                {
+                    "scenario": name,
+                    "size_mb": size_mb,
+                    "chars": len(text),
+                    "current_s": round(current, 5),
+                    "current_ns_per_char": round(current * 1e9 / max(1, len(text)), 2),
+                    "legacy_s": round(legacy, 5) if legacy is not None else None,
+                }
+            )
+    return rows
+
+
+def linearity(rows: List[dict]) -> Dict[str, float]:
+    """Ratio of the slowest to fastest ns/char per scenario (1.0 is perfectly linear)."""
+    ratios: Dict[str, float] = {}
+    for name in SCENARIOS:
+        # Sub-millisecond timings are mostly noise; leave them out of the ratio.
+        per_char = [
+            row["current_ns_per_char"]
+            for row in rows
+            if row["scenario"] == name and row["current_s"] >= 0.001
+        ]
+        if per_char and min(per_char) > 0:
+            ratios[name] = round(max(per_char) / min(per_char), 2)
+    return ratios
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark fenced-block parsing")
+    parser.add_argument("--sizes", default="0.25,1,2,4", help="Comma-separated input sizes in MB")
+    parser.add_argument(
+        "--legacy-limit",
+        type=int,
+        default=16 * 1024,
+        help="Largest input (chars) to time with the legacy regexes, which go quadratic",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--max-ratio",
+        type=float,
+        default=3.0,
+        help="Fail when ns/char grows by more than this factor across sizes",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    sizes = [float(item) for item in args.sizes.split(",") if item.strip()]
+    rows = run(sizes, args.legacy_limit, args.repeat)
+    # A small input the legacy regexes can still finish, to show the gap.
+    for name, make in SCENARIOS.items():
+        text = make(args.legacy_limit)
+        rows.append(
+            {
+                "scenario": name,
+                "size_mb": round(len(text) / MB, 3),
+                "chars": len(text),
+                "current_s": round(_time(_current_extract, text, args.repeat), 5),
+                "current_ns_per_char": None,
+                "legacy_s": round(_time(_legacy_extract, text, 1), 5),
+            }
+        )
+    ratios = linearity([row for row in rows if row["current_ns_per_char"] is not None])
+
+    if args.json:
+        print(json.dumps({"results": rows, "linearity": ratios}, indent=2))
+    else:
+        print(f"{'scenario':<18} {'MB':>7} {'current s':>11} {'ns/char':>9} {'legacy s':>10}")
+        for row in rows:
+            legacy = f"{row['legacy_s']:.4f}" if row["legacy_s"] is not None else "-"
+            per_char = f"{row['current_ns_per_char']:.1f}" if row["current_ns_per_char"] is not None else "-"
+            print(f"{row['scenario']:<18} {row['size_mb']:>7} {row['current_s']:>11.4f} {per_char:>9} {legacy:>10}")
+        print("linearity (max/min ns per char): " + ", ".join(f"{k}={v}" for k, v in ratios.items()))
+
+    worst = max(ratios.values(), default=1.0)
+    if worst > args.max_ratio:
+        print(f"FAIL: parse time grew super-linearly (ratio {worst} > {args.max_ratio})")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
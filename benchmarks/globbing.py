@@ -0,0 +1,145 @@
+"""Microbenchmark: expanding bundle globs.
+
+Compares ``agent.globbing.expand_patterns`` (one walk per distinct subtree)
+with calling ``Path.glob`` once per pattern, on the real ``knowledge/``
+patterns and on a synthetic knowledge tree with thousands of files, and
+checks that both return the same files.
+
+    python -m benchmarks.globbing
+    python -m benchmarks.globbing --stacks 40 --json
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from agent.config import AgentConfig
+from agent.globbing import PRUNED_DIRS, expand_patterns
+from agent.knowledge_base import load_knowledge_base
+
+STACK_FILES = {
+    "Dockerfile": "FROM alpine:3.20\n",
+    "core/scripts/entrypoint.sh": "#!/bin/sh\nexec \"$@\"\n",
+    "core/scripts/notify.sh": "#!/bin/sh\n",
+    "core/supervisor/supervisord.conf": "[supervisord]\nnodaemon=true\n",
+    "core/nginx/nginx.conf": "worker_processes auto;\n",
+    "core/php/php.ini": "memory_limit = 512M\n",
+    "core/php/conf.d/opcache.ini": "opcache.enable=1\n",
+    "core/newrelic/newrelic.ini.template": "newrelic.appname = \"app\"\n",
+    "core/newrelic/newrelic-php5-11.0.0.1-linux-musl.tar.gz": "\x1f\x8b",
+    "README.md": "# stack\n",
+}
+NOISE_DIRS = ("core/vendor/pkg{n}/src", "core/node_modules/mod{n}/lib", "core/docs/section{n}")
+STACK_GLOBS = (
+    "Dockerfile",
+    "core/**/*.sh",
+    "core/**/*.conf",
+    "core/**/*.ini",
+    "core/**/*.template",
+)
+ASSET_GLOB = "core/newrelic/newrelic-php5-*.tar.gz"
+
+
+def knowledge_patterns(config: AgentConfig) -> List[str]:
+    knowledge_base = load_knowledge_base(config.repo_root, config.knowledge_index_path)
+    patterns = list(knowledge_base.global_reference_globs)
+    for bundle in knowledge_base.bundles:
+        patterns.extend(bundle.reference_globs)
+        patterns.extend(bundle.asset_globs)
+    return list(dict.fromkeys(patterns))
+
+
+def build_synthetic_tree(root: Path, stacks: int, noise_per_stack: int) -> List[str]:
+    """``stacks`` bundles shaped like the real ones, each with ``noise_per_stack`` unrelated files."""
+    patterns: List[str] = []
+    for index in range(stacks):
+        stack = root / "knowledge" / "sources" / f"stack-{index:03d}"
+        for rel, content in STACK_FILES.items():
+            path = stack / rel
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content, encoding="utf-8")
+        for number in range(noise_per_stack):
+            directory = stack / NOISE_DIRS[number % len(NOISE_DIRS)].format(n=number % 7)
+            directory.mkdir(parents=True, exist_ok=True)
+            suffix = (".php", ".js", ".txt", ".conf", ".png")[number % 5]
+            (directory / f"file{number}{suffix}").write_text("x\n", encoding="utf-8")
+        prefix = stack.relative_to(root).as_posix()
+        patterns.extend(f"{prefix}/{pattern}" for pattern in STACK_GLOBS)
+        patterns.append(f"{prefix}/{ASSET_GLOB}")
+    return patterns
+
+
+def per_pattern(base_dir: Path, patterns: List[str]) -> Dict[str, List[Path]]:
+    results: Dict[str, List[Path]] = {}
+    for pattern in patterns:
+        results[pattern] = sorted(
+            path
+            for path in base_dir.glob(pattern)
+            if path.is_file() and not PRUNED_DIRS.intersection(path.relative_to(base_dir).parts)
+        )
+    return results
+
+
+def _time(func: Callable[[], Dict[str, List[Path]]], repeat: int) -> Tuple[float, Dict[str, List[Path]]]:
+    best = float("inf")
+    result: Dict[str, List[Path]] = {}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def compare(name: str, base_dir: Path, patterns: List[str], repeat: int) -> dict:
+    legacy_s, legacy = _time(lambda: per_pattern(base_dir, patterns), repeat)
+    engine_s, engine = _time(lambda: expand_patterns(base_dir, patterns), repeat)
+    mismatched = [pattern for pattern in patterns if legacy.get(pattern) != engine.get(pattern)]
+    return {
+        "tree": name,
+        "patterns": len(patterns),
+        "files_matched": len({path for paths in engine.values() for path in paths}),
+        "per_pattern_s": round(legacy_s, 5),
+        "engine_s": round(engine_s, 5),
+        "speedup": round(legacy_s / engine_s, 2) if engine_s else None,
+        "mismatched": mismatched,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark multi-pattern glob expansion")
+    parser.add_argument("--stacks", type=int, default=20, help="Bundles in the synthetic tree")
+    parser.add_argument("--noise", type=int, default=200, help="Unrelated files per synthetic bundle")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    config = AgentConfig()
+    rows = [compare("knowledge", config.repo_root, knowledge_patterns(config), args.repeat)]
+    with tempfile.TemporaryDirectory(prefix="glob-bench-") as tmp:
+        root = Path(tmp)
+        patterns = build_synthetic_tree(root, args.stacks, args.noise)
+        total_files = sum(1 for path in root.rglob("*") if path.is_file())
+        row = compare("synthetic", root, patterns, args.repeat)
+        row["tree_files"] = total_files
+        rows.append(row)
+
+    if args.json:
+        print(json.dumps({"results": rows}, indent=2))
+    else:
+        print(f"{'tree':<10} {'patterns':>8} {'matched':>8} {'per-pattern s':>14} {'engine s':>10} {'speedup':>8}")
+        for row in rows:
+            print(
+                f"{row['tree']:<10} {row['patterns']:>8} {row['files_matched']:>8} "
+                f"{row['per_pattern_s']:>14.4f} {row['engine_s']:>10.4f} {row['speedup']:>7}x"
+            )
+
+    failed = [row for row in rows if row["mismatched"]]
+    for row in failed:
+        print(f"FAIL: {row['tree']}: results differ for {', '.join(row['mismatched'][:5])}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,198 @@
+"""Benchmark: a very long job log through the Textual launcher.
+
+Runs the launcher headless, feeds ``--lines`` mixed log lines (debug
+output, markdown, tables, status lines) into one selected job in chunks, as
+a chatty subprocess would, and reports how long the event loop stalled, how
+long the view took to catch up, peak memory, and how many lines stayed in
+memory versus the job's spill file. Up to ``--legacy-limit`` of the same
+lines are also rendered the previous way, one ``RichLog.write`` per line.
+
+    python -m benchmarks.launcher_log
+    python -m benchmarks.launcher_log --lines 200000 --json
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from rich.markdown import Markdown
+from rich.text import Text
+
+from agent.log_sink import line_style, looks_like_markdown
+
+UNIT = (
+    "[debug] tool call Read {'file_path': 'docker/php.ini'}",
+    "[debug] tool result 1832 chars",
+    "Resolving references for alpine/laravel",
+    "## Summary",
+    "- Switched the base image to **alpine:3.20**",
+    "- Added buildx platforms `linux/amd64` and `linux/arm64`",
+    "1. Build with docker buildx bake",
+    "| File | Change | Status |",
+    "|------|--------|--------|",
+    "| Dockerfile | multi-arch base | :white_check_mark: |",
+    "RUN apk add --no-cache php83 php83-fpm supervisor",
+    "[warn] reference cache miss",
+)
+
+
+def make_lines(count: int) -> List[str]:
+    lines = []
+    for index in range(count):
+        line = UNIT[index % len(UNIT)]
+        lines.append(line if line.startswith("|") else f"{line} ({index})")
+    return lines
+
+
+def _legacy_write(app, log, text: str) -> None:
+    # The per-line rendering the frame batcher replaced.
+    stripped = text.strip()
+    if stripped.startswith("|") and stripped.count("|") >= 3:
+        log.write(app._render_table_line(stripped))
+    elif looks_like_markdown(text):
+        log.write(Markdown(text))
+    else:
+        log.write(Text(text, style=line_style(text) or ""))
+
+
+def _rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+async def _probe(stalls: List[float], stop: asyncio.Event, interval: float = 0.005) -> None:
+    """Record how late each short sleep wakes up: the event loop's stall time."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - started - interval)
+
+
+async def _feed(lines: List[str], chunk: int, push: Callable[[str], None]) -> None:
+    for start in range(0, len(lines), chunk):
+        for line in lines[start : start + chunk]:
+            push(line)
+        await asyncio.sleep(0)
+
+
+def _stall_stats(stalls: List[float]) -> Dict[str, float]:
+    ordered = sorted(stalls) or [0.0]
+    return {
+        "max_stall_ms": round(ordered[-1] * 1000, 1),
+        "p95_stall_ms": round(ordered[int(len(ordered) * 0.95)] * 1000, 1),
+    }
+
+
+async def run(count: int, legacy_limit: int, chunk: int) -> Dict[str, dict]:
+    from agent.textual_launcher import MigrationLauncherApp
+    from textual.widgets import RichLog
+
+    lines = make_lines(count)
+    app = MigrationLauncherApp()
+    results: Dict[str, dict] = {}
+    async with app.run_test(size=(160, 50)) as pilot:
+        await app.workers.wait_for_complete()
+        await pilot.pause()
+        log = app.query_one("#log_view", RichLog)
+
+        fed = asyncio.Event()
+
+        async def job_run(job) -> bool:
+            await _feed(lines, chunk, lambda line: app._job_log(job, line))
+            fed.set()
+            return True
+
+        stalls: List[float] = []
+        stop = asyncio.Event()
+        probe = asyncio.ensure_future(_probe(stalls, stop))
+        rss_before = _rss_mb()
+        started = time.perf_counter()
+        job = app._submit("Benchmark", "-", run=job_run)
+        await fed.wait()
+        fed_at = time.perf_counter()
+        while len(app._batcher) or job.state == "running":
+            await asyncio.sleep(0.005)
+        done_at = time.perf_counter()
+        stop.set()
+        await probe
+        spill = job.lines.spill_path
+        results["current"] = {
+            "lines": count,
+            "feed_s": round(fed_at - started, 3),
+            "drain_s": round(done_at - fed_at, 3),
+            "total_s": round(done_at - started, 3),
+            **_stall_stats(stalls),
+            "peak_rss_mb": _rss_mb(),
+            "rss_growth_mb": round(_rss_mb() - rss_before, 1),
+            "buffered_lines": len(job.lines),
+            "spilled_lines": job.lines.spilled,
+            "spill_bytes": spill.stat().st_size if spill and spill.exists() else 0,
+            "view_lines": len(log.lines),
+        }
+
+        if legacy_limit:
+            app.action_clear_logs()
+            log.max_lines = None
+            await pilot.pause()
+            stalls = []
+            stop = asyncio.Event()
+            probe = asyncio.ensure_future(_probe(stalls, stop))
+            started = time.perf_counter()
+            await _feed(lines[:legacy_limit], chunk, lambda line: _legacy_write(app, log, line))
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await probe
+            results["legacy"] = {
+                "lines": legacy_limit,
+                "total_s": round(elapsed, 3),
+                **_stall_stats(stalls),
+                "projected_total_s": round(elapsed * count / legacy_limit, 1),
+                "view_lines": len(log.lines),
+            }
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark launcher log rendering")
+    parser.add_argument("--lines", type=int, default=100_000, help="Log lines pushed through one job")
+    parser.add_argument("--chunk", type=int, default=500, help="Lines pushed between event-loop yields")
+    parser.add_argument(
+        "--legacy-limit",
+        type=int,
+        default=5_000,
+        help="Lines to render with the previous per-line writes (0 skips them)",
+    )
+    parser.add_argument(
+        "--max-stall-ms",
+        type=float,
+        default=250.0,
+        help="Fail when the event loop stalls longer than this while logging",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep spill files and metrics out of the repo.
+        os.environ["LAUNCHER_LOG_DIR"] = str(Path(tmp) / "logs")
+        os.environ.setdefault("METRICS_PATH", "off")
+        results = asyncio.run(run(args.lines, args.legacy_limit, args.chunk))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, row in results.items():
+            print(f"{name}: " + ", ".join(f"{key}={value}" for key, value in row.items()))
+
+    stall = results["current"]["max_stall_ms"]
+    if stall > args.max_stall_ms:
+        print(f"FAIL: event loop stalled {stall} ms (> {args.max_stall_ms} ms)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
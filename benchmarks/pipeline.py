@@ -0,0 +1,428 @@
+"""End-to-end benchmark: the local migration pipeline on a synthetic corpus.
+
+Generates N target repositories (alpine/debian x laravel/worker x
+php83/84/85, each with a ``core/`` tree, CI file and New Relic assets) and
+runs every local stage against the real ``knowledge/`` base with the LLM
+call replaced by a canned response:
+
+    load_knowledge_base -> select_references -> discover_related_files
+    -> ReferenceLoader.load -> build_system_prompt -> write_outputs
+
+Per-stage and whole-pipeline p50/p95, throughput, a projection for the
+inventory size and peak memory are reported; results can be saved as a
+baseline and later runs compared against it.
+
+    python -m benchmarks.pipeline
+    python -m benchmarks.pipeline --targets 300 --json
+    python -m benchmarks.pipeline --save-baseline .cache/bench-pipeline.json
+    python -m benchmarks.pipeline --baseline .cache/bench-pipeline.json --tolerance 0.25
+"""
+import argparse
+import itertools
+import json
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import replace
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from agent.config import AgentConfig
+from agent.context.reference_loader import loader_for
+from agent.context.retrieval import ChunkIndex, open_chunk_index, query_terms
+from agent.knowledge_artifact import compile_knowledge, load_knowledge
+from agent.knowledge_base import KnowledgeBase, load_knowledge_base
+from agent.main import build_user_prompt, discover_ci_files, prepare_migration, write_outputs
+from agent.prompts import build_prompt_segments, join_segments
+from agent.reference_assets import find_newrelic_assets
+from agent.reference_selection import detect_php_tag, select_references
+from agent.related_files import FileClassCache, discover_related_files
+
+BASES = ("alpine", "debian")
+STACKS = ("laravel", "worker")
+PHP_VERSIONS = ("8.3", "8.4", "8.5")
+STAGES = (
+    "select_references",
+    "discover_related_files",
+    "reference_loader",
+    "build_system_prompt",
+    "llm_stub",
+    "write_outputs",
+)
+# Stage deltas below this are timer noise, whatever the ratio says.
+NOISE_FLOOR_MS = 0.5
+# With fewer samples p95 is just the slowest run; only p50 is compared.
+MIN_P95_SAMPLES = 20
+SETUP_REPEAT = 5
+
+ALPINE_PACKAGES = "php{tag} php{tag}-fpm php{tag}-opcache php{tag}-pdo_mysql php{tag}-mbstring php{tag}-xml"
+DEBIAN_PACKAGES = "php{ver}-fpm php{ver}-opcache php{ver}-mysql php{ver}-mbstring php{ver}-xml"
+
+
+def _dockerfile(base: str, stack: str, version: str) -> str:
+    tag = version.replace(".", "")
+    if base == "alpine":
+        image = "alpine:3.19"
+        install = f"RUN apk add --no-cache nginx supervisor curl {ALPINE_PACKAGES.format(tag=tag)}"
+    else:
+        image = "debian:bookworm-slim"
+        install = (
+            "RUN apt-get update && apt-get install -y --no-install-recommends nginx supervisor curl "
+            f"{DEBIAN_PACKAGES.format(ver=version)} && rm -rf /var/lib/apt/lists/*"
+        )
+    lines = [
+        f"FROM {image}",
+        "ARG NEWRELIC_VERSION=10.21.0.11",
+        install,
+        "WORKDIR /var/www/html",
+        "COPY core/ /opt/core/",
+        "COPY core/php.ini /usr/local/etc/php/php.ini",
+        "COPY core/supervisord.conf /etc/supervisor/conf.d/supervisord.conf",
+        f"COPY core/newrelic/newrelic-php5-10.21.0.11-linux{'-musl' if base == 'alpine' else ''}.tar.gz /tmp/",
+        "COPY core/docker-entrypoint.sh /usr/local/bin/docker-entrypoint.sh",
+    ]
+    if stack == "laravel":
+        lines += ["COPY core/nginx.conf /etc/nginx/nginx.conf", "COPY core/www.conf /etc/php/fpm/pool.d/www.conf"]
+        lines += ["COPY . /var/www/html", "EXPOSE 80"]
+    else:
+        lines += ["COPY app/ /var/www/html/app/"]
+    lines += [
+        'ENTRYPOINT ["/usr/local/bin/docker-entrypoint.sh"]',
+        'CMD ["supervisord", "-c", "/etc/supervisor/conf.d/supervisord.conf"]',
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def _core_files(base: str, stack: str, version: str, rng: random.Random) -> Dict[str, str]:
+    ini_lines = [f"memory_limit = {rng.choice((256, 512, 1024))}M", "max_execution_time = 60", "expose_php = Off"]
+    ini_lines += [f"; tuning note {index}\nopcache.option_{index} = {rng.randint(0, 9999)}" for index in range(40)]
+    programs = ["php-fpm"] + (["nginx"] if stack == "laravel" else ["queue-worker", "scheduler"])
+    supervisor = ["[supervisord]", "nodaemon=true", "user=root"]
+    for program in programs:
+        supervisor += ["", f"[program:{program}]", f"command=/usr/local/bin/{program}", "autorestart=true"]
+    files = {
+        "core/php.ini": "\n".join(ini_lines) + "\n",
+        "core/supervisord.conf": "\n".join(supervisor) + "\n",
+        "core/docker-entrypoint.sh": "#!/bin/sh\nset -e\n# render config\nenvsubst < /opt/core/newrelic/newrelic.ini.template > /etc/newrelic.ini\nexec \"$@\"\n",
+        "core/scripts/notify.sh": "#!/bin/sh\ncurl -fsS -X POST \"$WEBHOOK\" -d \"$1\"\n",
+        "core/scripts/healthcheck.sh": "#!/bin/sh\ncurl -fsS http://127.0.0.1/health || exit 1\n",
+        "core/newrelic/newrelic.ini.template": f"newrelic.appname = \"${{APP_NAME}}\"\nnewrelic.license = \"${{NR_KEY}}\"\n; php {version}\n",
+        ".gitlab-ci.yml": "stages: [build]\nbuild:\n  stage: build\n  script:\n    - docker build -t $CI_REGISTRY_IMAGE .\n",
+        ".dockerignore": "vendor/\nnode_modules/\n*.log\n",
+        "app/Console/Kernel.php": "<?php\n// scheduled commands\n" * rng.randint(5, 30),
+    }
+    if stack == "laravel":
+        files["core/nginx.conf"] = "worker_processes auto;\nevents { worker_connections 1024; }\nhttp { include /etc/nginx/conf.d/*.conf; }\n"
+        files["core/www.conf"] = "[www]\nuser = www-data\npm = dynamic\npm.max_children = 20\n"
+        for index in range(rng.randint(10, 40)):
+            files[f"app/Http/Controllers/Controller{index}.php"] = "<?php\nclass C {}\n" * 20
+        for index in range(50):
+            files[f"vendor/pkg{index % 5}/src/File{index}.php"] = "<?php\n"
+    return files
+
+
+def build_corpus(root: Path, count: int, seed: int = 0) -> List[Tuple[Path, str]]:
+    """``count`` target repositories cycling through every base/stack/PHP variant; returns (Dockerfile, task)."""
+    rng = random.Random(seed)
+    variants = list(itertools.product(BASES, STACKS, PHP_VERSIONS))
+    targets: List[Tuple[Path, str]] = []
+    for index in range(count):
+        base, stack, version = variants[index % len(variants)]
+        repo = root / f"repo-{index:04d}-{base}-{stack}-php{version.replace('.', '')}"
+        for rel, content in _core_files(base, stack, version, rng).items():
+            path = repo / rel
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content, encoding="utf-8")
+        newrelic = repo / "core" / "newrelic" / f"newrelic-php5-10.21.0.11-linux{'-musl' if base == 'alpine' else ''}.tar.gz"
+        newrelic.write_bytes(b"\x1f\x8b\x08\x00" + rng.randbytes(4096))
+        dockerfile = repo / "Dockerfile"
+        dockerfile.write_text(_dockerfile(base, stack, version), encoding="utf-8")
+        task = f"Migrate this {stack} image to the {base} golden image with multi-arch (amd64/arm64) support"
+        targets.append((dockerfile, task))
+    return targets
+
+
+def stub_response(target_path: Path, target_text: str) -> str:
+    """What a typical successful reply looks like: a Dockerfile block plus one updated config."""
+    php_ini = target_path.parent / "core" / "php.ini"
+    return (
+        "Updated the image for the golden base and multi-arch builds.\n\n"
+        f"```file: Dockerfile\n{target_text}ARG TARGETARCH\n```\n\n"
+        f"```file: core/php.ini\n{php_ini.read_text(encoding='utf-8')}opcache.jit = tracing\n```\n"
+    )
+
+
+def _clean_outputs(written: List[Path]) -> None:
+    for path in written:
+        path.unlink(missing_ok=True)
+
+
+def _silent(_: str) -> None:
+    pass
+
+
+def _timed(samples: Dict[str, List[float]], stage: str, func: Callable[[], object]):
+    started = time.perf_counter()
+    result = func()
+    samples.setdefault(stage, []).append(time.perf_counter() - started)
+    return result
+
+
+def run_stages(
+    config: AgentConfig,
+    knowledge_base: KnowledgeBase,
+    targets: List[Tuple[Path, str]],
+    class_cache: FileClassCache,
+    chunk_index: Optional[ChunkIndex],
+    samples: Dict[str, List[float]],
+) -> None:
+    """Each stage timed on its own, called the way ``prepare_migration`` calls it."""
+    for target_path, task in targets:
+        target_text = target_path.read_text(encoding="utf-8")
+        selection = _timed(
+            samples,
+            "select_references",
+            lambda: select_references(task, target_path, target_text, knowledge_base.bundles),
+        )
+
+        def related():
+            result = discover_related_files(target_path, target_text, class_cache=class_cache)
+            return result, discover_ci_files(target_path)
+
+        related_result, ci_files = _timed(samples, "discover_related_files", related)
+        counterparts = [target_path.name, *(item.path.name for item in related_result.files)]
+        references = _timed(
+            samples,
+            "reference_loader",
+            lambda: loader_for(
+                config,
+                knowledge_base,
+                selection.selected,
+                counterparts=counterparts,
+                retriever=chunk_index,
+                query=query_terms(task, target_text) if chunk_index else (),
+            ).load(),
+        )
+
+        def prompt():
+            assets = find_newrelic_assets(config.repo_root, selection.selected, knowledge_base.compiled)
+            system_prompt = join_segments(build_prompt_segments(references, selection, assets))
+            user_prompt = build_user_prompt(
+                target_path,
+                task,
+                "propose",
+                [item.path for item in related_result.files] + ci_files,
+                related_result.binary_files,
+                detect_php_tag(task, ""),
+                detect_php_tag("", target_text),
+            )
+            return system_prompt, user_prompt
+
+        _timed(samples, "build_system_prompt", prompt)
+        response = _timed(samples, "llm_stub", lambda: stub_response(target_path, target_text))
+        written = _timed(
+            samples,
+            "write_outputs",
+            lambda: write_outputs(response, target_path, write=True, log=_silent),
+        )
+        _clean_outputs(written)
+
+
+def run_pipeline(
+    config: AgentConfig,
+    knowledge_base: KnowledgeBase,
+    targets: List[Tuple[Path, str]],
+    class_cache: FileClassCache,
+    chunk_index: Optional[ChunkIndex],
+    samples: List[float],
+) -> None:
+    """The real per-target path: ``prepare_migration``, the stubbed reply, ``write_outputs``."""
+    for target_path, task in targets:
+        started = time.perf_counter()
+        plan = prepare_migration(
+            config,
+            knowledge_base,
+            target_path,
+            task,
+            "propose",
+            log=_silent,
+            class_cache=class_cache,
+            chunk_index=chunk_index,
+        )
+        response = stub_response(target_path, target_path.read_text(encoding="utf-8"))
+        written = write_outputs(response, plan.target_path, write=True, log=_silent)
+        samples.append(time.perf_counter() - started)
+        _clean_outputs(written)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "n": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+        "total_s": round(sum(samples), 4),
+    }
+
+
+def compare_baseline(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Stages whose p50 or p95 grew by more than ``tolerance`` (and the noise floor) since the baseline."""
+    regressions: List[str] = []
+    for section in ("setup", "stages"):
+        for name, stats in current[section].items():
+            before = baseline.get(section, {}).get(name)
+            if not before:
+                continue
+            keys = ("p50_ms", "p95_ms") if stats["n"] >= MIN_P95_SAMPLES else ("p50_ms",)
+            for key in keys:
+                old, new = before.get(key, 0.0), stats[key]
+                if old and new > old * (1 + tolerance) and new - old > NOISE_FLOOR_MS:
+                    regressions.append(f"{name} {key}: {old:.3f} -> {new:.3f} ms (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def run(args: argparse.Namespace) -> dict:
+    base_config = AgentConfig()
+    with tempfile.TemporaryDirectory(prefix="pipeline-bench-") as tmp:
+        root = Path(tmp)
+        # Caches live in the scratch directory so the repo's .cache is never touched.
+        config = replace(
+            base_config,
+            knowledge_artifact_path=root / "cache" / "knowledge.json",
+            retrieval_index_path=root / "cache" / "knowledge-chunks.json",
+            file_class_cache_path=root / "cache" / "file-classes.json",
+        )
+        started = time.perf_counter()
+        targets = build_corpus(root / "targets", args.targets, args.seed)
+        corpus_s = time.perf_counter() - started
+
+        setup: Dict[str, List[float]] = {}
+        knowledge_base: Optional[KnowledgeBase] = None
+        for _ in range(max(args.repeat, SETUP_REPEAT)):
+            _timed(setup, "load_knowledge_base", lambda: load_knowledge_base(config.repo_root, config.knowledge_index_path))
+            _timed(setup, "compile_knowledge", lambda: compile_knowledge(config))
+            config.knowledge_artifact_path.unlink(missing_ok=True)
+            _timed(setup, "load_knowledge (cold)", lambda: load_knowledge(config, log=_silent))
+            knowledge_base = _timed(setup, "load_knowledge (warm)", lambda: load_knowledge(config, log=_silent))
+        assert knowledge_base is not None
+
+        chunk_index = None
+        if config.reference_retrieval == "bm25":
+            chunk_index = _timed(setup, "open_chunk_index", lambda: open_chunk_index(config))
+
+        class_cache = FileClassCache(None)
+        stages: Dict[str, List[float]] = {}
+        pipeline: List[float] = []
+        for _ in range(args.repeat):
+            run_stages(config, knowledge_base, targets, class_cache, chunk_index, stages)
+        for _ in range(args.repeat):
+            run_pipeline(config, knowledge_base, targets, class_cache, chunk_index, pipeline)
+
+        # One untimed pass under tracemalloc, so tracing overhead never skews the timings.
+        tracemalloc.start()
+        run_pipeline(config, knowledge_base, targets, class_cache, chunk_index, [])
+        heap_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss_kb //= 1024
+    pipeline_stats = summarize(pipeline)
+    per_target_s = pipeline_stats["mean_ms"] / 1000
+    return {
+        "benchmark": "pipeline",
+        "python": platform.python_version(),
+        "targets": args.targets,
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "retrieval": config.reference_retrieval,
+        "corpus_build_s": round(corpus_s, 3),
+        "setup": {name: summarize(values) for name, values in setup.items()},
+        "stages": {name: summarize(stages[name]) for name in STAGES},
+        "pipeline": pipeline_stats,
+        "throughput_per_s": round(1 / per_target_s, 1) if per_target_s else None,
+        "inventory": args.inventory,
+        "projected_inventory_s": round(per_target_s * args.inventory, 1),
+        "memory": {
+            "peak_rss_mb": round(peak_rss_kb / 1024, 1),
+            "heap_peak_mb": round(heap_peak / (1024 * 1024), 2),
+        },
+    }
+
+
+def _print_table(result: dict) -> None:
+    print(f"Targets: {result['targets']} x {result['repeat']} repeats (corpus built in {result['corpus_build_s']} s)")
+    print(f"{'stage':<26} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9}")
+    for section in ("setup", "stages"):
+        for name, stats in result[section].items():
+            print(f"{name:<26} {stats['n']:>6} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} {stats['mean_ms']:>9.3f}")
+    stats = result["pipeline"]
+    print(f"{'pipeline (per target)':<26} {stats['n']:>6} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} {stats['mean_ms']:>9.3f}")
+    print(
+        f"Throughput: {result['throughput_per_s']} targets/s; "
+        f"{result['inventory']} targets in ~{result['projected_inventory_s']} s (LLM time excluded)"
+    )
+    memory = result["memory"]
+    print(f"Peak memory: {memory['peak_rss_mb']} MB RSS, {memory['heap_peak_mb']} MB Python heap during a pass")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the local migration pipeline end to end (LLM stubbed)")
+    parser.add_argument("--targets", type=int, default=60, help="Synthetic target repositories")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the corpus per measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--inventory", type=int, default=1500, help="Repository count to project total time for")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--save-baseline", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against a saved baseline; exit 1 on regressions")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed p50/p95 growth over the baseline (0.25 = 25%%)",
+    )
+    args = parser.parse_args()
+    if args.targets < 1 or args.repeat < 1:
+        raise SystemExit("--targets and --repeat must be at least 1.")
+
+    result = run(args)
+    regressions: List[str] = []
+    if args.baseline:
+        try:
+            baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        except (OSError, ValueError) as exc:
+            raise SystemExit(f"Cannot read baseline {args.baseline}: {exc}")
+        regressions = compare_baseline(result, baseline, args.tolerance)
+        result["baseline"] = {"path": args.baseline, "tolerance": args.tolerance, "regressions": regressions}
+
+    if args.save_baseline:
+        path = Path(args.save_baseline)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(result, indent=2) + "\n", encoding="utf-8")
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        _print_table(result)
+        if args.save_baseline:
+            print(f"Baseline saved: {args.save_baseline}")
+    for item in regressions:
+        print(f"REGRESSION: {item}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,138 @@
+"""Startup benchmark: how fast the CLI entry points answer.
+
+Runs each entry point in a fresh interpreter several times and compares the
+median wall time, minus the bare interpreter's, against a budget. A
+``-X importtime`` run of each command also checks that it does not import
+modules it never uses (the Agent SDK, rich, textual, yaml, asyncio), which
+catches regressions deterministically even on noisy machines.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 15 --json
+    python -m benchmarks.startup --budget-scale 2   # slower CI hosts
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+HEAVY = ("claude_agent_sdk", "rich", "textual", "yaml", "asyncio")
+
+
+@dataclass
+class Command:
+    name: str
+    args: List[str]
+    budget_ms: float
+    forbidden: Tuple[str, ...]
+
+
+# Budgets are milliseconds over a bare interpreter, with ~1.5x headroom over
+# what the lazy-import layout measures on a slow shared host; eager imports of
+# the SDK/asyncio/rich push each command well past them.
+COMMANDS = (
+    Command("agent --list-reference-groups", ["-m", "agent", "--list-reference-groups"], 150, HEAVY + ("dotenv", "agent.main")),
+    Command("agent --help", ["-m", "agent", "--help"], 160, HEAVY + ("dotenv", "agent.main")),
+    Command("import agent.main", ["-c", "import agent.main"], 250, HEAVY),
+    Command("import agent.launcher", ["-c", "import agent.launcher"], 100, HEAVY),
+)
+
+
+@dataclass
+class Result:
+    name: str
+    median_ms: float
+    overhead_ms: float
+    budget_ms: float
+    imported_heavy: List[str] = field(default_factory=list)
+    failures: List[str] = field(default_factory=list)
+
+
+def _wall_ms(args: Sequence[str], runs: int) -> float:
+    samples: List[float] = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def imported_modules(args: Sequence[str]) -> Dict[str, int]:
+    """Top-level package -> cumulative import microseconds, from ``-X importtime``."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=False,
+    )
+    modules: Dict[str, int] = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line.split("|")
+        try:
+            cumulative = int(parts[1])
+        except ValueError:
+            continue
+        name = parts[2].strip()
+        modules[name] = max(modules.get(name, 0), cumulative)
+    return modules
+
+
+def measure(command: Command, runs: int, interpreter_ms: float, budget_scale: float) -> Result:
+    median = _wall_ms(command.args, runs)
+    budget = command.budget_ms * budget_scale
+    result = Result(
+        name=command.name,
+        median_ms=round(median, 1),
+        overhead_ms=round(median - interpreter_ms, 1),
+        budget_ms=budget,
+    )
+    modules = imported_modules(command.args)
+    result.imported_heavy = sorted(
+        name for name in modules if any(name == item or name.startswith(item + ".") for item in command.forbidden)
+    )
+    if result.overhead_ms > budget:
+        result.failures.append(f"{result.overhead_ms:.0f} ms over the interpreter exceeds the {budget:.0f} ms budget")
+    heavy_roots = sorted({name.split(".")[0] if not name.startswith("agent.") else name for name in result.imported_heavy})
+    if heavy_roots:
+        result.failures.append("imports " + ", ".join(heavy_roots))
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup and check for eager heavy imports")
+    parser.add_argument("--runs", type=int, default=7, help="Fresh interpreters per command (median is used)")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="Multiply every time budget (slow hosts)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    interpreter_ms = _wall_ms(["-c", "pass"], args.runs)
+    results = [measure(command, args.runs, interpreter_ms, args.budget_scale) for command in COMMANDS]
+
+    if args.json:
+        print(
+            json.dumps(
+                {"interpreter_ms": round(interpreter_ms, 1), "results": [asdict(item) for item in results]},
+                indent=2,
+            )
+        )
+    else:
+        print(f"Interpreter startup: {interpreter_ms:.1f} ms (subtracted below)")
+        print(f"{'command':<32} {'median ms':>10} {'overhead':>9} {'budget':>7}  status")
+        for item in results:
+            status = "ok" if not item.failures else "FAIL: " + "; ".join(item.failures)
+            print(f"{item.name:<32} {item.median_ms:>10.1f} {item.overhead_ms:>9.1f} {item.budget_ms:>7.0f}  {status}")
+
+    return 1 if any(item.failures for item in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,31 @@
+from agent.dockerfile import parse_dockerfile
+
+
+def test_here_string_is_not_a_heredoc():
+    ast = parse_dockerfile("FROM alpine\nRUN cat <<<word > /x\nRUN apk add php\nCOPY a /b\n")
+
+    assert [item.text for item in ast.instructions] == [
+        "FROM alpine",
+        "RUN cat <<<word > /x",
+        "RUN apk add php",
+        "COPY a /b",
+    ]
+    assert ast.instructions[1].heredocs == []
+    assert [sources for _, sources in ast.copy_sources()] == [["a"]]
+
+
+def test_heredocs_still_parsed():
+    ast = parse_dockerfile('FROM alpine\nRUN cat <<EOF > /x\nhello\nEOF\nRUN <<-"END" sh\n\techo hi\n\tEND\nCOPY a /b\n')
+
+    assert [doc.name for item in ast.instructions for doc in item.heredocs] == ["EOF", "END"]
+    assert ast.instructions[-1].text == "COPY a /b"
+
+
+def test_child_stage_inherits_env_but_not_arg():
+    ast = parse_dockerfile(
+        "FROM alpine AS base\nARG CORE=core\nENV CONF=conf\n"
+        "FROM base AS child\nCOPY $CORE/$CONF /x\nARG CORE\nCOPY $CORE /y\n"
+    )
+
+    assert [item.arguments for item in ast.by_keyword("COPY")] == [["$CORE/conf", "/x"], ["$CORE", "/y"]]
+    assert ast.stages[1].env == {"CONF": "conf"}
@@ -0,0 +1,12 @@
+from agent.globbing import expand_patterns
+
+
+def test_recursive_glob_survives_symlink_loop(tmp_path):
+    (tmp_path / "ctx/conf").mkdir(parents=True)
+    (tmp_path / "ctx/conf/app.ini").write_text("x", encoding="utf-8")
+    (tmp_path / "ctx/conf/loop").symlink_to(tmp_path / "ctx", target_is_directory=True)
+
+    matches = expand_patterns(tmp_path, ["ctx/**/*.ini", "ctx/*/*.ini"])
+
+    assert matches["ctx/**/*.ini"] == [tmp_path / "ctx/conf/app.ini"]
+    assert matches["ctx/*/*.ini"] == [tmp_path / "ctx/conf/app.ini"]
@@ -0,0 +1,56 @@
+import pytest
+
+from agent.context.reference_loader import ReferenceLoader
+
+
+def _write(path, chars, seed):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    line = f"# {seed} " + "x" * 40 + "\n"
+    path.write_text((line * (chars // len(line) + 1))[:chars], encoding="utf-8")
+
+
+@pytest.fixture
+def knowledge(tmp_path):
+    _write(tmp_path / "global/rules.md", 500, "rules")
+    _write(tmp_path / "stack/Dockerfile", 4000, "dockerfile")
+    _write(tmp_path / "stack/entrypoint.sh", 800, "entrypoint")
+    for index in range(20):
+        _write(tmp_path / f"stack/scripts/s{index:02}.sh", 300, f"script {index}")
+    _write(tmp_path / "stack/zconf/php.ini", 1500, "php")
+    return tmp_path
+
+
+def _loader(root, packing, counterparts=()):
+    return ReferenceLoader(
+        repo_root=root,
+        globs=[],
+        max_total_chars=10_000,
+        max_chars_per_file=5_000,
+        groups=[("global", ["global/*"]), ("stack", ["stack/**/*"])],
+        priorities={"global": 100, "stack": 50},
+        counterparts=counterparts,
+        packing=packing,
+        compaction=False,
+    )
+
+
+def test_many_small_files_do_not_push_out_the_stack_dockerfile(knowledge):
+    bundle = _loader(knowledge, "priority").load()
+
+    loaded = {entry.path.as_posix() for entry in bundle.entries}
+    assert {"global/rules.md", "stack/Dockerfile", "stack/entrypoint.sh"} <= loaded
+    assert bundle.total_chars <= 8_000
+    assert "stack/Dockerfile" not in {item.path.as_posix() for item in bundle.dropped}
+
+
+@pytest.mark.parametrize("packing", ["priority", "sorted"])
+def test_counterpart_loaded_per_run_is_not_reported_dropped(knowledge, packing):
+    without = _loader(knowledge, packing).load()
+    assert "stack/zconf/php.ini" in {item.path.as_posix() for item in without.dropped}
+
+    bundle = _loader(knowledge, packing, counterparts=["php.ini"]).load()
+
+    extras = [entry for entry in bundle.entries if entry.per_run]
+    assert [entry.path.as_posix() for entry in extras] == ["stack/zconf/php.ini"]
+    assert "stack/zconf/php.ini" not in {item.path.as_posix() for item in bundle.dropped}
+    assert bundle.skipped_files == without.skipped_files - 1
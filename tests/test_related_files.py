@@ -0,0 +1,32 @@
+import gzip
+
+from agent.related_files import discover_related_files
+
+
+def test_source_outside_build_context_is_skipped(tmp_path):
+    (tmp_path / "shared.conf").write_text("x\n", encoding="utf-8")
+    context = tmp_path / "app"
+    (context / "conf").mkdir(parents=True)
+    (context / "conf/app.conf").write_text("y\n", encoding="utf-8")
+    dockerfile = context / "Dockerfile"
+    text = "FROM alpine\nCOPY ../shared.conf /etc/\nCOPY conf/../conf /etc/conf\n"
+    dockerfile.write_text(text, encoding="utf-8")
+
+    result = discover_related_files(dockerfile, text)
+
+    assert [item.path for item in result.files] == [context / "conf/app.conf"]
+    assert any(line.startswith("Outside the build context") for line in result.skipped)
+
+
+def test_suffixless_binary_is_not_charged_to_the_byte_budget(tmp_path):
+    (tmp_path / "bin").mkdir()
+    (tmp_path / "bin/a.conf").write_text("a" * 900 + "\n", encoding="utf-8")
+    (tmp_path / "bin/tool").write_bytes(gzip.compress(bytes(range(256)) * 40))
+    dockerfile = tmp_path / "Dockerfile"
+    text = "FROM alpine\nCOPY bin /usr/local/bin\n"
+    dockerfile.write_text(text, encoding="utf-8")
+
+    result = discover_related_files(dockerfile, text, max_dir_bytes=1_000)
+
+    assert result.binary_files == [tmp_path / "bin/tool"]
+    assert not any("byte budget" in line for line in result.skipped)